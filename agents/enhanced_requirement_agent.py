@@ -1,8 +1,14 @@
-from services.llm_service import llm_service
+from services.llm_service import RateLimitError, llm_service
 from services.knowledge_base import knowledge_base_service
+from services.prompt_budget import ClarificationPromptBuilder, ConversationSummary, changed_headings, merge_sections
+from services.async_runtime import run_sync
+from services.telemetry import telemetry, traced
+from config import Config
+from collections import OrderedDict
 import asyncio
 import logging
-from typing import Dict, List, Any
+import time
+from typing import Callable, Dict, List, Any, Optional, Tuple
 
 class EnhancedRequirementAgent:
     """Enhanced requirement analysis agent integrated with knowledge base"""
@@ -19,21 +25,100 @@ Please follow these principles:
 6. Suggest best practices and potential risks
 
 Format your responses clearly using Markdown, and always explain your reasoning for suggested improvements."""
+        
+        # In-flight and recent knowledge base lookups keyed by query text, so the
+        # enhancement, smart questions and improvement suggestions share one query
+        self._kb_lookups: "OrderedDict[str, Tuple[float, asyncio.Future]]" = OrderedDict()
+        self._kb_lookup_limit = 32
+        
+        # Keeps clarification prompts within the input token budget as the document grows
+        self.prompt_builder = ClarificationPromptBuilder()
+
+    def _lookup_knowledge_base(self, requirement_text: str) -> "asyncio.Future":
+        """Start a knowledge base query, or join a recent one for the same text"""
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        
+        entry = self._kb_lookups.get(requirement_text)
+        if entry is not None:
+            started_at, lookup = entry
+            # Failed lookups (including "not ready yet") are retried rather than reused
+            failed = lookup.done() and (
+                lookup.cancelled() or lookup.exception() is not None or not lookup.result().get("success")
+            )
+            fresh = now - started_at < Config.KB_RESULT_REUSE_SECONDS
+            if fresh and not failed and lookup.get_loop() is loop:
+                self._kb_lookups.move_to_end(requirement_text)
+                return lookup
+        
+        lookup = asyncio.ensure_future(knowledge_base_service.query_knowledge_base(requirement_text))
+        self._kb_lookups[requirement_text] = (now, lookup)
+        while len(self._kb_lookups) > self._kb_lookup_limit:
+            self._kb_lookups.popitem(last=False)
+        return lookup
+    
+    async def _await_kb_result(self, lookup: "asyncio.Future", timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Wait for a knowledge base lookup; None if it is still running after timeout"""
+        try:
+            # shield() keeps the shared lookup alive when we stop waiting for it
+            return await asyncio.wait_for(asyncio.shield(lookup), timeout)
+        except asyncio.TimeoutError:
+            return None
+        except Exception as e:
+            logging.warning(f"Knowledge base lookup failed: {e}")
+            return {"success": False, "error": str(e), "suggestions": [], "questions": []}
+    
+    def _run_heuristics(self, requirement_text: str) -> Dict[str, Any]:
+        """Run the local requirement scorers"""
+        with telemetry.span("agent.heuristics"):
+            return {
+                "completeness_score": self._assess_completeness(requirement_text),
+                "missing_elements": self._identify_missing_elements(requirement_text),
+                "best_practices": self._get_relevant_best_practices(requirement_text),
+                "potential_risks": self._identify_potential_risks(requirement_text)
+            }
+    
+    def _build_improvements(self, heuristics: Dict[str, Any], kb_result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Combine heuristic scores with knowledge base suggestions"""
+        return {
+            "completeness_score": heuristics["completeness_score"],
+            "missing_elements": heuristics["missing_elements"],
+            "suggestions": (kb_result or {}).get("suggestions", []),
+            "best_practices": heuristics["best_practices"],
+            "potential_risks": heuristics["potential_risks"]
+        }
 
-    async def enhance_requirement_with_kb(self, user_input: str, model: str = None) -> Dict[str, Any]:
-        """Enhance requirement analysis using knowledge base"""
+    @traced("agent.enhance")
+    async def enhance_requirement_with_kb(self, user_input: str, model: str = None,
+                                          on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Enhance requirement analysis using knowledge base
+        
+        Pass on_token to receive the enhanced requirement as it is streamed.
+        """
         try:
-            # 1. First query knowledge base for relevant suggestions
-            kb_result = await knowledge_base_service.query_knowledge_base(user_input)
+            # 1. Start the knowledge base lookup; the heuristic scorers are cheap
+            # enough to run inline while it is in flight
+            kb_lookup = self._lookup_knowledge_base(user_input)
+            heuristics = self._run_heuristics(user_input)
             
-            # 2. Build enhanced prompt including knowledge base suggestions
-            prompt = self._build_enhanced_prompt(user_input, kb_result)
+            # 2. Wait for knowledge base context only up to the deadline. If it is
+            # late, start the LLM call without it rather than serializing behind it
+            kb_result = await self._await_kb_result(kb_lookup, Config.KB_CONTEXT_DEADLINE_SECONDS)
+            kb_context_in_prompt = kb_result is not None
+            with telemetry.span("agent.prompt_build"):
+                prompt = self._build_enhanced_prompt(user_input, kb_result or {})
             
             # 3. Use LLM to generate enhanced requirements
             enhanced_requirement = await llm_service.generate_completion(
-                prompt, model, self.system_prompt
+                prompt, model, self.system_prompt, on_token=on_token
             )
             
+            # 4. A late lookup has had the whole LLM call to finish; its suggestions
+            # and questions still go to the UI
+            if kb_result is None:
+                kb_result = await self._await_kb_result(kb_lookup, Config.KB_CONTEXT_DEADLINE_SECONDS)
+            kb_result = kb_result or {}
+            
             return {
                 "success": True,
                 "original_requirement": user_input,
@@ -41,13 +126,27 @@ Format your responses clearly using Markdown, and always explain your reasoning
                 "kb_suggestions": kb_result.get("suggestions", []),
                 "clarification_questions": kb_result.get("questions", []),
                 "knowledge_base_used": kb_result.get("success", False),
-                "timestamp": "2024-01-01 12:00:00"
+                "kb_context_in_prompt": kb_context_in_prompt,
+                "improvements": self._build_improvements(heuristics, kb_result)
             }
             
+        except RateLimitError as e:
+            # The basic mode would hit the same provider limit
+            logging.warning(f"Enhanced requirement analysis rate limited: {e}")
+            return self._rate_limited_result(e)
         except Exception as e:
             logging.error(f"Enhanced requirement analysis failed: {e}")
             # Fall back to basic mode
-            return await self._fallback_enhance_requirement(user_input, model)
+            return await self._fallback_enhance_requirement(user_input, model, on_token)
+    
+    def _rate_limited_result(self, error: RateLimitError) -> Dict[str, Any]:
+        """Failure result that tells callers when to retry"""
+        return {
+            "success": False,
+            "error": str(error),
+            "rate_limited": True,
+            "retry_after": error.retry_after
+        }
     
     def _build_enhanced_prompt(self, user_input: str, kb_result: Dict[str, Any]) -> str:
         """Build enhanced prompt including knowledge base information"""
@@ -79,7 +178,8 @@ Make your response detailed, structured, and actionable."""
         
         return base_prompt
     
-    async def _fallback_enhance_requirement(self, user_input: str, model: str = None) -> Dict[str, Any]:
+    async def _fallback_enhance_requirement(self, user_input: str, model: str = None,
+                                            on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Fallback basic requirement enhancement method"""
         prompt = f"""User's original requirement:
 "{user_input}"
@@ -88,7 +188,7 @@ Please help me analyze and enhance this requirement, providing a more detailed a
 
         try:
             enhanced_requirement = await llm_service.generate_completion(
-                prompt, model, self.system_prompt
+                prompt, model, self.system_prompt, on_token=on_token
             )
             
             return {
@@ -97,14 +197,14 @@ Please help me analyze and enhance this requirement, providing a more detailed a
                 "enhanced_requirement": enhanced_requirement,
                 "kb_suggestions": [],
                 "clarification_questions": self._generate_basic_questions(user_input),
-                "knowledge_base_used": False,
-                "timestamp": "2024-01-01 12:00:00"
+                "knowledge_base_used": False
             }
+        except RateLimitError as e:
+            return self._rate_limited_result(e)
         except Exception as e:
             return {
                 "success": False,
-                "error": str(e),
-                "timestamp": "2024-01-01 12:00:00"
+                "error": str(e)
             }
     
     def _generate_basic_questions(self, requirement_text: str) -> List[str]:
@@ -117,59 +217,70 @@ Please help me analyze and enhance this requirement, providing a more detailed a
             "What are the project time and budget constraints?"
         ]
     
-    async def clarify_requirement_with_kb(self, requirement: str, user_question: str, model: str = None) -> Dict[str, Any]:
-        """Clarify requirements using knowledge base"""
+    @traced("agent.clarify")
+    async def clarify_requirement_with_kb(self, requirement: str, user_question: str, model: str = None,
+                                          on_token: Optional[Callable[[str], None]] = None,
+                                          conversation: Optional[ConversationSummary] = None) -> Dict[str, Any]:
+        """Clarify requirements using knowledge base
+        
+        Pass on_token to receive the clarified requirement as it is streamed.
+        The prompt is kept within the input token budget; when the document
+        does not fit, only its sections relevant to the question are sent and
+        the changed sections (which is what gets streamed) are merged back.
+        Pass the conversation summary to carry earlier turns; it is updated.
+        """
         try:
+            provider = model or Config.DEFAULT_MODEL
+            
             # Query knowledge base for relevant context
-            context_query = f"{requirement}\n\nUser question: {user_question}"
-            kb_result = await knowledge_base_service.query_knowledge_base(context_query)
+            context_query = self.prompt_builder.context_query(requirement, user_question, provider=provider)
+            kb_result = await self._await_kb_result(self._lookup_knowledge_base(context_query))
             
             # Build clarification prompt
-            prompt = f"""Current requirement document:
-"{requirement}"
-
-User question or additional information:
-"{user_question}"
-
-"""
+            with telemetry.span("agent.prompt_build") as span:
+                plan = self.prompt_builder.build(
+                    requirement, user_question, kb_result.get("suggestions", []) if kb_result.get("success") else [],
+                    conversation, provider, self.system_prompt
+                )
+                span.set(tokens=plan.tokens, partial=plan.partial)
             
-            if kb_result.get("success") and kb_result.get("suggestions"):
-                prompt += f"""Relevant knowledge base insights:
-{chr(10).join(f"- {suggestion}" for suggestion in kb_result["suggestions"])}
-
-"""
-            
-            prompt += """Please update and refine the requirement document based on the user's input and knowledge base insights. Ensure the new requirement is clearer, more complete, and follows best practices."""
-            
-            clarified_requirement = await llm_service.generate_completion(
-                prompt, model, self.system_prompt
+            reply = await llm_service.generate_completion(
+                plan.prompt, model, self.system_prompt, on_token=on_token
             )
             
+            if plan.partial:
+                clarified_requirement = merge_sections(requirement, reply, user_question, plan.truncated)
+                changed = changed_headings(reply)
+            else:
+                clarified_requirement = reply
+                changed = []
+            if conversation is not None:
+                conversation.add_turn(user_question, changed)
+            
             return {
                 "success": True,
                 "clarified_requirement": clarified_requirement,
                 "additional_suggestions": kb_result.get("suggestions", []),
                 "knowledge_base_used": kb_result.get("success", False),
-                "timestamp": "2024-01-01 12:00:00"
+                "prompt_tokens": plan.tokens,
+                "prompt_sections": {"sent": plan.sections_sent, "total": plan.sections_total},
+                "conversation": conversation.to_dict() if conversation is not None else None
             }
             
+        except RateLimitError as e:
+            logging.warning(f"Requirement clarification rate limited: {e}")
+            return self._rate_limited_result(e)
         except Exception as e:
             logging.error(f"Requirement clarification failed: {e}")
             return {
                 "success": False,
-                "error": str(e),
-                "timestamp": "2024-01-01 12:00:00"
+                "error": str(e)
             }
     
     def get_smart_questions(self, requirement_text: str) -> List[str]:
         """Generate smart questions based on knowledge base"""
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            kb_result = loop.run_until_complete(
-                knowledge_base_service.query_knowledge_base(requirement_text)
-            )
+            kb_result = run_sync(self._get_kb_result(requirement_text))
             
             if kb_result.get("success"):
                 return kb_result.get("questions", [])
@@ -179,21 +290,25 @@ User question or additional information:
         except Exception as e:
             logging.error(f"Failed to get smart questions: {e}")
             return self._generate_basic_questions(requirement_text)
-        finally:
-            loop.close()
     
-    async def suggest_requirement_improvements(self, requirement_text: str) -> Dict[str, Any]:
-        """Suggest requirement improvements"""
+    async def _get_kb_result(self, requirement_text: str) -> Dict[str, Any]:
+        """Get the (possibly shared) knowledge base result for the text"""
+        return await self._await_kb_result(self._lookup_knowledge_base(requirement_text))
+    
+    @traced("agent.improvements")
+    async def suggest_requirement_improvements(self, requirement_text: str,
+                                               kb_result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Suggest requirement improvements
+        
+        Pass kb_result to reuse a knowledge base result the caller already has,
+        such as the one from enhance_requirement_with_kb; only the heuristic
+        scorers then run on the text.
+        """
         try:
-            kb_result = await knowledge_base_service.query_knowledge_base(requirement_text)
+            if kb_result is None:
+                kb_result = await self._get_kb_result(requirement_text)
             
-            improvements = {
-                "completeness_score": self._assess_completeness(requirement_text),
-                "missing_elements": self._identify_missing_elements(requirement_text),
-                "suggestions": kb_result.get("suggestions", []),
-                "best_practices": self._get_relevant_best_practices(requirement_text),
-                "potential_risks": self._identify_potential_risks(requirement_text)
-            }
+            improvements = self._build_improvements(self._run_heuristics(requirement_text), kb_result)
             
             return {
                 "success": True,
@@ -1,5 +1,6 @@
 from services.llm_service import llm_service
-import asyncio
+from services.async_runtime import run_sync
+from services.telemetry import traced
 
 class RequirementAgent:
     def __init__(self):
@@ -22,6 +23,7 @@ Format requirements:
 
 Please respond in English and use Markdown format for better presentation."""
 
+    @traced("agent.basic_enhance")
     def enhance_requirement(self, user_input: str, model: str = None):
         """Enhance user requirements"""
         prompt = f"""User's original requirement:
@@ -30,29 +32,23 @@ Please respond in English and use Markdown format for better presentation."""
 Please help me analyze and enhance this requirement, providing a more detailed and complete requirement description. If key information is missing, please point out what needs further clarification."""
 
         try:
-            # Using synchronous approach for Streamlit environment
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            enhanced_requirement = loop.run_until_complete(
+            # Run on the shared event loop so pooled connections stay warm
+            enhanced_requirement = run_sync(
                 llm_service.generate_completion(prompt, model, self.system_prompt)
             )
             
             return {
                 "success": True,
                 "original_requirement": user_input,
-                "enhanced_requirement": enhanced_requirement,
-                "timestamp": "2024-01-01 12:00:00"
+                "enhanced_requirement": enhanced_requirement
             }
         except Exception as e:
             return {
                 "success": False,
-                "error": str(e),
-                "timestamp": "2024-01-01 12:00:00"
+                "error": str(e)
             }
-        finally:
-            loop.close()
 
+    @traced("agent.basic_clarify")
     def clarify_requirement(self, requirement: str, user_question: str, model: str = None):
         """Clarify requirements"""
         prompt = f"""Current requirement:
@@ -64,26 +60,19 @@ User question or additional information:
 Please update and refine the requirement document based on the user's question or additional information. Ensure the new requirement is clearer and more complete."""
 
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            clarified_requirement = loop.run_until_complete(
+            clarified_requirement = run_sync(
                 llm_service.generate_completion(prompt, model, self.system_prompt)
             )
             
             return {
                 "success": True,
-                "clarified_requirement": clarified_requirement,
-                "timestamp": "2024-01-01 12:00:00"
+                "clarified_requirement": clarified_requirement
             }
         except Exception as e:
             return {
                 "success": False,
-                "error": str(e),
-                "timestamp": "2024-01-01 12:00:00"
+                "error": str(e)
             }
-        finally:
-            loop.close()
 
 # Create global requirement agent instance
 requirement_agent = RequirementAgent() 
\ No newline at end of file
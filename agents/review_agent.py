@@ -1,7 +1,9 @@
-from services.llm_service import llm_service
-import asyncio
+from services.llm_service import RateLimitError, llm_service
+from services.async_runtime import run_sync, run_sync_streaming
+from services.telemetry import telemetry, timestamp, traced
 import json
 import re
+from typing import Callable, Optional
 
 class ReviewAgent:
     def __init__(self):
@@ -52,57 +54,89 @@ Output format requirements:
 
 Please conduct the review and provide feedback in English. Ensure the returned JSON format is correct."""
 
-    def review_requirement(self, requirement: str, model: str = None):
-        """Review requirement document"""
-        prompt = f"""Please review the following requirement document:
-
-"{requirement}"
+    def review_requirement(self, requirement: str, model: str = None,
+                           on_token: Optional[Callable[[str], None]] = None,
+                           use_cache: bool = True):
+        """Review requirement document
+        
+        Pass on_token to receive the raw review output as it is streamed, and
+        use_cache=False to force a fresh review instead of a cached one.
+        Tokens are delivered on the calling thread.
+        """
+        try:
+            if on_token is None:
+                return run_sync(self.review_requirement_async(requirement, model, use_cache=use_cache))
+            
+            return run_sync_streaming(
+                lambda emit: self.review_requirement_async(requirement, model, emit, use_cache),
+                on_token
+            )
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e),
+                "timestamp": timestamp()
+            }
 
-Based on software engineering best practices, identify issues and improvement points. Pay special attention to:
-- Whether requirements are clear and specific
-- Whether key information is missing
-- Whether there are ambiguities or contradictions
-- Whether non-functional requirements are sufficient
-- Whether user experience is considered
-
-Please return the review results in JSON format."""
+    @traced("agent.review")
+    async def review_requirement_async(self, requirement: str, model: str = None,
+                                       on_token: Optional[Callable[[str], None]] = None,
+                                       use_cache: bool = True):
+        """Review requirement document (async version for callers already on an event loop)"""
+        with telemetry.span("agent.prompt_build"):
+            prompt = self._build_review_prompt(requirement)
 
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            review_result = loop.run_until_complete(
-                llm_service.generate_completion(prompt, model, self.system_prompt)
+            review_result = await llm_service.generate_completion(
+                prompt, model, self.system_prompt, on_token=on_token, use_cache=use_cache
             )
             
-            # Try to parse JSON result
-            try:
-                parsed_result = json.loads(review_result)
-            except json.JSONDecodeError:
-                # If parsing fails, try to extract JSON part
-                json_match = re.search(r'\{.*\}', review_result, re.DOTALL)
-                if json_match:
-                    try:
-                        parsed_result = json.loads(json_match.group())
-                    except:
-                        parsed_result = self._create_fallback_result(review_result)
-                else:
-                    parsed_result = self._create_fallback_result(review_result)
+            with telemetry.span("agent.json_parse"):
+                review = self._parse_review(review_result)
             
             return {
                 "success": True,
                 "requirement": requirement,
-                "review": parsed_result,
-                "timestamp": "2024-01-01 12:00:00"
+                "review": review
             }
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e),
-                "timestamp": "2024-01-01 12:00:00"
+                "rate_limited": isinstance(e, RateLimitError),
+                "retry_after": getattr(e, "retry_after", None)
             }
-        finally:
-            loop.close()
+    
+    def _build_review_prompt(self, requirement: str) -> str:
+        return f"""Please review the following requirement document:
+
+"{requirement}"
+
+Based on software engineering best practices, identify issues and improvement points. Pay special attention to:
+- Whether requirements are clear and specific
+- Whether key information is missing
+- Whether there are ambiguities or contradictions
+- Whether non-functional requirements are sufficient
+- Whether user experience is considered
+
+Please return the review results in JSON format."""
+    
+    def _parse_review(self, review_result: str):
+        """Parse the model's review JSON, falling back to a text-only result"""
+        # Try to parse JSON result
+        try:
+            return json.loads(review_result)
+        except json.JSONDecodeError:
+            pass
+        
+        # If parsing fails, try to extract JSON part
+        json_match = re.search(r'\{.*\}', review_result, re.DOTALL)
+        if json_match:
+            try:
+                return json.loads(json_match.group())
+            except:
+                pass
+        return self._create_fallback_result(review_result)
 
     def _create_fallback_result(self, review_text):
         """Create fallback review result structure"""
@@ -145,7 +179,7 @@ Please return the review results in JSON format."""
         return {
             "success": True,
             "knowledge_base": self.knowledge_base,
-            "timestamp": "2024-01-01 12:00:00"
+            "timestamp": timestamp()
         }
 
 # Create global review agent instance
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, Dict
+
+from fastapi import HTTPException
+
+class ConcurrencyLimiter:
+    """Bounds how many requests of one kind are served at once
+
+    Requests over the limit queue for a slot; if none frees up within
+    queue_timeout they are rejected with 503 and a Retry-After header rather
+    than piling up behind slow LLM calls. Streaming responses hold their slot
+    until the stream ends, so acquire() and release() are separate calls.
+    """
+
+    def __init__(self, name: str, limit: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.stats = {"served": 0, "rejected": 0}
+
+    async def acquire(self):
+        """Wait for a slot or raise 503"""
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail=f"Too many concurrent {self.name} requests, retry later",
+                headers={"Retry-After": str(max(1, int(self.queue_timeout)))}
+            )
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self.stats["served"] += 1
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "limit": self.limit, "active": self.active, "waiting": self.waiting}
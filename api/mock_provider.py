@@ -0,0 +1,256 @@
+"""
+Local stand-in for the OpenAI and Anthropic APIs, for load and latency testing
+
+Serves POST /v1/chat/completions (OpenAI) and POST /v1/messages (Anthropic),
+streaming included, with configurable time-to-first-token distribution,
+token rate, error rate and 429 injection. Start it with `python run.py mock`
+and point LLMService at it:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8100
+    OPENAI_API_KEY=mock
+    ANTHROPIC_API_KEY=mock
+
+Behaviour can also be changed at runtime with POST /mock/config.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from config import Config
+
+_WORDS = (
+    "system user requirement data access report performance security interface module "
+    "response time availability audit workflow notification integration account role "
+    "permission validation error recovery scalability latency throughput dashboard"
+).split()
+
+@dataclass
+class MockProviderSettings:
+    """How the mock provider behaves; every field can be changed at runtime"""
+    latency_median_ms: float = Config.MOCK_LLM_LATENCY_MEDIAN_MS
+    # Spread of the log-normal time-to-first-token distribution (0 = fixed latency)
+    latency_sigma: float = Config.MOCK_LLM_LATENCY_SIGMA
+    tokens_per_second: float = Config.MOCK_LLM_TOKENS_PER_SECOND
+    response_tokens: int = Config.MOCK_LLM_RESPONSE_TOKENS
+    error_rate: float = Config.MOCK_LLM_ERROR_RATE
+    rate_limit_rate: float = Config.MOCK_LLM_RATE_LIMIT_RATE
+    retry_after_seconds: float = 1.0
+    seed: Optional[int] = Config.MOCK_LLM_SEED
+
+class MockProvider:
+    """Synthesizes completions and their timing"""
+
+    def __init__(self, settings: MockProviderSettings = None):
+        self.settings = settings or MockProviderSettings()
+        self._random = random.Random(self.settings.seed)
+        self.stats = {"requests": 0, "streams": 0, "errors_injected": 0, "rate_limits_injected": 0, "tokens_out": 0}
+
+    def update(self, changes: Dict[str, Any]) -> MockProviderSettings:
+        for key, value in changes.items():
+            if hasattr(self.settings, key):
+                setattr(self.settings, key, value)
+        if "seed" in changes:
+            self._random = random.Random(self.settings.seed)
+        return self.settings
+
+    def injected_failure(self) -> Optional[JSONResponse]:
+        """A 429 or 500 response, drawn at the configured rates"""
+        draw = self._random.random()
+        if draw < self.settings.rate_limit_rate:
+            self.stats["rate_limits_injected"] += 1
+            return JSONResponse(
+                {"error": {"type": "rate_limit_error", "message": "Mock rate limit exceeded"}},
+                status_code=429,
+                headers={"retry-after": str(self.settings.retry_after_seconds)}
+            )
+        if draw < self.settings.rate_limit_rate + self.settings.error_rate:
+            self.stats["errors_injected"] += 1
+            return JSONResponse(
+                {"error": {"type": "api_error", "message": "Mock internal server error"}},
+                status_code=500
+            )
+        return None
+
+    def first_token_delay(self) -> float:
+        median = self.settings.latency_median_ms / 1000.0
+        if self.settings.latency_sigma <= 0:
+            return median
+        return self._random.lognormvariate(0.0, self.settings.latency_sigma) * median
+
+    def token_delay(self) -> float:
+        return 1.0 / self.settings.tokens_per_second if self.settings.tokens_per_second > 0 else 0.0
+
+    def completion_tokens(self, system_prompt: str, prompt: str, max_tokens: Optional[int]) -> List[str]:
+        """Deterministic response text for a prompt, split into token-sized pieces
+
+        Review requests get valid review JSON so downstream parsing is exercised.
+        """
+        limit = min(self.settings.response_tokens, max_tokens or self.settings.response_tokens)
+        digest = hashlib.sha256((system_prompt + prompt).encode('utf-8')).digest()
+        words = [_WORDS[(digest[i % len(digest)] + i) % len(_WORDS)] for i in range(max(limit, 1))]
+
+        if "json" in (system_prompt + prompt).lower() and "review" in (system_prompt + prompt).lower():
+            text = json.dumps({
+                "issues": [{
+                    "type": ("error", "warning", "suggestion")[i % 3],
+                    "text": f"Requirement {words[i % len(words)]} is not specific enough",
+                    "location": f"Section {i + 1}",
+                    "suggestion": f"Specify measurable {words[(i + 1) % len(words)]} criteria"
+                } for i in range(3)],
+                "summary": " ".join(words[:max(limit - 60, 10)]),
+                "score": 1 + digest[0] % 10
+            }, indent=2)
+            return [piece for piece in text.replace("\n", " \n").split(" ") if piece] or [text]
+
+        lines = []
+        for start in range(0, len(words), 12):
+            lines.append(("- " if start else "## ") + " ".join(words[start:start + 12]))
+        return " \n".join(lines).split(" ")
+
+    async def produce(self, tokens: List[str]) -> AsyncIterator[str]:
+        """Yield tokens at the configured pace, after the first-token delay"""
+        await asyncio.sleep(self.first_token_delay())
+        delay = self.token_delay()
+        for index, token in enumerate(tokens):
+            if index and delay:
+                await asyncio.sleep(delay)
+            self.stats["tokens_out"] += 1
+            yield token if index == 0 else " " + token
+
+mock_provider = MockProvider()
+
+app = FastAPI(title="Mock LLM Provider")
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def _message_text(content: Any) -> str:
+    """Text of a message whose content is a string or a list of content blocks"""
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content or [] if isinstance(block, dict))
+
+@app.post("/v1/chat/completions")
+async def openai_chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    system_prompt = "".join(_message_text(m.get("content")) for m in messages if m.get("role") == "system")
+    prompt = "".join(_message_text(m.get("content")) for m in messages if m.get("role") != "system")
+    model = body.get("model", "mock-gpt")
+    mock_provider.stats["requests"] += 1
+
+    failure = mock_provider.injected_failure()
+    if failure is not None:
+        return failure
+
+    tokens = mock_provider.completion_tokens(system_prompt, prompt, body.get("max_tokens"))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    prompt_tokens = _estimate_tokens(system_prompt + prompt)
+
+    if body.get("stream"):
+        mock_provider.stats["streams"] += 1
+
+        async def stream():
+            def chunk(delta, finish_reason=None):
+                return _sse({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                })
+
+            yield chunk({"role": "assistant", "content": ""})
+            async for piece in mock_provider.produce(tokens):
+                yield chunk({"content": piece})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    text = "".join([piece async for piece in mock_provider.produce(tokens)])
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)
+        }
+    }
+
+@app.post("/v1/messages")
+async def anthropic_messages(request: Request):
+    body = await request.json()
+    system_prompt = _message_text(body.get("system", ""))
+    prompt = "".join(_message_text(m.get("content")) for m in body.get("messages", []))
+    model = body.get("model", "mock-claude")
+    mock_provider.stats["requests"] += 1
+
+    failure = mock_provider.injected_failure()
+    if failure is not None:
+        return failure
+
+    tokens = mock_provider.completion_tokens(system_prompt, prompt, body.get("max_tokens"))
+    message_id = f"msg_{uuid.uuid4().hex[:24]}"
+    input_tokens = _estimate_tokens(system_prompt + prompt)
+
+    if body.get("stream"):
+        mock_provider.stats["streams"] += 1
+
+        async def stream():
+            yield _sse({"type": "message_start", "message": {
+                "id": message_id, "type": "message", "role": "assistant", "content": [], "model": model,
+                "stop_reason": None, "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": 0}
+            }}, "message_start")
+            yield _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+                       "content_block_start")
+            async for piece in mock_provider.produce(tokens):
+                yield _sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}},
+                           "content_block_delta")
+            yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            yield _sse({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                        "usage": {"output_tokens": len(tokens)}}, "message_delta")
+            yield _sse({"type": "message_stop"}, "message_stop")
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    text = "".join([piece async for piece in mock_provider.produce(tokens)])
+    return {
+        "id": message_id,
+        "type": "message",
+        "role": "assistant",
+        "content": [{"type": "text", "text": text}],
+        "model": model,
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": len(tokens)}
+    }
+
+@app.get("/mock/config")
+async def get_mock_config():
+    return asdict(mock_provider.settings)
+
+@app.post("/mock/config")
+async def update_mock_config(changes: Dict[str, Any]):
+    return asdict(mock_provider.update(changes))
+
+@app.get("/mock/stats")
+async def get_mock_stats():
+    return mock_provider.stats
@@ -0,0 +1,33 @@
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+QueryMode = Literal["naive", "local", "global", "hybrid"]
+
+class EnhanceRequest(BaseModel):
+    requirement: str = Field(..., min_length=1)
+    model: Optional[str] = None
+    stream: bool = False
+
+class ClarifyRequest(BaseModel):
+    requirement: str = Field(..., min_length=1)
+    question: str = Field(..., min_length=1)
+    model: Optional[str] = None
+    stream: bool = False
+    # Summary of earlier turns, as returned in the previous clarify response
+    conversation: Optional[Dict[str, Any]] = None
+
+class ReviewRequest(BaseModel):
+    requirement: str = Field(..., min_length=1)
+    model: Optional[str] = None
+    stream: bool = False
+    use_cache: bool = True
+
+class ImprovementsRequest(BaseModel):
+    requirement: str = Field(..., min_length=1)
+    # "kb_suggestions" from an earlier enhance response; skips a second knowledge base query
+    kb_suggestions: Optional[List[str]] = None
+
+class KnowledgeQueryRequest(BaseModel):
+    requirement: str = Field(..., min_length=1)
+    mode: QueryMode = "hybrid"
@@ -0,0 +1,214 @@
+"""
+Headless HTTP API for the requirement agents and the knowledge base
+
+Start it with `python run.py api`. Agent and knowledge base work runs on the
+shared async runtime loop, which owns LightRAG and the pooled LLM clients;
+request handlers only wait for it, so one API process serves many requests
+concurrently. Run a single worker process: the knowledge base lives in-process.
+"""
+
+import logging
+from contextlib import asynccontextmanager
+from typing import List
+
+from fastapi import FastAPI, File, HTTPException, Query, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from config import Config
+from agents.enhanced_requirement_agent import enhanced_requirement_agent
+from agents.review_agent import review_agent
+from services.async_runtime import run_async
+from services.knowledge_base import knowledge_base_service
+from services.llm_service import llm_service
+from services.prompt_budget import ConversationSummary
+from services.telemetry import telemetry
+from services.text_extraction import extraction_service
+from api.concurrency import ConcurrencyLimiter
+from api.schemas import ClarifyRequest, EnhanceRequest, ImprovementsRequest, KnowledgeQueryRequest, ReviewRequest
+from api.sse import event_stream, relay_events
+
+llm_limiter = ConcurrencyLimiter("LLM", Config.API_MAX_CONCURRENT_REQUESTS, Config.API_QUEUE_TIMEOUT_SECONDS)
+ingest_limiter = ConcurrencyLimiter("upload", Config.API_MAX_CONCURRENT_UPLOADS, Config.API_QUEUE_TIMEOUT_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    knowledge_base_service.start()
+    yield
+    extraction_service.shutdown()
+    await run_async(llm_service.aclose())
+
+app = FastAPI(title=f"{Config.APP_TITLE} API", description=Config.APP_DESCRIPTION, lifespan=lifespan)
+
+async def _run_limited(limiter: ConcurrencyLimiter, coro_factory, stream: bool, item_event: str = "token"):
+    """Serve one agent call under a concurrency limit, as JSON or as an SSE stream
+
+    coro_factory takes an emit callback (None when not streaming). A stream
+    keeps its slot until the client has received the last event.
+    """
+    await limiter.acquire()
+    if stream:
+        try:
+            return event_stream(relay_events(coro_factory, item_event), on_close=limiter.release)
+        except Exception:
+            limiter.release()
+            raise
+
+    try:
+        return _with_status(await run_async(coro_factory(None)))
+    finally:
+        limiter.release()
+
+def _with_status(result):
+    """Surface provider rate limiting as 429 with Retry-After instead of a 200 failure"""
+    if isinstance(result, dict) and result.get("rate_limited"):
+        retry_after = result.get("retry_after") or Config.API_QUEUE_TIMEOUT_SECONDS
+        return JSONResponse(result, status_code=429, headers={"Retry-After": str(max(1, int(retry_after)))})
+    return result
+
+@app.get("/health")
+async def health():
+    """Liveness plus knowledge base readiness and limiter load"""
+    return {
+        "status": "ok",
+        "knowledge_base": knowledge_base_service.get_status(),
+        "limits": {"llm": llm_limiter.get_stats(), "upload": ingest_limiter.get_stats()},
+        "provider_limits": llm_service.get_rate_limit_stats(),
+        "llm_resilience": llm_service.get_resilience_stats(),
+        "llm_cache": llm_service.get_cache_stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Counters and histograms in the Prometheus text format"""
+    return PlainTextResponse(telemetry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/diagnostics")
+async def diagnostics(limit: int = Query(10, ge=1, le=100)):
+    """Per-span latency summary and the most recent traces"""
+    return {
+        "spans": telemetry.get_span_summary(),
+        "traces": telemetry.get_recent_traces(limit)
+    }
+
+@app.get("/models")
+async def models():
+    return {"models": Config.get_available_models()}
+
+@app.post("/requirements/enhance")
+async def enhance_requirement(request: EnhanceRequest):
+    """Enhance a requirement with knowledge base context; stream=true sends tokens as SSE"""
+    return await _run_limited(
+        llm_limiter,
+        lambda emit: enhanced_requirement_agent.enhance_requirement_with_kb(request.requirement, request.model, emit),
+        request.stream
+    )
+
+@app.post("/requirements/clarify")
+async def clarify_requirement(request: ClarifyRequest):
+    """Refine a requirement from a user question or additional information
+
+    Send back the "conversation" field of the previous response to carry the
+    summary of earlier turns.
+    """
+    conversation = ConversationSummary.from_dict(request.conversation)
+    return await _run_limited(
+        llm_limiter,
+        lambda emit: enhanced_requirement_agent.clarify_requirement_with_kb(
+            request.requirement, request.question, request.model, emit, conversation
+        ),
+        request.stream
+    )
+
+@app.post("/requirements/review")
+async def review_requirement(request: ReviewRequest):
+    """Review a requirement; streamed tokens are the raw review output"""
+    return await _run_limited(
+        llm_limiter,
+        lambda emit: review_agent.review_requirement_async(
+            request.requirement, request.model, emit, request.use_cache
+        ),
+        request.stream
+    )
+
+@app.post("/requirements/improvements")
+async def suggest_improvements(request: ImprovementsRequest):
+    """Improvement suggestions; enhance responses already carry them for the original text"""
+    kb_result = None
+    if request.kb_suggestions is not None:
+        kb_result = {"success": True, "suggestions": request.kb_suggestions}
+    async with llm_limiter:
+        return await run_async(
+            enhanced_requirement_agent.suggest_requirement_improvements(request.requirement, kb_result)
+        )
+
+@app.post("/requirements/questions")
+async def smart_questions(request: ImprovementsRequest):
+    async with llm_limiter:
+        questions = await run_in_threadpool(enhanced_requirement_agent.get_smart_questions, request.requirement)
+        return {"success": True, "questions": questions}
+
+@app.get("/kb/status")
+async def knowledge_base_status():
+    return {
+        **knowledge_base_service.get_status(),
+        "documents": knowledge_base_service.get_documents_summary()
+    }
+
+@app.post("/kb/query")
+async def query_knowledge_base(request: KnowledgeQueryRequest):
+    async with llm_limiter:
+        return await run_async(knowledge_base_service.query_knowledge_base(request.requirement, request.mode))
+
+@app.get("/kb/documents")
+async def list_documents(offset: int = Query(0, ge=0), limit: int = Query(Config.DOCUMENTS_PAGE_SIZE, ge=1, le=1000)):
+    return {
+        "documents": knowledge_base_service.get_uploaded_documents(offset, limit),
+        "total": knowledge_base_service.catalog.count(),
+        "offset": offset,
+        "limit": limit
+    }
+
+@app.post("/kb/documents")
+async def upload_documents(files: List[UploadFile] = File(...), stream: bool = Query(False)):
+    """Bulk upload; stream=true sends one "progress" event per file as it finishes"""
+    if len(files) > Config.API_MAX_UPLOAD_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {Config.API_MAX_UPLOAD_FILES} files per request, got {len(files)}"
+        )
+
+    batch = []
+    for upload in files:
+        batch.append((upload.filename or "upload.txt", await upload.read()))
+        await upload.close()
+    logging.info(f"API upload of {len(batch)} documents")
+
+    return await _run_limited(
+        ingest_limiter,
+        lambda emit: knowledge_base_service.add_documents(batch, progress_callback=emit),
+        stream,
+        item_event="progress"
+    )
+
+@app.delete("/kb/documents/{filename}")
+async def remove_document(filename: str):
+    result = await run_async(knowledge_base_service.remove_document(filename))
+    if not result.get("success") and "not found" in result.get("error", ""):
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+@app.post("/kb/rebuild")
+async def rebuild_knowledge_base(stream: bool = Query(False)):
+    """Re-index changed documents; stream=true sends "progress" events per stage"""
+    return await _run_limited(
+        ingest_limiter,
+        lambda emit: knowledge_base_service.rebuild_knowledge_base(progress_callback=emit),
+        stream,
+        item_event="progress"
+    )
+
+@app.post("/kb/compact")
+async def compact_knowledge_base():
+    async with ingest_limiter:
+        return await run_async(knowledge_base_service.compact_index())
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi.responses import StreamingResponse
+
+from services.async_runtime import run_async
+
+_STREAM_DONE = object()
+
+def format_event(event: str, data: Any) -> str:
+    """One Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def relay_events(coro_factory: Callable[[Callable[[Any], None]], Awaitable[Any]],
+                       item_event: str) -> AsyncIterator[str]:
+    """Run a callback-emitting coroutine on the shared loop and stream what it emits
+
+    coro_factory receives a thread-safe emit function, the same contract as
+    run_sync_streaming. Each emitted item becomes an item_event message and
+    the coroutine's return value a final "result" message. If the client
+    disconnects, the work on the shared loop is cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+
+    def emit(item: Any):
+        loop.call_soon_threadsafe(items.put_nowait, item)
+
+    # Both emit() and the future's completion are delivered through
+    # call_soon_threadsafe, so every item arrives before the done marker
+    future = asyncio.ensure_future(run_async(coro_factory(emit)))
+    future.add_done_callback(lambda _: items.put_nowait(_STREAM_DONE))
+    try:
+        while True:
+            item = await items.get()
+            if item is _STREAM_DONE:
+                break
+            yield format_event(item_event, item)
+
+        try:
+            yield format_event("result", future.result())
+        except Exception as e:
+            logging.error(f"Streaming request failed: {e}")
+            yield format_event("error", {"success": False, "error": str(e)})
+    finally:
+        future.cancel()
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that calls on_close however sending it ends
+
+    A client that disconnects before the body is first iterated leaves the
+    body generator unstarted, so its finally never runs; this one always does.
+    """
+
+    def __init__(self, *args, on_close: Callable[[], None], **kwargs):
+        super().__init__(*args, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._on_close()
+
+def event_stream(events: AsyncIterator[str], on_close: Optional[Callable[[], None]] = None) -> StreamingResponse:
+    """Wrap an event iterator in an SSE response, calling on_close exactly once when it ends
+
+    on_close runs as soon as the last event is sent, or when sending stops
+    for any other reason (client disconnect, cancellation, send error).
+    """
+    closed = False
+
+    def close():
+        nonlocal closed
+        if closed or on_close is None:
+            return
+        closed = True
+        on_close()
+
+    async def body():
+        try:
+            async for event in events:
+                yield event
+        finally:
+            close()
+
+    return _ClosingStreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        on_close=close
+    )
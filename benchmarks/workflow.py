@@ -0,0 +1,490 @@
+"""
+End-to-end benchmark of the enhance → clarify → review workflow
+
+Drives EnhancedRequirementAgent, ReviewAgent and KnowledgeBaseService without
+the Streamlit UI, against the mock provider served in-process with a fixed
+latency, so LLM responses and timings are deterministic. It runs in a scratch
+working directory, leaving the real knowledge base and caches untouched.
+
+For each corpus size it ingests synthetic documents (throughput and memory),
+then runs the workflow for each requirement length and reports p50/p95/p99
+per stage. Results are written as JSON so runs on different commits can be
+compared:
+
+    python run.py bench --output bench.json
+    git checkout other-branch
+    python run.py bench --compare bench.json --fail-on-regression 20
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MOCK_BASE_URL = "http://mock-llm"
+
+# Per-stage timings within one workflow iteration
+STAGES = ("heuristics", "kb_query", "prompt_build", "llm", "json_parse")
+# End-to-end agent calls, as main.py drives them
+PHASES = ("enhance", "clarify", "review")
+
+_SENTENCES = [
+    "The system shall allow {role}s to {action} {object}s from the web portal.",
+    "Every {object} change must be recorded in an audit log with the acting {role}.",
+    "{role}s need a dashboard summarising open {object}s by status.",
+    "The {object} search should return results within two seconds for typical queries.",
+    "Only {role}s with the right permission may {action} {object}s.",
+    "Notifications are sent when a {object} is approved or rejected.",
+    "The service must stay available during business hours with planned maintenance windows.",
+    "Exports of {object}s should support CSV and PDF formats.",
+    "Invalid {object} data must be rejected with a clear validation message.",
+    "Integration with the existing {object} system happens through a REST interface.",
+]
+_ROLES = ["customer", "administrator", "analyst", "trader", "auditor", "operator", "manager"]
+_ACTIONS = ["create", "approve", "cancel", "export", "review", "archive", "update"]
+_OBJECTS = ["order", "account", "report", "invoice", "position", "ticket", "contract", "alert"]
+
+def synthetic_text(length: int, seed: int, heading: str = "") -> str:
+    """Deterministic requirement-like prose of about length characters"""
+    rng = random.Random(seed)
+    parts = [heading] if heading else []
+    size = len(heading)
+    while size < length:
+        sentence = rng.choice(_SENTENCES).format(
+            role=rng.choice(_ROLES), action=rng.choice(_ACTIONS), object=rng.choice(_OBJECTS)
+        )
+        parts.append(sentence)
+        size += len(sentence) + 1
+    return " ".join(parts)[:max(length, len(heading))]
+
+def percentile(ordered: List[float], q: float) -> float:
+    """q-th percentile (0-100) of sorted values, linearly interpolated"""
+    if len(ordered) == 1:
+        return ordered[0]
+    position = q / 100.0 * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    """Latency summary in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+class StageTimer:
+    """Collects wall-clock samples per named stage"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    @contextmanager
+    def measure(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[stage].append(time.perf_counter() - started)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {stage: summarize(values) for stage, values in self.samples.items() if values}
+
+def max_rss_bytes() -> Optional[int]:
+    """Process resident set high-water mark so far"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+@contextmanager
+def memory_section(record: Dict[str, Any]):
+    """Record the Python heap peak (when tracing) and RSS high-water mark of a block"""
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        if tracemalloc.is_tracing():
+            record["python_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        record["max_rss_bytes"] = max_rss_bytes()
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=10)
+        return result.stdout.strip() or None
+    except Exception:
+        return None
+
+def _benchmark_environment() -> Dict[str, str]:
+    """Settings that route every LLM call to the in-process mock and disable caching"""
+    return {
+        "OPENAI_API_KEY": "benchmark",
+        "OPENAI_BASE_URL": f"{MOCK_BASE_URL}/v1",
+        "DEFAULT_MODEL": "openai",
+        "KB_LLM_MODEL": "openai",
+        # Every iteration must reach the stages being measured
+        "LLM_CACHE_ENABLED": "false",
+        "KB_QUERY_CACHE_ENABLED": "false",
+        # Provider budgets, hedging and failover would add noise unrelated to the code under test
+        "OPENAI_REQUESTS_PER_MINUTE": "0",
+        "OPENAI_TOKENS_PER_MINUTE": "0",
+        "LLM_HEDGE_ENABLED": "false",
+        "LLM_FAILOVER_ENABLED": "false",
+        "LLM_MAX_RETRIES": "0",
+    }
+
+class WorkflowBenchmark:
+    """Runs ingestion and workflow measurements; call from the async runtime loop"""
+
+    def __init__(self, document_counts: List[int], requirement_lengths: List[int], iterations: int,
+                 document_chars: int, seed: int = 0):
+        from agents.enhanced_requirement_agent import enhanced_requirement_agent
+        from agents.review_agent import review_agent
+        from services.knowledge_base import knowledge_base_service
+        from services.llm_service import llm_service
+
+        self.enhanced_agent = enhanced_requirement_agent
+        self.review_agent = review_agent
+        self.knowledge_base = knowledge_base_service
+        self.llm_service = llm_service
+        self.document_counts = sorted(set(document_counts))
+        self.requirement_lengths = sorted(set(requirement_lengths))
+        self.iterations = iterations
+        self.document_chars = document_chars
+        self.seed = seed
+
+    async def ingest(self, start: int, stop: int) -> Dict[str, Any]:
+        """Add synthetic documents start..stop-1 to the knowledge base"""
+        files = [
+            (f"benchmark-doc-{index:05d}.txt",
+             synthetic_text(self.document_chars, self.seed * 100003 + index,
+                            heading=f"Requirement specification {index}.").encode("utf-8"))
+            for index in range(start, stop)
+        ]
+        size = sum(len(data) for _, data in files)
+        record = {"corpus_documents": stop, "documents": len(files), "bytes": size}
+
+        with memory_section(record):
+            started = time.perf_counter()
+            result = await self.knowledge_base.add_documents(files)
+            elapsed = time.perf_counter() - started
+
+        record.update({
+            "seconds": round(elapsed, 4),
+            "documents_per_second": round(len(files) / elapsed, 2) if elapsed else None,
+            "mb_per_second": round(size / elapsed / (1024 * 1024), 3) if elapsed else None,
+            "added": len(result.get("added", [])),
+            "duplicates": len(result.get("duplicates", [])),
+            "failed": len(result.get("failed", []))
+        })
+        return record
+
+    async def run_workflow(self, requirement_chars: int, corpus_documents: int) -> Dict[str, Any]:
+        """Run the enhance → clarify → review workflow iterations times"""
+        timer = StageTimer()
+        failures = defaultdict(int)
+        record = {"corpus_documents": corpus_documents, "requirement_chars": requirement_chars}
+
+        with memory_section(record):
+            for iteration in range(self.iterations):
+                # Distinct text per iteration so no lookup is shared between iterations
+                text = synthetic_text(
+                    requirement_chars, self.seed * 1000003 + requirement_chars * 1009 + iteration,
+                    heading=f"[{corpus_documents}/{iteration}]"
+                )
+                question = "Which user roles need approval rights, and what is the expected peak load?"
+                await self._measure_stages(timer, text, failures)
+                await self._measure_phases(timer, text, question, failures)
+
+        record["stages"] = {name: stats for name, stats in timer.summary().items() if name in STAGES}
+        record["phases"] = {name: stats for name, stats in timer.summary().items() if name in PHASES}
+        record["failures"] = dict(failures)
+        return record
+
+    async def _measure_stages(self, timer: StageTimer, text: str, failures: Dict[str, int]):
+        """Time the building blocks of enhancement and review one at a time"""
+        with timer.measure("heuristics"):
+            self.enhanced_agent._run_heuristics(text)
+
+        with timer.measure("kb_query"):
+            kb_result = await self.knowledge_base.query_knowledge_base(text)
+
+        with timer.measure("prompt_build"):
+            prompt = self.enhanced_agent._build_enhanced_prompt(text, kb_result)
+
+        with timer.measure("llm"):
+            await self.llm_service.generate_completion(prompt, "openai", self.enhanced_agent.system_prompt,
+                                                       use_cache=False)
+
+        with timer.measure("prompt_build"):
+            review_prompt = self.review_agent._build_review_prompt(text)
+
+        with timer.measure("llm"):
+            raw_review = await self.llm_service.generate_completion(review_prompt, "openai",
+                                                                    self.review_agent.system_prompt,
+                                                                    use_cache=False)
+
+        with timer.measure("json_parse"):
+            review = self.review_agent._parse_review(raw_review)
+        if not isinstance(review, dict) or "issues" not in review:
+            failures["json_parse"] += 1
+
+    async def _measure_phases(self, timer: StageTimer, text: str, question: str, failures: Dict[str, int]):
+        """Time the three agent calls end to end, each feeding the next"""
+        with timer.measure("enhance"):
+            enhanced = await self.enhanced_agent.enhance_requirement_with_kb(text, "openai")
+        if not enhanced.get("success"):
+            failures["enhance"] += 1
+            return
+
+        with timer.measure("clarify"):
+            clarified = await self.enhanced_agent.clarify_requirement_with_kb(
+                enhanced["enhanced_requirement"], question, "openai"
+            )
+        if not clarified.get("success"):
+            failures["clarify"] += 1
+            return
+
+        with timer.measure("review"):
+            reviewed = await self.review_agent.review_requirement_async(
+                clarified["clarified_requirement"], "openai", use_cache=False
+            )
+        if not reviewed.get("success"):
+            failures["review"] += 1
+
+    async def run(self, on_progress=None) -> Dict[str, Any]:
+        results = {"ingestion": [], "workflow": []}
+        corpus = 0
+        for count in self.document_counts:
+            if count > corpus:
+                ingestion = await self.ingest(corpus, count)
+                corpus = count
+                results["ingestion"].append(ingestion)
+                if on_progress:
+                    on_progress("ingestion", ingestion)
+
+            for length in self.requirement_lengths:
+                workflow = await self.run_workflow(length, corpus)
+                results["workflow"].append(workflow)
+                if on_progress:
+                    on_progress("workflow", workflow)
+        return results
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """p95 latency and ingestion throughput changes against a baseline run
+
+    change_percent is positive when the current run is worse.
+    """
+    changes = []
+
+    def keyed(runs):
+        return {(run["corpus_documents"], run["requirement_chars"]): run for run in runs}
+
+    baseline_runs = keyed(baseline.get("workflow", []))
+    for key, run in keyed(current.get("workflow", [])).items():
+        before = baseline_runs.get(key)
+        if before is None:
+            continue
+        for group in ("stages", "phases"):
+            for name, stats in run.get(group, {}).items():
+                old = before.get(group, {}).get(name)
+                if not old or not old["p95_ms"]:
+                    continue
+                changes.append({
+                    "metric": f"{name} p95",
+                    "corpus_documents": key[0],
+                    "requirement_chars": key[1],
+                    "baseline": old["p95_ms"],
+                    "current": stats["p95_ms"],
+                    "change_percent": round((stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100, 1)
+                })
+
+    baseline_ingestion = {run["corpus_documents"]: run for run in baseline.get("ingestion", [])}
+    for run in current.get("ingestion", []):
+        before = baseline_ingestion.get(run["corpus_documents"])
+        if not before or not before.get("documents_per_second") or not run.get("documents_per_second"):
+            continue
+        changes.append({
+            "metric": "ingestion documents/s",
+            "corpus_documents": run["corpus_documents"],
+            "requirement_chars": None,
+            "baseline": before["documents_per_second"],
+            "current": run["documents_per_second"],
+            "change_percent": round(
+                (before["documents_per_second"] - run["documents_per_second"]) / before["documents_per_second"] * 100, 1
+            )
+        })
+    return changes
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+def _print_progress(kind: str, record: Dict[str, Any]):
+    if kind == "ingestion":
+        print(f"📥 Ingested {record['documents']} documents (corpus {record['corpus_documents']}) "
+              f"in {record['seconds']}s: {record['documents_per_second']} docs/s, {record['mb_per_second']} MB/s")
+        return
+
+    print(f"\n⏱️  corpus {record['corpus_documents']} documents, requirement {record['requirement_chars']} chars")
+    for name, stats in {**record["stages"], **record["phases"]}.items():
+        print(f"   {name:<13} p50 {stats['p50_ms']:>9.2f} ms   p95 {stats['p95_ms']:>9.2f} ms   "
+              f"p99 {stats['p99_ms']:>9.2f} ms")
+    if record["failures"]:
+        print(f"   ⚠️  failures: {record['failures']}")
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the enhance → clarify → review workflow")
+    parser.add_argument("--output", "-o", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--iterations", "-n", type=int, default=10, help="Workflow runs per configuration")
+    parser.add_argument("--document-counts", type=_int_list, default=[10, 50, 200],
+                        help="Knowledge base sizes to measure at, e.g. 10,50,200")
+    parser.add_argument("--requirement-lengths", type=_int_list, default=[200, 1000, 5000],
+                        help="Requirement lengths in characters, e.g. 200,1000,5000")
+    parser.add_argument("--document-chars", type=int, default=4000, help="Size of each synthetic document")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="Fixed mock provider latency")
+    parser.add_argument("--response-tokens", type=int, default=200, help="Mock response length in tokens")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also record Python heap peaks with tracemalloc (slows every stage)")
+    parser.add_argument("--workdir", help="Scratch directory to run in (default: a temporary one, removed afterwards)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--fail-on-regression", type=float, metavar="PERCENT",
+                        help="Exit non-zero if any p95 or throughput is worse than the baseline by more than PERCENT")
+    args = parser.parse_args(argv)
+
+    if "config" in sys.modules:
+        sys.exit("❌ The benchmark must configure the application before it is imported; run it as its own process")
+
+    output_path = Path(args.output).resolve()
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+
+    # Run from a scratch directory so ./rag_storage and ./cache are the benchmark's own
+    workdir = Path(args.workdir).resolve() if args.workdir else Path(tempfile.mkdtemp(prefix="ba-copilot-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    original_cwd = os.getcwd()
+    sys.path.insert(0, str(REPO_ROOT))
+    os.environ.update(_benchmark_environment())
+    os.chdir(workdir)
+
+    try:
+        import httpx
+        from api.mock_provider import app as mock_app, mock_provider
+        from services.async_runtime import run_sync
+        from services.knowledge_base import LIGHTRAG_AVAILABLE, knowledge_base_service
+        from services.llm_service import llm_service
+        from services.telemetry import telemetry
+        from services.text_extraction import extraction_service
+
+        mock_provider.update({
+            "latency_median_ms": args.llm_latency_ms,
+            "latency_sigma": 0,
+            "tokens_per_second": 0,
+            "response_tokens": args.response_tokens,
+            "error_rate": 0,
+            "rate_limit_rate": 0,
+            "seed": args.seed
+        })
+        llm_service.http_transport = httpx.ASGITransport(app=mock_app)
+
+        if args.trace_memory:
+            tracemalloc.start()
+
+        print(f"🏁 Benchmarking in {workdir}")
+        knowledge_base_service.start()
+        kb_ready = knowledge_base_service.wait_until_ready(timeout=300)
+        if not kb_ready:
+            print(f"⚠️  Knowledge base not ready ({knowledge_base_service.get_status().get('status')}); "
+                  "KB stages measure the fallback path")
+
+        benchmark = WorkflowBenchmark(args.document_counts, args.requirement_lengths, args.iterations,
+                                      args.document_chars, args.seed)
+        started = time.perf_counter()
+        results = run_sync(benchmark.run(on_progress=_print_progress))
+
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "started_at": datetime.now().isoformat(),
+                "elapsed_seconds": round(time.perf_counter() - started, 2),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "lightrag_available": LIGHTRAG_AVAILABLE,
+                "knowledge_base_ready": kb_ready
+            },
+            "settings": {
+                "iterations": args.iterations,
+                "document_counts": benchmark.document_counts,
+                "requirement_lengths": benchmark.requirement_lengths,
+                "document_chars": args.document_chars,
+                "llm_latency_ms": args.llm_latency_ms,
+                "response_tokens": args.response_tokens,
+                "seed": args.seed,
+                "trace_memory": args.trace_memory
+            },
+            **results,
+            "memory": {
+                "max_rss_bytes": max_rss_bytes(),
+                "python_peak_bytes": tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+            },
+            "mock_provider": dict(mock_provider.stats),
+            # Where the time went inside the phases, from the instrumentation spans
+            "telemetry_spans": telemetry.get_span_summary()
+        }
+
+        run_sync(llm_service.aclose())
+        extraction_service.shutdown()
+    finally:
+        os.chdir(original_cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    regressions = []
+    if baseline is not None:
+        report["comparison"] = {"baseline_commit": baseline.get("meta", {}).get("commit"),
+                                "changes": compare_results(report, baseline)}
+        print(f"\n📊 Compared with {report['comparison']['baseline_commit'] or args.compare}:")
+        for change in report["comparison"]["changes"]:
+            marker = "⚠️ " if change["change_percent"] > 0 else "✅"
+            print(f"   {marker} {change['metric']:<28} docs={change['corpus_documents']} "
+                  f"chars={change['requirement_chars']}: {change['baseline']} → {change['current']} "
+                  f"({change['change_percent']:+}%)")
+            if args.fail_on_regression is not None and change["change_percent"] > args.fail_on_regression:
+                regressions.append(change)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\n💾 Results written to {output_path}")
+
+    if regressions:
+        sys.exit(f"❌ {len(regressions)} metrics regressed by more than {args.fail_on_regression}%")
+    return report
+
+if __name__ == "__main__":
+    main()
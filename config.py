@@ -13,9 +13,148 @@ class Config:
     
     # OpenAI Configuration
     OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4-turbo-preview")
+    # Alternative endpoint, e.g. the local mock provider (python run.py mock)
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
     
     # Anthropic Configuration
     ANTHROPIC_MODEL = os.getenv("ANTHROPIC_MODEL", "claude-3-sonnet-20240229")
+    ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None
+    
+    # LLM HTTP Transport Configuration (shared connection pool)
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+    
+    # LLM Response Cache Configuration
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./cache/llm_responses.sqlite3")
+    LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+    LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    LLM_CACHE_MAX_DISK_MB = float(os.getenv("LLM_CACHE_MAX_DISK_MB", "256"))
+    
+    # Provider Rate Limits (requests and tokens per minute; 0 disables)
+    OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500"))
+    OPENAI_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "300000"))
+    ANTHROPIC_REQUESTS_PER_MINUTE = float(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", "50"))
+    ANTHROPIC_TOKENS_PER_MINUTE = float(os.getenv("ANTHROPIC_TOKENS_PER_MINUTE", "40000"))
+    # Adaptive per-provider concurrency: grows by one per window of successes, halves on 429
+    LLM_INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", "8"))
+    LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+    # How long a call may wait for rate limit capacity before failing; 0 waits indefinitely
+    LLM_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT_SECONDS", "60"))
+    
+    # LLM Call Resilience (retries with jittered exponential backoff, deadlines, hedging, failover)
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+    LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+    # Upper bound on one call including all retries and failover
+    LLM_CALL_DEADLINE_SECONDS = float(os.getenv("LLM_CALL_DEADLINE_SECONDS", "150"))
+    # Fire a duplicate request once the first is slower than this latency percentile
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    # Switch to the other provider when the selected one keeps failing
+    LLM_FAILOVER_ENABLED = os.getenv("LLM_FAILOVER_ENABLED", "true").lower() == "true"
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+    
+    # Batch Review Configuration (python run.py review)
+    BATCH_REVIEW_CONCURRENCY = int(os.getenv("BATCH_REVIEW_CONCURRENCY", "4"))
+    
+    # Enhancement Pipeline Configuration
+    # How long enhancement waits for knowledge base context before starting the LLM without it
+    KB_CONTEXT_DEADLINE_SECONDS = float(os.getenv("KB_CONTEXT_DEADLINE_SECONDS", "3"))
+    # How long a knowledge base result is shared between enhancement, smart questions and suggestions
+    KB_RESULT_REUSE_SECONDS = float(os.getenv("KB_RESULT_REUSE_SECONDS", "300"))
+    
+    # Model LightRAG uses for entity extraction while indexing documents
+    KB_LLM_MODEL = os.getenv("KB_LLM_MODEL", "demo")
+    
+    # Clarification Prompt Budget Configuration
+    # Input tokens a clarification prompt may use, system prompt included; longer
+    # requirement documents are cut down to the sections relevant to the question
+    CLARIFY_INPUT_TOKEN_BUDGET = int(os.getenv("CLARIFY_INPUT_TOKEN_BUDGET", "3000"))
+    # Shares of the budget for the rolling summary of earlier turns and for knowledge base insights
+    CLARIFY_SUMMARY_TOKEN_BUDGET = int(os.getenv("CLARIFY_SUMMARY_TOKEN_BUDGET", "300"))
+    CLARIFY_KB_TOKEN_BUDGET = int(os.getenv("CLARIFY_KB_TOKEN_BUDGET", "400"))
+    
+    # Knowledge Base Query Cache Configuration (invalidated whenever the knowledge base changes)
+    KB_QUERY_CACHE_ENABLED = os.getenv("KB_QUERY_CACHE_ENABLED", "true").lower() == "true"
+    KB_QUERY_CACHE_ENTRIES = int(os.getenv("KB_QUERY_CACHE_ENTRIES", "256"))
+    # Minimum similarity for a lightly edited query to reuse a cached result; 0 disables near-duplicate lookup
+    KB_QUERY_CACHE_NEAR_DUPLICATE_THRESHOLD = float(os.getenv("KB_QUERY_CACHE_NEAR_DUPLICATE_THRESHOLD", "0.85"))
+    
+    # Local Embedding Configuration
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./cache/embeddings.sqlite3")
+    # Inputs at least this large are sharded across a process pool
+    EMBEDDING_PROCESS_POOL_THRESHOLD = int(os.getenv("EMBEDDING_PROCESS_POOL_THRESHOLD", "256"))
+    EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", str(min(4, os.cpu_count() or 1))))
+    
+    # Bulk Document Ingestion Configuration
+    INGEST_EXTRACTION_WORKERS = int(os.getenv("INGEST_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+    # Documents per LightRAG insert call, and how many insert calls run at once
+    INGEST_INSERT_BATCH_SIZE = int(os.getenv("INGEST_INSERT_BATCH_SIZE", "8"))
+    INGEST_MAX_CONCURRENCY = int(os.getenv("INGEST_MAX_CONCURRENCY", "2"))
+    # Per-file extraction budgets; large PDFs are extracted in parallel page ranges
+    EXTRACTION_PDF_PAGES_PER_SHARD = int(os.getenv("EXTRACTION_PDF_PAGES_PER_SHARD", "25"))
+    EXTRACTION_MAX_FILE_MB = int(os.getenv("EXTRACTION_MAX_FILE_MB", "100"))
+    EXTRACTION_MAX_CHARS = int(os.getenv("EXTRACTION_MAX_CHARS", "5000000"))
+    EXTRACTION_TIMEOUT_SECONDS = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "300"))
+    
+    # Document Catalogue Configuration
+    DOCUMENTS_PAGE_SIZE = int(os.getenv("DOCUMENTS_PAGE_SIZE", "20"))
+    # Removed documents' LightRAG items are compacted away once this many are tombstoned
+    KB_COMPACTION_THRESHOLD = int(os.getenv("KB_COMPACTION_THRESHOLD", "200"))
+    
+    # Document Similarity Graph Configuration (MinHash signatures + LSH)
+    SIMILARITY_NUM_PERM = int(os.getenv("SIMILARITY_NUM_PERM", "128"))
+    # 32 bands of 4 rows put the LSH threshold (1/bands)^(1/rows) at ~0.42, next to
+    # SIMILARITY_MIN_SCORE: pairs at 0.5 become candidates 87% of the time, pairs at
+    # 0.1 only 0.3%, so candidate comparisons stay far below all pairs. Keep the
+    # two in step: a threshold well above the minimum score misses real edges,
+    # one well below it compares almost everything
+    SIMILARITY_LSH_BANDS = int(os.getenv("SIMILARITY_LSH_BANDS", "32"))
+    SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "5"))
+    # Raised from 0.1, which drops the weakest links; for the old graph set 0.1
+    # together with SIMILARITY_LSH_BANDS=64 (threshold ~0.13), at a far higher
+    # candidate count
+    SIMILARITY_MIN_SCORE = float(os.getenv("SIMILARITY_MIN_SCORE", "0.4"))
+    # Layout and rendering grow quadratically with nodes; larger corpora show the
+    # documents with the strongest similarity links
+    KNOWLEDGE_GRAPH_MAX_DOCUMENTS = int(os.getenv("KNOWLEDGE_GRAPH_MAX_DOCUMENTS", "150"))
+    
+    # HTTP API Configuration (python run.py api)
+    API_HOST = os.getenv("API_HOST", "127.0.0.1")
+    API_PORT = int(os.getenv("API_PORT", "8000"))
+    # LLM-backed requests (enhance, clarify, review, KB queries) served at once
+    API_MAX_CONCURRENT_REQUESTS = int(os.getenv("API_MAX_CONCURRENT_REQUESTS", "16"))
+    # Document uploads and rebuilds served at once
+    API_MAX_CONCURRENT_UPLOADS = int(os.getenv("API_MAX_CONCURRENT_UPLOADS", "2"))
+    # How long a request may wait for a free slot before it is rejected with 503
+    API_QUEUE_TIMEOUT_SECONDS = float(os.getenv("API_QUEUE_TIMEOUT_SECONDS", "30"))
+    API_MAX_UPLOAD_FILES = int(os.getenv("API_MAX_UPLOAD_FILES", "100"))
+    
+    # Mock LLM Provider Configuration (python run.py mock)
+    MOCK_LLM_HOST = os.getenv("MOCK_LLM_HOST", "127.0.0.1")
+    MOCK_LLM_PORT = int(os.getenv("MOCK_LLM_PORT", "8100"))
+    # Time to first token is log-normal around the median; sigma 0 makes it fixed
+    MOCK_LLM_LATENCY_MEDIAN_MS = float(os.getenv("MOCK_LLM_LATENCY_MEDIAN_MS", "400"))
+    MOCK_LLM_LATENCY_SIGMA = float(os.getenv("MOCK_LLM_LATENCY_SIGMA", "0.5"))
+    MOCK_LLM_TOKENS_PER_SECOND = float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "60"))
+    MOCK_LLM_RESPONSE_TOKENS = int(os.getenv("MOCK_LLM_RESPONSE_TOKENS", "200"))
+    # Fractions of requests answered with a 500 or a 429
+    MOCK_LLM_ERROR_RATE = float(os.getenv("MOCK_LLM_ERROR_RATE", "0"))
+    MOCK_LLM_RATE_LIMIT_RATE = float(os.getenv("MOCK_LLM_RATE_LIMIT_RATE", "0"))
+    MOCK_LLM_SEED = int(os.getenv("MOCK_LLM_SEED")) if os.getenv("MOCK_LLM_SEED") else None
+    
+    # Telemetry Configuration (spans, counters and histograms; exported at the API's /metrics)
+    TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "true").lower() == "true"
+    # Finished top-level spans kept, with their children, for the diagnostics panel
+    TELEMETRY_RECENT_TRACES = int(os.getenv("TELEMETRY_RECENT_TRACES", "50"))
     
     # Application Configuration
     APP_TITLE = "BA Copilot"
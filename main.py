@@ -4,7 +4,9 @@ from config import Config
 from agents.requirement_agent import requirement_agent
 from agents.enhanced_requirement_agent import enhanced_requirement_agent
 from agents.review_agent import review_agent
-import asyncio
+from services.async_runtime import run_sync, run_sync_streaming
+from services.prompt_budget import ConversationSummary
+from services.telemetry import telemetry
 import logging
 
 # Page configuration
@@ -427,9 +429,16 @@ def initialize_session_state():
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
     
+    if 'clarification_conversation' not in st.session_state:
+        st.session_state.clarification_conversation = ConversationSummary()
+    
     if 'review_result' not in st.session_state:
         st.session_state.review_result = None
     
+    # Knowledge base result of the enhancement, reused for the improvement insights
+    if 'enhancement_kb_result' not in st.session_state:
+        st.session_state.enhancement_kb_result = None
+    
     if 'show_knowledge_graph' not in st.session_state:
         st.session_state.show_knowledge_graph = False
 
@@ -463,10 +472,18 @@ def show_model_selector():
         st.markdown("### 🧠 Knowledge Base")
         
         try:
-            from services.knowledge_base import knowledge_base_service
+            from services.knowledge_base import knowledge_base_service, KB_STATUS_READY, KB_STATUS_INITIALIZING
             
-            if knowledge_base_service.is_initialized:
+            kb_state = knowledge_base_service.get_status()
+            if kb_state['status'] == KB_STATUS_READY:
                 st.success("🟢 **LightRAG Enabled**\n\nAdvanced knowledge processing active")
+            elif kb_state['status'] == KB_STATUS_INITIALIZING:
+                elapsed = f" ({kb_state['elapsed_seconds']}s)" if kb_state['elapsed_seconds'] is not None else ""
+                st.info(f"⏳ **Initializing**{elapsed}\n\n{kb_state['message']}. Enhancement runs without knowledge base context until it is ready.")
+                if st.button("🔄 Refresh Status", use_container_width=True, key="kb_status_refresh"):
+                    st.rerun()
+            elif kb_state['lightrag_available']:
+                st.warning(f"🟡 **Degraded**\n\n{kb_state['message']}")
             else:
                 st.warning("🟡 **Basic Mode**\n\nInstall LightRAG for advanced features")
             
@@ -492,21 +509,28 @@ def show_model_selector():
                 """)
                 
                 # Show recent documents
-                uploaded_docs = knowledge_base_service.get_uploaded_documents()
-                if uploaded_docs:
+                total_docs = docs_summary['total_documents']
+                if total_docs:
                     st.markdown("**📄 Recent Documents:**")
                     # Show last 3 documents
-                    for doc in uploaded_docs[-3:]:
+                    recent_docs = knowledge_base_service.get_uploaded_documents(offset=max(0, total_docs - 3), limit=3)
+                    for doc in recent_docs:
                         upload_time = doc['upload_time'][:10]  # Show date only
                         st.markdown(f"• `{doc['filename']}` ({upload_time})")
                     
-                    if len(uploaded_docs) > 3:
-                        st.markdown(f"*...and {len(uploaded_docs) - 3} more*")
+                    if total_docs > 3:
+                        st.markdown(f"*...and {total_docs - 3} more*")
                     
                     # Document management expander
                     with st.expander("📁 Manage Documents"):
                         st.markdown("**All Uploaded Documents:**")
-                        for i, doc in enumerate(uploaded_docs):
+                        page_count = (total_docs + Config.DOCUMENTS_PAGE_SIZE - 1) // Config.DOCUMENTS_PAGE_SIZE
+                        page = 1
+                        if page_count > 1:
+                            page = st.number_input("Page", min_value=1, max_value=page_count, value=1, key="documents_page")
+                        offset = (page - 1) * Config.DOCUMENTS_PAGE_SIZE
+                        page_docs = knowledge_base_service.get_uploaded_documents(offset=offset, limit=Config.DOCUMENTS_PAGE_SIZE)
+                        for i, doc in enumerate(page_docs, start=offset):
                             col1, col2 = st.columns([3, 1])
                             with col1:
                                 st.markdown(f"📄 `{doc['filename']}`")
@@ -516,13 +540,9 @@ def show_model_selector():
                             with col2:
                                 if st.button("🗑️", key=f"del_doc_{i}", help=f"Delete {doc['filename']}"):
                                     with st.spinner(f"Deleting {doc['filename']}..."):
-                                        loop = asyncio.new_event_loop()
-                                        asyncio.set_event_loop(loop)
-                                        
-                                        result = loop.run_until_complete(
+                                        result = run_sync(
                                             knowledge_base_service.remove_document(doc['filename'])
                                         )
-                                        loop.close()
                                         
                                         if result['success']:
                                             st.success(f"Deleted {doc['filename']}")
@@ -572,6 +592,52 @@ def show_model_selector():
         
         return selected_model
 
+def _trace_lines(trace, depth=0):
+    """Indented markdown lines for a span and its children"""
+    error = f" ❌ {trace['error']}" if trace['error'] else ""
+    lines = [f"{'&nbsp;' * 4 * depth}• `{trace['name']}` {trace['duration_ms']} ms{error}"]
+    for child in trace['children']:
+        lines.extend(_trace_lines(child, depth + 1))
+    if trace['dropped_children']:
+        lines.append(f"{'&nbsp;' * 4 * (depth + 1)}• *...{trace['dropped_children']} more*")
+    return lines
+
+def show_diagnostics_panel():
+    """Display stage timings, LLM counters and the latest trace in the sidebar"""
+    with st.sidebar:
+        st.markdown("---")
+        with st.expander("🩺 Diagnostics"):
+            if not telemetry.enabled:
+                st.info("Telemetry is disabled (TELEMETRY_ENABLED=false)")
+                return
+            
+            spans = telemetry.get_span_summary()
+            if not spans:
+                st.caption("No operations recorded yet")
+                return
+            
+            st.markdown("**⏱️ Stage Latency**")
+            st.dataframe(spans, hide_index=True, use_container_width=True)
+            
+            cache_hits = telemetry.counter_total("llm_cache_requests_total", result="hit")
+            cache_lookups = telemetry.counter_total("llm_cache_requests_total")
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("Tokens In", int(telemetry.counter_total("llm_tokens_total", direction="in")))
+                st.metric("Retries", int(telemetry.counter_total("llm_retries_total")))
+            with col2:
+                st.metric("Tokens Out", int(telemetry.counter_total("llm_tokens_total", direction="out")))
+                st.metric("Cache Hit Rate", f"{cache_hits / cache_lookups:.0%}" if cache_lookups else "–")
+            
+            # The page render in progress is still open, so the latest trace is a finished operation
+            traces = telemetry.get_recent_traces(limit=1)
+            if traces:
+                st.markdown(f"**🔍 Latest Trace** ({traces[0]['started_at'][11:19]})")
+                st.markdown("<br>".join(_trace_lines(traces[0])), unsafe_allow_html=True)
+            
+            if st.checkbox("Show Prometheus metrics", key="show_prometheus_metrics"):
+                st.code(telemetry.render_prometheus(), language="text")
+
 def show_header():
     """Display application header"""
     st.markdown(f"""
@@ -684,6 +750,21 @@ def show_chat_message(role, content, timestamp=None):
         st.markdown(content)
         st.markdown("</div></div>", unsafe_allow_html=True)
 
+def create_stream_renderer(placeholder, min_interval: float = 0.05):
+    """Create an on_token callback that renders streamed text into a placeholder"""
+    chunks = []
+    last_render = [0.0]
+    
+    def on_token(chunk: str):
+        chunks.append(chunk)
+        now = time.time()
+        # Throttle re-renders so long responses don't flood the frontend
+        if now - last_render[0] >= min_interval:
+            placeholder.markdown("".join(chunks) + " ▌")
+            last_render[0] = now
+    
+    return on_token
+
 def show_enhancement_phase(selected_model):
     """Show requirement enhancement phase with knowledge base integration"""
     st.markdown("### Requirements Enhancement")
@@ -693,9 +774,14 @@ def show_enhancement_phase(selected_model):
     
     with col2:
         # Import here to avoid circular imports
-        from services.knowledge_base import knowledge_base_service
+        from services.knowledge_base import knowledge_base_service, KB_STATUS_INITIALIZING
         
-        kb_status = "🟢 Enabled" if knowledge_base_service.is_initialized else "🔴 Disabled"
+        if knowledge_base_service.is_ready:
+            kb_status = "🟢 Enabled"
+        elif knowledge_base_service.status == KB_STATUS_INITIALIZING:
+            kb_status = "⏳ Warming up"
+        else:
+            kb_status = "🔴 Disabled"
         st.markdown(f"""
         <div class="kb-panel">
             <h4>🧠 AI Knowledge Base</h4>
@@ -719,22 +805,28 @@ def show_enhancement_phase(selected_model):
     with col1:
         # Initialize conversation if empty
         if not st.session_state.chat_history:
+            st.session_state.clarification_conversation = ConversationSummary()
+            stream_placeholder = st.empty()
             with st.spinner("🧠 Analyzing requirements with AI knowledge base..."):
                 # Try enhanced agent with knowledge base first
                 try:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    
-                    result = loop.run_until_complete(
-                        enhanced_requirement_agent.enhance_requirement_with_kb(
+                    result = run_sync_streaming(
+                        lambda emit: enhanced_requirement_agent.enhance_requirement_with_kb(
                             st.session_state.original_requirement,
-                            selected_model
-                        )
+                            selected_model,
+                            on_token=emit
+                        ),
+                        create_stream_renderer(stream_placeholder)
                     )
-                    loop.close()
+                    stream_placeholder.empty()
                     
                     if result['success']:
                         st.session_state.enhanced_requirement = result['enhanced_requirement']
+                        st.session_state.enhancement_kb_result = {
+                            "success": result.get('knowledge_base_used', False),
+                            "suggestions": result.get('kb_suggestions', []),
+                            "questions": result.get('clarification_questions', [])
+                        }
                         
                         # Add to chat history
                         st.session_state.chat_history.append({
@@ -792,19 +884,20 @@ def show_enhancement_phase(selected_model):
                     })
                     
                     # Get clarification from enhanced agent
+                    stream_placeholder = st.empty()
                     with st.spinner("🔄 Processing your input..."):
                         try:
-                            loop = asyncio.new_event_loop()
-                            asyncio.set_event_loop(loop)
-                            
-                            result = loop.run_until_complete(
-                                enhanced_requirement_agent.clarify_requirement_with_kb(
+                            result = run_sync_streaming(
+                                lambda emit: enhanced_requirement_agent.clarify_requirement_with_kb(
                                     st.session_state.enhanced_requirement,
                                     user_input.strip(),
-                                    selected_model
-                                )
+                                    selected_model,
+                                    on_token=emit,
+                                    conversation=st.session_state.clarification_conversation
+                                ),
+                                create_stream_renderer(stream_placeholder)
                             )
-                            loop.close()
+                            stream_placeholder.empty()
                             
                             if result['success']:
                                 st.session_state.enhanced_requirement = result['clarified_requirement']
@@ -842,6 +935,8 @@ def show_enhancement_phase(selected_model):
                 st.session_state.original_requirement = ''
                 st.session_state.enhanced_requirement = ''
                 st.session_state.chat_history = []
+                st.session_state.clarification_conversation = ConversationSummary()
+                st.session_state.enhancement_kb_result = None
                 st.session_state.review_result = None
                 st.rerun()
 
@@ -858,12 +953,17 @@ def show_review_phase(selected_model):
     
     # Auto-review if not done yet
     if not st.session_state.review_result:
+        stream_placeholder = st.empty()
         with st.spinner("🔍 Conducting quality assessment..."):
             review_result = review_agent.review_requirement(
                 st.session_state.enhanced_requirement, 
-                selected_model
+                selected_model,
+                on_token=create_stream_renderer(stream_placeholder),
+                # Re-analyze asks for a fresh review rather than the cached one
+                use_cache=not st.session_state.pop('force_fresh_review', False)
             )
             st.session_state.review_result = review_result
+        stream_placeholder.empty()
     
     # Display current requirement
     st.markdown("#### 📄 Enhanced Requirements")
@@ -931,7 +1031,7 @@ def show_review_phase(selected_model):
         st.error("Failed to generate quality assessment.")
     
     # Show improvements from knowledge base
-    show_requirement_improvements(st.session_state.enhanced_requirement)
+    show_requirement_improvements(st.session_state.enhanced_requirement, st.session_state.enhancement_kb_result)
     
     # Action buttons
     st.markdown("---")
@@ -945,6 +1045,7 @@ def show_review_phase(selected_model):
     with col2:
         if st.button("🔄 Re-analyze", use_container_width=True):
             st.session_state.review_result = None
+            st.session_state.force_fresh_review = True
             st.rerun()
     
     with col3:
@@ -954,11 +1055,16 @@ def show_review_phase(selected_model):
             st.session_state.original_requirement = ''
             st.session_state.enhanced_requirement = ''
             st.session_state.chat_history = []
+            st.session_state.clarification_conversation = ConversationSummary()
+            st.session_state.enhancement_kb_result = None
             st.session_state.review_result = None
             st.rerun()
 
-def show_requirement_improvements(requirement_text: str):
-    """Show AI-suggested requirement improvements"""
+def show_requirement_improvements(requirement_text: str, kb_result: dict = None):
+    """Show AI-suggested requirement improvements
+
+    kb_result is the enhancement's knowledge base result; passing it avoids a second query.
+    """
     try:
         # Import here to avoid circular imports
         from services.knowledge_base import knowledge_base_service
@@ -967,13 +1073,9 @@ def show_requirement_improvements(requirement_text: str):
             return
         
         with st.spinner("🧠 Analyzing improvement opportunities..."):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            improvement_result = loop.run_until_complete(
-                enhanced_requirement_agent.suggest_requirement_improvements(requirement_text)
+            improvement_result = run_sync(
+                enhanced_requirement_agent.suggest_requirement_improvements(requirement_text, kb_result)
             )
-            loop.close()
             
         if improvement_result.get('success'):
             improvement_data = improvement_result['improvements']
@@ -1017,46 +1119,31 @@ def show_requirement_improvements(requirement_text: str):
     except Exception as e:
         # Silently fail for now
         pass
-    finally:
-        if 'loop' in locals():
-            loop.close()
 
 def process_uploaded_documents(uploaded_files):
     """Process uploaded documents and add to knowledge base"""
     try:
         from services.knowledge_base import knowledge_base_service
         
-        processed_docs = []
-        failed_docs = []
-        duplicate_docs = []
+        progress_bar = st.progress(0.0, text="📖 Processing documents...")
         
-        with st.spinner("📖 Processing documents..."):
-            for file in uploaded_files:
-                try:
-                    # Extract text content based on file type
-                    text_content = extract_text_from_file(file)
-                    
-                    if text_content:
-                        # Use the new knowledge base service to add document
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        
-                        result = loop.run_until_complete(
-                            knowledge_base_service.add_document(file.name, text_content)
-                        )
-                        loop.close()
-                        
-                        if result['success']:
-                            processed_docs.append(file.name)
-                        elif result.get('duplicate'):
-                            duplicate_docs.append(file.name)
-                        else:
-                            failed_docs.append(f"{file.name}: {result['error']}")
-                    else:
-                        failed_docs.append(f"{file.name}: Failed to extract text content")
-                        
-                except Exception as e:
-                    failed_docs.append(f"{file.name}: {str(e)}")
+        def show_progress(event):
+            progress_bar.progress(
+                event['completed'] / event['total'],
+                text=f"📖 {event['completed']}/{event['total']} · {event['filename']} ({event['status']})"
+            )
+        
+        # Extraction, deduplication and indexing run as one batch on the shared loop
+        batch = [(file.name, file.getvalue()) for file in uploaded_files]
+        result = run_sync_streaming(
+            lambda emit: knowledge_base_service.add_documents(batch, progress_callback=emit),
+            show_progress
+        )
+        progress_bar.empty()
+        
+        processed_docs = [doc['filename'] for doc in result['added']]
+        duplicate_docs = result['duplicates']
+        failed_docs = [f"{item['filename']}: {item['error']}" for item in result['failed']]
         
         # Show detailed results - more compact for sidebar
         if processed_docs:
@@ -1087,79 +1174,6 @@ def process_uploaded_documents(uploaded_files):
         st.error(f"Processing failed: {str(e)}")
         logging.error(f"Document processing error: {e}")
 
-def extract_text_from_file(uploaded_file):
-    """Extract text content from uploaded file"""
-    try:
-        file_extension = uploaded_file.name.split('.')[-1].lower()
-        
-        if file_extension == 'txt':
-            # Text file
-            try:
-                return uploaded_file.getvalue().decode('utf-8')
-            except UnicodeDecodeError:
-                # Try different encodings
-                for encoding in ['latin-1', 'cp1252', 'iso-8859-1']:
-                    try:
-                        uploaded_file.seek(0)
-                        return uploaded_file.getvalue().decode(encoding)
-                    except:
-                        continue
-                st.warning(f"Could not decode text file {uploaded_file.name}")
-                return None
-        
-        elif file_extension == 'pdf':
-            # PDF file
-            try:
-                import pypdf
-                from io import BytesIO
-                
-                pdf_reader = pypdf.PdfReader(BytesIO(uploaded_file.getvalue()))
-                text_content = ""
-                
-                for page in pdf_reader.pages:
-                    text_content += page.extract_text() + "\n"
-                
-                if text_content.strip():
-                    return text_content.strip()
-                else:
-                    st.warning(f"No text content found in PDF {uploaded_file.name}")
-                    return None
-            
-            except ImportError:
-                st.warning("PDF processing requires pypdf. Install with: `pip install pypdf`")
-                return None
-            except Exception as e:
-                st.warning(f"Error processing PDF {uploaded_file.name}: {str(e)}")
-                return None
-        
-        elif file_extension in ['docx', 'doc']:
-            # Word document
-            try:
-                import docx2txt
-                from io import BytesIO
-                
-                text_content = docx2txt.process(BytesIO(uploaded_file.getvalue()))
-                if text_content and text_content.strip():
-                    return text_content.strip()
-                else:
-                    st.warning(f"No text content found in Word document {uploaded_file.name}")
-                    return None
-            
-            except ImportError:
-                st.warning("Word document processing requires docx2txt. Install with: `pip install docx2txt`")
-                return None
-            except Exception as e:
-                st.warning(f"Error processing Word document {uploaded_file.name}: {str(e)}")
-                return None
-        
-        else:
-            st.warning(f"Unsupported file type: {file_extension}")
-            return None
-    
-    except Exception as e:
-        st.error(f"Error extracting text from {uploaded_file.name}: {str(e)}")
-        return None
-
 def show_knowledge_graph_modal():
     """Display knowledge graph visualization modal"""
     if st.session_state.show_knowledge_graph:
@@ -1212,7 +1226,12 @@ def show_knowledge_graph_modal():
         # Generate and display the knowledge graph
         with st.spinner("🔄 Loading knowledge graph..."):
             try:
-                graph_data = get_knowledge_graph_data()
+                from services.knowledge_base import knowledge_base_service
+                from services.graph_cache import knowledge_graph_cache
+                
+                # Each layer is rebuilt only when the knowledge base or the option it depends on changes
+                graph_version = knowledge_base_service.data_version
+                graph_data = knowledge_graph_cache.get_data(graph_version, get_knowledge_graph_data)
                 
                 if graph_data:
                     # Display graph statistics
@@ -1223,6 +1242,12 @@ def show_knowledge_graph_modal():
                         st.metric("↔️ Edges", len(graph_data.get('edges', [])))
                     with col3:
                         st.metric("📊 Components", graph_data.get('components', 0))
+                    if graph_data.get('hidden_documents'):
+                        shown = Config.KNOWLEDGE_GRAPH_MAX_DOCUMENTS
+                        st.caption(
+                            f"Showing the {shown} of {shown + graph_data['hidden_documents']} documents with the "
+                            f"strongest similarity links (KNOWLEDGE_GRAPH_MAX_DOCUMENTS)"
+                        )
                     
                     # Graph visualization options
                     st.markdown("### 🎛️ Visualization Options")
@@ -1240,7 +1265,14 @@ def show_knowledge_graph_modal():
                         show_labels = st.checkbox("Show Node Labels", value=True, key="labels_check")
                     
                     # Generate and display the graph
-                    fig = create_knowledge_graph_visualization(graph_data, layout_type, show_labels)
+                    positions = knowledge_graph_cache.get_layout(
+                        graph_version, layout_type,
+                        lambda: compute_knowledge_graph_layout(graph_data, layout_type)
+                    )
+                    fig = knowledge_graph_cache.get_figure(
+                        graph_version, layout_type, show_labels,
+                        lambda: create_knowledge_graph_visualization(graph_data, layout_type, show_labels, positions)
+                    )
                     
                     if fig:
                         st.plotly_chart(fig, use_container_width=True, height=600)
@@ -1351,27 +1383,40 @@ def get_knowledge_graph_data():
 def create_document_based_knowledge_graph(docs):
     """Create a knowledge graph based on uploaded documents"""
     try:
+        from collections import Counter
+        from services.knowledge_base import knowledge_base_service
+        
         if not docs or len(docs) == 0:
             return None
         
         nodes = []
         edges = []
         
+        # Past the cap, keep the documents with the strongest similarity links
+        similar_edges = knowledge_base_service.get_similar_document_edges()
+        total_documents = len(docs)
+        if total_documents > Config.KNOWLEDGE_GRAPH_MAX_DOCUMENTS:
+            strength = Counter()
+            for source_hash, target_hash, score in similar_edges:
+                strength[source_hash] += score
+                strength[target_hash] += score
+            ranked = sorted(range(total_documents), key=lambda i: -strength[docs[i]['content_hash']])
+            docs = [docs[i] for i in sorted(ranked[:Config.KNOWLEDGE_GRAPH_MAX_DOCUMENTS])]
+        
         # Create document nodes
-        for i, doc in enumerate(docs[:15]):  # Limit to 15 documents for performance
+        doc_nodes = {}
+        for i, doc in enumerate(docs):
+            doc_id = f"doc_{i}"
+            doc_nodes[doc['content_hash']] = doc_id
             nodes.append({
-                'id': f"doc_{i}",
+                'id': doc_id,
                 'label': doc['filename'][:25] + "..." if len(doc['filename']) > 25 else doc['filename'],
                 'type': 'document',
                 'size': min(20, max(10, doc['file_size'] // 1000))  # Size based on file size
             })
         
         # Create file type nodes
-        file_types = {}
-        for doc in docs:
-            file_type = doc['file_type'].upper()
-            if file_type not in file_types:
-                file_types[file_type] = len([d for d in docs if d['file_type'] == doc['file_type']])
+        file_types = Counter(doc['file_type'].upper() for doc in docs)
         
         type_nodes = {}
         for file_type, count in file_types.items():
@@ -1412,11 +1457,10 @@ def create_document_based_knowledge_graph(docs):
             })
             keyword_nodes[keyword] = keyword_id
         
-        # Create edges between documents and file types
-        for i, doc in enumerate(docs[:15]):
-            doc_id = f"doc_{i}"
-            file_type = doc['file_type'].upper()
-            type_node_id = type_nodes.get(file_type)
+        # Create edges between documents and file types / topics
+        for doc in docs:
+            doc_id = doc_nodes[doc['content_hash']]
+            type_node_id = type_nodes.get(doc['file_type'].upper())
             
             if type_node_id:
                 edges.append({
@@ -1425,12 +1469,8 @@ def create_document_based_knowledge_graph(docs):
                     'label': 'file_type',
                     'type': 'classification'
                 })
-        
-        # Create edges between documents and topics
-        for i, doc in enumerate(docs[:15]):
-            doc_id = f"doc_{i}"
-            filename_lower = doc['filename'].lower()
             
+            filename_lower = doc['filename'].lower()
             for keyword, keyword_id in keyword_nodes.items():
                 if any(word in filename_lower for word in keyword.lower().split()):
                     edges.append({
@@ -1440,30 +1480,21 @@ def create_document_based_knowledge_graph(docs):
                         'type': 'semantic'
                     })
         
-        # Create connections between related documents
-        for i in range(len(docs) - 1):
-            if i >= 14:  # Limit to first 15 docs
-                break
-            for j in range(i + 1, min(len(docs), 15)):
-                doc1 = docs[i]
-                doc2 = docs[j]
-                
-                # Check if documents are related (same type or similar names)
-                if (doc1['file_type'] == doc2['file_type'] or 
-                    any(word in doc1['filename'].lower() and word in doc2['filename'].lower() 
-                        for word in ['system', 'requirements', 'management', 'trading', 'risk'])):
-                    
-                    edges.append({
-                        'source': f"doc_{i}",
-                        'target': f"doc_{j}",
-                        'label': 'related',
-                        'type': 'similarity'
-                    })
+        # Connect each document to its most similar documents by content
+        for source_hash, target_hash, score in similar_edges:
+            if source_hash in doc_nodes and target_hash in doc_nodes:
+                edges.append({
+                    'source': doc_nodes[source_hash],
+                    'target': doc_nodes[target_hash],
+                    'label': f"similar ({score:.2f})",
+                    'type': 'similarity'
+                })
         
         return {
             'nodes': nodes,
             'edges': edges,
-            'components': len(set([edge['source'] for edge in edges] + [edge['target'] for edge in edges]))
+            'components': len(set([edge['source'] for edge in edges] + [edge['target'] for edge in edges])),
+            'hidden_documents': total_documents - len(docs)
         }
         
     except Exception as e:
@@ -1475,40 +1506,67 @@ def create_sample_knowledge_graph():
     # This function is now replaced by create_document_based_knowledge_graph
     return None
 
-def create_knowledge_graph_visualization(graph_data, layout="spring", show_labels=True):
-    """Create interactive knowledge graph visualization using plotly"""
+def build_knowledge_graph(graph_data):
+    """Build a NetworkX graph and a node lookup from graph data"""
+    import networkx as nx
+    
+    G = nx.Graph()
+    
+    # Add nodes
+    node_info = {}
+    for node in graph_data['nodes']:
+        G.add_node(node['id'])
+        node_info[node['id']] = node
+    
+    # Add edges
+    for edge in graph_data['edges']:
+        if edge['source'] in node_info and edge['target'] in node_info:
+            G.add_edge(edge['source'], edge['target'])
+    
+    return G, node_info
+
+def compute_knowledge_graph_layout(graph_data, layout="spring"):
+    """Calculate node positions for a layout algorithm"""
     try:
-        import plotly.graph_objects as go
-        import plotly.express as px
         import networkx as nx
-        import numpy as np
         
         if not graph_data or not graph_data.get('nodes'):
             return None
         
-        # Create NetworkX graph
-        G = nx.Graph()
-        
-        # Add nodes
-        node_info = {}
-        for node in graph_data['nodes']:
-            G.add_node(node['id'])
-            node_info[node['id']] = node
-        
-        # Add edges
-        for edge in graph_data['edges']:
-            if edge['source'] in node_info and edge['target'] in node_info:
-                G.add_edge(edge['source'], edge['target'])
+        G, _ = build_knowledge_graph(graph_data)
         
         # Calculate layout
         if layout == "spring":
-            pos = nx.spring_layout(G, k=1, iterations=50)
+            return nx.spring_layout(G, k=1, iterations=50)
         elif layout == "circular":
-            pos = nx.circular_layout(G)
+            return nx.circular_layout(G)
         elif layout == "kamada_kawai":
-            pos = nx.kamada_kawai_layout(G)
+            return nx.kamada_kawai_layout(G)
         else:
-            pos = nx.random_layout(G)
+            return nx.random_layout(G)
+        
+    except ImportError:
+        return None
+    except Exception as e:
+        logging.error(f"Layout error: {e}")
+        return None
+
+def create_knowledge_graph_visualization(graph_data, layout="spring", show_labels=True, positions=None):
+    """Create interactive knowledge graph visualization using plotly"""
+    try:
+        import plotly.graph_objects as go
+        import networkx as nx
+        
+        if not graph_data or not graph_data.get('nodes'):
+            return None
+        
+        # Create NetworkX graph
+        G, node_info = build_knowledge_graph(graph_data)
+        
+        # Reuse precomputed positions when given
+        pos = positions if positions is not None else compute_knowledge_graph_layout(graph_data, layout)
+        if pos is None:
+            return None
         
         # Extract coordinates
         x_nodes = [pos[node][0] for node in G.nodes()]
@@ -1669,24 +1727,32 @@ def main():
     """Main function"""
     initialize_session_state()
     
+    # Warm the knowledge base in the background; the page renders immediately
+    from services.knowledge_base import knowledge_base_service
+    knowledge_base_service.start()
+    
     # Check if knowledge graph modal should be shown
     if st.session_state.show_knowledge_graph:
-        show_knowledge_graph_modal()
+        with telemetry.span("ui.render", phase="knowledge_graph"):
+            show_knowledge_graph_modal()
         return  # Don't show other content when modal is open
     
-    show_header()
-    show_phase_indicator()
-    
-    # Sidebar with settings
-    selected_model = show_model_selector()
-    
-    # Main content based on current phase
-    if st.session_state.current_phase == 'input':
-        show_welcome_screen()
-    elif st.session_state.current_phase == 'enhance':
-        show_enhancement_phase(selected_model)
-    elif st.session_state.current_phase == 'review':
-        show_review_phase(selected_model)
+    # Agent calls made while rendering become children of this span
+    with telemetry.span("ui.render", phase=st.session_state.current_phase):
+        show_header()
+        show_phase_indicator()
+        
+        # Sidebar with settings
+        selected_model = show_model_selector()
+        show_diagnostics_panel()
+        
+        # Main content based on current phase
+        if st.session_state.current_phase == 'input':
+            show_welcome_screen()
+        elif st.session_state.current_phase == 'enhance':
+            show_enhancement_phase(selected_model)
+        elif st.session_state.current_phase == 'review':
+            show_review_phase(selected_model)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -2,6 +2,10 @@
 """
 AI Requirements Management System Startup Script
 Run 'python run.py' to start the application
+Run 'python run.py api' to start the headless HTTP API instead
+Run 'python run.py review <dir or .jsonl>' to review a batch of requirements
+Run 'python run.py mock' to start the local mock OpenAI/Anthropic provider
+Run 'python run.py bench' to benchmark the workflow against the mock provider
 """
 
 import subprocess
@@ -80,15 +84,81 @@ def start_application():
         print(f"❌ Startup failed: {e}")
         sys.exit(1)
 
+def start_api_server():
+    """Start the headless HTTP API"""
+    from config import Config
+    
+    print("\n🚀 Starting AI Requirements Management System API...")
+    print(f"📍 API: http://{Config.API_HOST}:{Config.API_PORT}")
+    print(f"📖 Interactive docs: http://{Config.API_HOST}:{Config.API_PORT}/docs")
+    print("   - Press Ctrl+C to stop the server")
+    print("\n" + "="*50)
+    
+    try:
+        # One worker: the knowledge base and its caches live in-process
+        subprocess.run([
+            sys.executable, "-m", "uvicorn", "api.server:app",
+            f"--host={Config.API_HOST}",
+            f"--port={Config.API_PORT}",
+            "--workers=1"
+        ], check=True)
+    except KeyboardInterrupt:
+        print("\n👋 API server stopped")
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Startup failed: {e}")
+        sys.exit(1)
+
+def start_mock_provider():
+    """Start the local OpenAI/Anthropic-compatible mock provider"""
+    from config import Config
+    
+    base = f"http://{Config.MOCK_LLM_HOST}:{Config.MOCK_LLM_PORT}"
+    print("\n🧪 Starting mock LLM provider...")
+    print(f"📍 OpenAI-compatible: {base}/v1/chat/completions")
+    print(f"📍 Anthropic-compatible: {base}/v1/messages")
+    print("💡 Point the app at it with:")
+    print(f"   OPENAI_BASE_URL={base}/v1  ANTHROPIC_BASE_URL={base}")
+    print("   OPENAI_API_KEY=mock  ANTHROPIC_API_KEY=mock")
+    print("\n" + "="*50)
+    
+    try:
+        subprocess.run([
+            sys.executable, "-m", "uvicorn", "api.mock_provider:app",
+            f"--host={Config.MOCK_LLM_HOST}",
+            f"--port={Config.MOCK_LLM_PORT}",
+            "--log-level=warning"
+        ], check=True)
+    except KeyboardInterrupt:
+        print("\n👋 Mock provider stopped")
+    except subprocess.CalledProcessError as e:
+        print(f"❌ Startup failed: {e}")
+        sys.exit(1)
+
 def main():
     """Main function"""
+    mode = sys.argv[1] if len(sys.argv) > 1 else "ui"
+    if mode not in ("ui", "api", "review", "mock", "bench"):
+        print(f"❌ Unknown mode '{mode}', use 'ui' (default), 'api', 'review', 'mock' or 'bench'")
+        sys.exit(1)
+    
     print("🤖 AI Requirements Management System")
     print("="*50)
     
     check_python_version()
     check_requirements()
     check_env_file()
-    start_application()
+    if mode == "api":
+        start_api_server()
+    elif mode == "mock":
+        start_mock_provider()
+    elif mode == "review":
+        from services.batch_review import main as run_batch_review
+        run_batch_review(sys.argv[2:])
+    elif mode == "bench":
+        from benchmarks.workflow import main as run_benchmark
+        run_benchmark(sys.argv[2:])
+    else:
+        start_application()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
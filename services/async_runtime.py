@@ -0,0 +1,174 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import queue
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+_STREAM_DONE = object()
+
+async def _in_context(awaitable: Awaitable[T], context: contextvars.Context) -> T:
+    """Await in a task that starts with the submitting thread's context variables"""
+    for variable, value in context.items():
+        variable.set(value)
+    return await awaitable
+
+class AsyncRuntime:
+    """Long-lived background event loop shared by all synchronous callers
+
+    Streamlit reruns the script on every interaction, so creating a loop per
+    call throws away connection pools and LightRAG's async state. Everything
+    async runs here instead, on one loop that lives for the whole process.
+    """
+
+    def __init__(self, name: str = "async-runtime"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._shutdown_hooks: List[Callable[[], None]] = []
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The shared event loop, started on first use"""
+        self._ensure_started()
+        return self._loop
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=self._run_loop, args=(loop,), name=self.name, daemon=True)
+            self._loop = loop
+            self._thread = thread
+            thread.start()
+            logging.info(f"Started shared event loop thread '{self.name}'")
+
+    def _run_loop(self, loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def in_runtime_thread(self) -> bool:
+        """Whether the caller is running on the shared loop's thread"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> "concurrent.futures.Future[T]":
+        """Schedule a coroutine on the shared loop without waiting for it
+
+        The coroutine sees the caller's context variables (the current
+        telemetry span, LLM priority), as it would if awaited directly.
+        """
+        return asyncio.run_coroutine_threadsafe(_in_context(coro, contextvars.copy_context()), self.loop)
+
+    def run_sync(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """Run a coroutine on the shared loop and block until it finishes"""
+        if self.in_runtime_thread():
+            # Blocking here would deadlock the loop we are waiting on
+            coro.close()
+            raise RuntimeError("run_sync() called from the shared event loop; await the coroutine instead")
+        return self.submit(coro).result(timeout)
+
+    async def run_async(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Await a coroutine on the shared loop from a different event loop
+
+        Services keep loop-bound state (LightRAG, pooled HTTP clients), so
+        callers on another loop, such as the HTTP API, hand their work over
+        instead of running it locally. Cancelling the await cancels the work.
+        """
+        if self.in_runtime_thread():
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def run_sync_streaming(self, coro_factory: Callable[[Callable[[Any], None]], Awaitable[T]],
+                           on_item: Callable[[Any], None], timeout: Optional[float] = None) -> T:
+        """Run a coroutine that emits items through a callback, relaying them to the calling thread
+
+        coro_factory receives a thread-safe emit function. on_item is invoked on
+        the calling thread for each emitted item, which matters for UI code
+        (Streamlit elements can only be updated from the script thread).
+        timeout bounds the wait for each item; if it runs out, or on_item
+        raises, the coroutine is cancelled.
+        """
+        items = queue.SimpleQueue()
+
+        async def relay():
+            try:
+                return await coro_factory(items.put)
+            finally:
+                items.put(_STREAM_DONE)
+
+        future = self.submit(relay())
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"no streamed item within {timeout:g}s") from None
+                if item is _STREAM_DONE:
+                    break
+                on_item(item)
+        except BaseException:
+            future.cancel()
+            raise
+
+        return future.result()
+
+    def iterate_sync(self, stream: AsyncIterator[T]) -> Iterator[T]:
+        """Iterate an async generator from synchronous code"""
+        try:
+            while True:
+                try:
+                    yield self.run_sync(stream.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            self.run_sync(stream.aclose())
+
+    def add_shutdown_hook(self, hook: Callable[[], None]):
+        """Call hook from shutdown() while the loop still runs, e.g. to close pooled clients"""
+        self._shutdown_hooks.append(hook)
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stop the shared loop (mainly for scripts and tests)"""
+        if self._loop is not None:
+            # Outside the lock: hooks may run work on the loop
+            for hook in self._shutdown_hooks:
+                try:
+                    hook()
+                except Exception as e:
+                    logging.warning(f"Shutdown hook failed: {e}")
+
+        with self._lock:
+            if self._loop is None or self._thread is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+            self._loop = None
+            self._thread = None
+
+# Create global async runtime instance
+async_runtime = AsyncRuntime()
+
+def run_sync(coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+    """Run a coroutine on the shared event loop from synchronous code"""
+    return async_runtime.run_sync(coro, timeout)
+
+async def run_async(coro: Coroutine[Any, Any, T]) -> T:
+    """Await a coroutine on the shared event loop from another event loop"""
+    return await async_runtime.run_async(coro)
+
+def run_sync_streaming(coro_factory: Callable[[Callable[[Any], None]], Awaitable[T]],
+                       on_item: Callable[[Any], None], timeout: Optional[float] = None) -> T:
+    """Run a streaming coroutine on the shared event loop, relaying items to the calling thread"""
+    return async_runtime.run_sync_streaming(coro_factory, on_item, timeout)
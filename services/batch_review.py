@@ -0,0 +1,200 @@
+"""
+Batch requirement review runner
+
+Reviews every requirement in a directory or JSONL file with ReviewAgent and
+appends one JSON line per result to an output file as soon as it finishes.
+Re-running with the same output file skips requirements that already have a
+successful result, so an interrupted run resumes where it stopped.
+
+    python run.py review ./specs --output reviews.jsonl --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from config import Config
+from agents.review_agent import review_agent
+from services.async_runtime import run_sync
+from services.llm_service import llm_service
+from services.rate_limit import PRIORITY_BATCH, llm_priority
+from services.text_extraction import SUPPORTED_FILE_TYPES, extract_text, get_file_type
+
+def load_review_inputs(path: str) -> List[Dict[str, Any]]:
+    """Read requirements from a directory of documents or a JSONL file
+
+    JSONL lines need a "requirement" (or "text") field and may carry "id" and
+    "model"; ids default to the line number. Directory entries are keyed by
+    their path relative to the directory.
+    """
+    source = Path(path)
+    items = []
+
+    if source.is_dir():
+        for file_path in sorted(p for p in source.rglob("*") if p.is_file()):
+            if get_file_type(file_path.name) not in SUPPORTED_FILE_TYPES:
+                continue
+            text, error = extract_text(file_path.name, file_path.read_bytes())
+            item_id = file_path.relative_to(source).as_posix()
+            if error:
+                logging.warning(f"Skipping {item_id}: {error}")
+                continue
+            items.append({"id": item_id, "requirement": text, "source": str(file_path)})
+        return items
+
+    with open(source, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                logging.warning(f"Skipping line {line_number} of {source}: invalid JSON ({e})")
+                continue
+            if not isinstance(record, dict):
+                logging.warning(f"Skipping line {line_number} of {source}: not a JSON object")
+                continue
+            text = record.get("requirement") or record.get("text")
+            if not text:
+                logging.warning(f"Skipping line {line_number} of {source}: no requirement text")
+                continue
+            items.append({
+                "id": str(record.get("id", line_number)),
+                "requirement": text,
+                "model": record.get("model"),
+                "source": f"{source}:{line_number}"
+            })
+    return items
+
+def completed_ids(output_path: str) -> Set[str]:
+    """Ids that already have a successful result in an output file"""
+    done = set()
+    path = Path(output_path)
+    if not path.exists():
+        return done
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run is simply retried
+                continue
+            if record.get("success"):
+                done.add(str(record.get("id")))
+    return done
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, 'rb') as f:
+        f.seek(-1, 2)
+        return f.read(1) == b"\n"
+
+class BatchReviewRunner:
+    """Runs reviews with bounded concurrency
+
+    Provider rate limits are enforced by LLMService; batch reviews run at
+    batch priority so interactive traffic sharing the process goes first.
+    """
+
+    def __init__(self, concurrency: int = None, model: str = None, use_cache: bool = True):
+        self.concurrency = concurrency or Config.BATCH_REVIEW_CONCURRENCY
+        self.model = model or Config.DEFAULT_MODEL
+        self.use_cache = use_cache
+
+    async def _review(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        model = item.get("model") or self.model
+
+        started = time.perf_counter()
+        with llm_priority(PRIORITY_BATCH):
+            result = await review_agent.review_requirement_async(item["requirement"], model, use_cache=self.use_cache)
+        record = {
+            "id": item["id"],
+            "source": item.get("source"),
+            "model": model,
+            "success": result.get("success", False),
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+            "finished_at": datetime.now().isoformat()
+        }
+
+        if record["success"]:
+            review = result["review"]
+            record["score"] = review.get("score") if isinstance(review, dict) else None
+            record["issue_count"] = len(review.get("issues", [])) if isinstance(review, dict) else None
+            record["review"] = review
+        else:
+            record["error"] = result.get("error")
+        return record
+
+    async def run(self, items: List[Dict[str, Any]], output_path: str, resume: bool = True,
+                  on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Review items, appending each result to output_path as it finishes"""
+        skipped = completed_ids(output_path) if resume else set()
+        pending = [item for item in items if item["id"] not in skipped]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        summary = {"total": len(items), "skipped": len(items) - len(pending), "succeeded": 0, "failed": 0}
+        scores = []
+
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'a' if resume else 'w', encoding='utf-8') as output:
+            if output.tell() > 0 and not _ends_with_newline(output_path):
+                # Terminate a line cut short by an interrupted run
+                output.write("\n")
+
+            async def review_one(item):
+                async with semaphore:
+                    try:
+                        record = await self._review(item)
+                    except Exception as e:
+                        record = {"id": item["id"], "source": item.get("source"), "success": False,
+                                  "error": str(e), "finished_at": datetime.now().isoformat()}
+
+                # Only the event loop thread writes, so lines never interleave
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+
+                if record["success"]:
+                    summary["succeeded"] += 1
+                    if isinstance(record.get("score"), (int, float)):
+                        scores.append(record["score"])
+                else:
+                    summary["failed"] += 1
+                if on_result:
+                    on_result(record)
+
+            started = time.perf_counter()
+            await asyncio.gather(*[review_one(item) for item in pending])
+
+        summary["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+        summary["average_score"] = round(sum(scores) / len(scores), 2) if scores else None
+        summary["rate_limits"] = llm_service.get_rate_limit_stats()
+        return summary
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Review a batch of requirements and write JSONL results")
+    parser.add_argument("input", help="Directory of requirement documents or a JSONL file")
+    parser.add_argument("--output", "-o", default="review_results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", "-c", type=int, default=Config.BATCH_REVIEW_CONCURRENCY)
+    parser.add_argument("--model", "-m", default=Config.DEFAULT_MODEL, help="openai, anthropic or demo")
+    parser.add_argument("--no-resume", action="store_true", help="Overwrite the output instead of resuming")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache")
+    args = parser.parse_args(argv)
+
+    items = load_review_inputs(args.input)
+    runner = BatchReviewRunner(concurrency=args.concurrency, model=args.model, use_cache=not args.no_cache)
+
+    def report(record):
+        status = f"score {record.get('score')}" if record["success"] else f"failed: {record.get('error')}"
+        print(f"{'✅' if record['success'] else '❌'} {record['id']} ({status})")
+
+    print(f"📋 Reviewing {len(items)} requirements with {args.model} (concurrency {runner.concurrency})")
+    summary = run_sync(runner.run(items, args.output, resume=not args.no_resume, on_result=report))
+    print(f"\n📊 {json.dumps(summary, indent=2)}")
+    return summary
+
+if __name__ == "__main__":
+    main()
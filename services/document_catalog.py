@@ -0,0 +1,388 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Columns of the documents table, in UploadedDocument field order
+DOCUMENT_COLUMNS = (
+    "filename",
+    "content_hash",
+    "upload_time",
+    "file_size",
+    "file_type",
+    "content_preview",
+    "stored_path"
+)
+
+class DocumentCatalog:
+    """SQLite-backed catalogue of uploaded document metadata
+    
+    Every add and remove is its own transaction, so the catalogue never has to
+    be rewritten as a whole and a crash can't leave it half-written. Rows are
+    returned as plain dicts; callers build their own record types from them.
+    """
+    
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                content_hash TEXT NOT NULL UNIQUE,
+                filename TEXT NOT NULL,
+                upload_time TEXT NOT NULL,
+                file_size INTEGER NOT NULL,
+                file_type TEXT NOT NULL,
+                content_preview TEXT NOT NULL,
+                stored_path TEXT NOT NULL DEFAULT ''
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents(filename)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS document_signatures (
+                content_hash TEXT PRIMARY KEY,
+                signature BLOB NOT NULL
+            )
+        """)
+        # LightRAG items (doc, chunk, entity, relation ids) created by each ingested
+        # source; rows of removed sources stay flagged as deleted until compaction
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS index_items (
+                owner TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                item_id TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (owner, kind, item_id)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_index_items_item ON index_items(kind, item_id)")
+        # Content hashes (seed knowledge and documents) already inserted into LightRAG;
+        # each ingested batch is one small transaction here rather than a manifest rewrite
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_manifest (
+                content_hash TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                ingested_at TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS catalog_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        
+        # Bumped on every change so caches built from the catalogue know when to refresh
+        self.version = int(self.get_meta("version", "0"))
+        # Bumped on every change to the indexed content (inserts, tombstones,
+        # compaction, ingest manifest writes); the document count can stay the
+        # same across such changes, so it can't stand in for this
+        self.index_version = int(self.get_meta("index_version", "0"))
+    
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {column: row[column] for column in DOCUMENT_COLUMNS}
+    
+    def _fetchall(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        # The connection is shared between the UI thread and the event loop thread
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+    
+    def _fetchone(self, sql: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+        rows = self._fetchall(sql, params)
+        return rows[0] if rows else None
+    
+    def _bump_version(self):
+        self.version += 1
+        self._conn.execute(
+            "INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('version', ?)", (str(self.version),)
+        )
+    
+    def _bump_index_version(self):
+        self.index_version += 1
+        self._conn.execute(
+            "INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('index_version', ?)", (str(self.index_version),)
+        )
+    
+    def bump_index_version(self):
+        """Record a change to the indexed content made outside the catalogue"""
+        with self._lock:
+            self._bump_index_version()
+    
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self._fetchone("SELECT value FROM catalog_meta WHERE key = ?", (key,))
+        return row["value"] if row is not None else default
+    
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO catalog_meta (key, value) VALUES (?, ?)", (key, value)
+            )
+    
+    def add_many(self, documents: Iterable[Dict[str, Any]]) -> int:
+        """Insert documents in a single transaction, skipping hashes already present"""
+        rows = [tuple(doc.get(column, "") for column in DOCUMENT_COLUMNS) for doc in documents]
+        if not rows:
+            return 0
+        
+        placeholders = ", ".join("?" * len(DOCUMENT_COLUMNS))
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    f"INSERT OR IGNORE INTO documents ({', '.join(DOCUMENT_COLUMNS)}) VALUES ({placeholders})",
+                    rows
+                )
+                inserted = self._conn.total_changes - before
+                if inserted:
+                    self._bump_version()
+                self._conn.execute("COMMIT")
+                return inserted
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def add(self, document: Dict[str, Any]) -> bool:
+        """Insert one document; returns False if its content hash is already catalogued"""
+        return self.add_many([document]) == 1
+    
+    def remove(self, content_hash: str) -> bool:
+        """Delete one document by content hash"""
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                cursor = self._conn.execute("DELETE FROM documents WHERE content_hash = ?", (content_hash,))
+                self._conn.execute("DELETE FROM document_signatures WHERE content_hash = ?", (content_hash,))
+                if cursor.rowcount:
+                    self._bump_version()
+                self._conn.execute("COMMIT")
+                return cursor.rowcount > 0
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def update_stored_paths(self, stored_paths: Dict[str, str]):
+        """Set stored_path for several documents, keyed by content hash"""
+        if not stored_paths:
+            return
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(
+                    "UPDATE documents SET stored_path = ? WHERE content_hash = ?",
+                    [(path, content_hash) for content_hash, path in stored_paths.items()]
+                )
+                self._bump_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def put_signatures(self, signatures: Dict[str, bytes]):
+        """Store similarity signatures for several documents in one transaction"""
+        if not signatures:
+            return
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO document_signatures (content_hash, signature) VALUES (?, ?)",
+                    list(signatures.items())
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def get_signatures(self) -> Dict[str, bytes]:
+        """Similarity signatures of all catalogued documents"""
+        rows = self._fetchall(
+            "SELECT s.content_hash, s.signature FROM document_signatures s "
+            "JOIN documents d ON d.content_hash = s.content_hash"
+        )
+        return {row["content_hash"]: row["signature"] for row in rows}
+    
+    def track_index_items(self, items: Dict[str, List[Tuple[str, str]]]):
+        """Record the index items created by each owner, marking them live"""
+        rows = [(owner, kind, item_id) for owner, owner_items in items.items() for kind, item_id in owner_items]
+        if not rows:
+            return
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO index_items (owner, kind, item_id, deleted) VALUES (?, ?, ?, 0)", rows
+                )
+                self._bump_index_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def set_index_items_deleted(self, owner: str, deleted: bool = True) -> int:
+        """Flag (or unflag) every index item of an owner as deleted"""
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                cursor = self._conn.execute(
+                    "UPDATE index_items SET deleted = ? WHERE owner = ?", (1 if deleted else 0, owner)
+                )
+                if cursor.rowcount:
+                    self._bump_index_version()
+                self._conn.execute("COMMIT")
+                return cursor.rowcount
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def get_index_items(self, kind: str) -> List[Tuple[str, str]]:
+        """(owner, item_id) pairs of live items of one kind"""
+        rows = self._fetchall("SELECT owner, item_id FROM index_items WHERE kind = ? AND deleted = 0", (kind,))
+        return [(row["owner"], row["item_id"]) for row in rows]
+    
+    def get_tracked_owners(self) -> Set[str]:
+        return {row["owner"] for row in self._fetchall("SELECT DISTINCT owner FROM index_items")}
+    
+    def get_dead_index_items(self) -> Dict[str, Set[str]]:
+        """Items whose every owner has been deleted, grouped by kind"""
+        dead: Dict[str, Set[str]] = {}
+        for row in self._fetchall(
+            "SELECT kind, item_id FROM index_items GROUP BY kind, item_id HAVING MIN(deleted) = 1"
+        ):
+            dead.setdefault(row["kind"], set()).add(row["item_id"])
+        return dead
+    
+    def get_deleted_index_items(self) -> Tuple[Set[str], Dict[str, Set[str]]]:
+        """Deleted owners and all the items they created, grouped by kind"""
+        owners: Set[str] = set()
+        items: Dict[str, Set[str]] = {}
+        for row in self._fetchall("SELECT owner, kind, item_id FROM index_items WHERE deleted = 1"):
+            owners.add(row["owner"])
+            items.setdefault(row["kind"], set()).add(row["item_id"])
+        return owners, items
+    
+    def purge_index_items(self, owners: Iterable[str]):
+        """Forget the tracked items of owners whose data has been compacted away"""
+        rows = [(owner,) for owner in owners]
+        if not rows:
+            return
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany("DELETE FROM index_items WHERE owner = ? AND deleted = 1", rows)
+                self._bump_index_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def record_ingested(self, sources: Dict[str, str]):
+        """Mark content hashes as inserted into LightRAG, with the source each came from"""
+        if not sources:
+            return
+        ingested_at = datetime.now().isoformat()
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO ingest_manifest (content_hash, source, ingested_at) VALUES (?, ?, ?)",
+                    [(content_hash, source, ingested_at) for content_hash, source in sources.items()]
+                )
+                self._bump_index_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def remove_ingested(self, content_hashes: Iterable[str]) -> int:
+        """Forget content that has been removed from LightRAG"""
+        rows = [(content_hash,) for content_hash in content_hashes]
+        if not rows:
+            return 0
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                before = self._conn.total_changes
+                self._conn.executemany("DELETE FROM ingest_manifest WHERE content_hash = ?", rows)
+                removed = self._conn.total_changes - before
+                if removed:
+                    self._bump_index_version()
+                self._conn.execute("COMMIT")
+                return removed
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def clear_ingested(self):
+        """Forget everything inserted into LightRAG, when its stores are deleted"""
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                cursor = self._conn.execute("DELETE FROM ingest_manifest")
+                if cursor.rowcount:
+                    self._bump_index_version()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def is_ingested(self, content_hash: str) -> bool:
+        row = self._fetchone("SELECT 1 FROM ingest_manifest WHERE content_hash = ?", (content_hash,))
+        return row is not None
+    
+    def get_ingested_hashes(self) -> Set[str]:
+        return {row["content_hash"] for row in self._fetchall("SELECT content_hash FROM ingest_manifest")}
+    
+    def contains(self, content_hash: str) -> bool:
+        row = self._fetchone("SELECT 1 FROM documents WHERE content_hash = ?", (content_hash,))
+        return row is not None
+    
+    def get_by_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        row = self._fetchone("SELECT * FROM documents WHERE content_hash = ?", (content_hash,))
+        return self._row_to_dict(row) if row is not None else None
+    
+    def get_by_filename(self, filename: str) -> Optional[Dict[str, Any]]:
+        """Oldest document uploaded under this filename"""
+        row = self._fetchone("SELECT * FROM documents WHERE filename = ? ORDER BY id LIMIT 1", (filename,))
+        return self._row_to_dict(row) if row is not None else None
+    
+    def list_documents(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Documents in upload order, one page at a time"""
+        rows = self._fetchall(
+            "SELECT * FROM documents ORDER BY id LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset)
+        )
+        return [self._row_to_dict(row) for row in rows]
+    
+    def count(self) -> int:
+        return self._fetchone("SELECT COUNT(*) FROM documents")[0]
+    
+    def get_summary(self) -> Dict[str, Any]:
+        """Aggregate counts and sizes computed by SQLite"""
+        totals = self._fetchone("SELECT COUNT(*), COALESCE(SUM(file_size), 0) FROM documents")
+        file_types = {
+            row["file_type"]: row["count"]
+            for row in self._fetchall("SELECT file_type, COUNT(*) AS count FROM documents GROUP BY file_type")
+        }
+        latest = self._fetchone("SELECT upload_time FROM documents ORDER BY id DESC LIMIT 1")
+        return {
+            "total_documents": totals[0],
+            "total_size_bytes": totals[1],
+            "file_types": file_types,
+            "latest_upload": latest["upload_time"] if latest is not None else None
+        }
+    
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception as e:
+                logging.warning(f"Failed to close document catalogue: {e}")
@@ -0,0 +1,159 @@
+import hashlib
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Modulus for the universal hash family; with 31-bit multipliers and 32-bit
+# shingle hashes, a * x + b stays inside uint64
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SHINGLE_BLOCK = 8192
+
+class MinHasher:
+    """MinHash signatures over word shingles
+
+    Two signatures agree at a position with probability equal to the Jaccard
+    similarity of the documents' shingle sets, so similarity can be estimated
+    without keeping any text around.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+
+    def _shingle_hashes(self, text: str) -> np.ndarray:
+        tokens = re.findall(r"\w+", text.lower())
+        if len(tokens) >= self.shingle_size:
+            shingles = {
+                " ".join(tokens[i:i + self.shingle_size])
+                for i in range(len(tokens) - self.shingle_size + 1)
+            }
+        else:
+            shingles = set(tokens)
+
+        return np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), "little") for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of a document's text"""
+        hashes = self._shingle_hashes(text)
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+
+        # Work through shingles in blocks so huge documents don't allocate num_perm x n at once
+        for start in range(0, len(hashes), _SHINGLE_BLOCK):
+            block = hashes[start:start + _SHINGLE_BLOCK]
+            permuted = (np.outer(self._a, block) + self._b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+            np.minimum(signature, permuted.min(axis=1), out=signature)
+
+        return signature.astype(np.uint32)
+
+class SimilarityIndex:
+    """In-memory LSH index over MinHash signatures
+
+    Signatures are split into bands; documents sharing any band bucket become
+    candidates, and only candidates are compared. Adding or removing a
+    document touches just its own buckets.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+
+        self._lock = threading.Lock()
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [defaultdict(set) for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    @property
+    def threshold(self) -> float:
+        """Similarity at which a pair becomes a candidate about half the time"""
+        return (1.0 / self.bands) ** (1.0 / self.rows)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._signatures
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, doc_id: str, signature: np.ndarray):
+        with self._lock:
+            if doc_id in self._signatures:
+                self._remove_locked(doc_id)
+            self._signatures[doc_id] = signature
+            for band, key in self._band_keys(signature):
+                self._buckets[band][key].add(doc_id)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str):
+        signature = self._signatures.pop(doc_id, None)
+        if signature is None:
+            return
+        for band, key in self._band_keys(signature):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def neighbours(self, doc_id: str, top_k: int = 5, min_similarity: float = 0.0) -> List[Tuple[str, float]]:
+        """Most similar documents to doc_id by estimated Jaccard similarity"""
+        with self._lock:
+            signature = self._signatures.get(doc_id)
+            if signature is None:
+                return []
+            return self._neighbours_locked(doc_id, signature, top_k, min_similarity)
+
+    def query(self, signature: np.ndarray, top_k: int = 5, min_similarity: float = 0.0) -> List[Tuple[str, float]]:
+        """Most similar indexed documents to an arbitrary signature"""
+        with self._lock:
+            return self._neighbours_locked(None, signature, top_k, min_similarity)
+
+    def _neighbours_locked(self, doc_id: Optional[str], signature: np.ndarray, top_k: int,
+                           min_similarity: float) -> List[Tuple[str, float]]:
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        candidates.discard(doc_id)
+        if not candidates:
+            return []
+
+        candidate_ids = list(candidates)
+        matrix = np.stack([self._signatures[candidate] for candidate in candidate_ids])
+        scores = (matrix == signature).mean(axis=1)
+
+        order = np.argsort(-scores)[:top_k]
+        return [
+            (candidate_ids[i], float(scores[i]))
+            for i in order
+            if scores[i] >= min_similarity
+        ]
+
+    def top_k_edges(self, top_k: int = 5, min_similarity: float = 0.0,
+                    doc_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, str, float]]:
+        """Undirected edges from each document to its top-k neighbours"""
+        with self._lock:
+            ids = self._signatures.keys() if doc_ids is None else [d for d in doc_ids if d in self._signatures]
+            edges = {}
+            for doc_id in ids:
+                for other, score in self._neighbours_locked(doc_id, self._signatures[doc_id], top_k, min_similarity):
+                    key = (doc_id, other) if doc_id < other else (other, doc_id)
+                    edges[key] = score
+            return [(source, target, score) for (source, target), score in edges.items()]
@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import Config
+
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+if not SENTENCE_TRANSFORMERS_AVAILABLE:
+    logging.warning("sentence-transformers not available. Falling back to hashed bag-of-words embeddings.")
+
+# Model instance owned by each process pool worker
+_worker_model = None
+
+def _init_embedding_worker(model_name: str):
+    """Load the embedding model once per worker process"""
+    global _worker_model
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+def _encode_in_worker(texts: List[str], batch_size: int) -> np.ndarray:
+    """Encode texts inside a worker process"""
+    return _worker_model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    ).astype(np.float32)
+
+def _hashing_embed(texts: List[str], dim: int) -> np.ndarray:
+    """Deterministic hashed bag-of-words embeddings used when no model is installed"""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vectors[row, bucket] += sign
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class EmbeddingService:
+    """Local CPU embedding backend with batching, a persistent cache and a process pool for large inserts"""
+
+    def __init__(self, model_name: str = None, embedding_dim: int = None, batch_size: int = None,
+                 cache_path: str = None, process_pool_threshold: int = None, workers: int = None):
+        self.model_name = model_name or Config.EMBEDDING_MODEL
+        self.embedding_dim = embedding_dim or Config.EMBEDDING_DIM
+        self.batch_size = batch_size or Config.EMBEDDING_BATCH_SIZE
+        self.process_pool_threshold = process_pool_threshold or Config.EMBEDDING_PROCESS_POOL_THRESHOLD
+        self.workers = workers or Config.EMBEDDING_WORKERS
+        self.cache_path = Path(cache_path or Config.EMBEDDING_CACHE_PATH)
+
+        # Cache keys include the backend so switching models never serves stale vectors
+        self.backend = self.model_name if SENTENCE_TRANSFORMERS_AVAILABLE else f"hashing-{self.embedding_dim}"
+
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._cache_lock = threading.Lock()
+        self._conn = None
+        self.stats = {"cache_hits": 0, "cache_misses": 0, "computed": 0}
+
+        self._open_cache()
+
+    def _open_cache(self):
+        """Open the SQLite embedding cache"""
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.cache_path), check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL
+                )
+            """)
+        except Exception as e:
+            logging.warning(f"Embedding cache unavailable, embeddings will not persist: {e}")
+            self._conn = None
+
+    def _cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.backend}\0{text}".encode('utf-8')).hexdigest()
+
+    def _cache_get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Fetch cached vectors for the given keys"""
+        if self._conn is None or not keys:
+            return {}
+
+        found = {}
+        with self._cache_lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    if vector.shape[0] == self.embedding_dim:
+                        found[key] = vector
+        return found
+
+    def _cache_put_many(self, items: Dict[str, np.ndarray]):
+        """Persist computed vectors in one transaction"""
+        if self._conn is None or not items:
+            return
+
+        with self._cache_lock:
+            try:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.astype(np.float32).tobytes()) for key, vector in items.items()]
+                )
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                self._conn.execute("ROLLBACK")
+                logging.warning(f"Failed to write embedding cache: {e}")
+
+    def _get_model(self):
+        """Load the sentence-transformers model on first use"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name, device="cpu")
+                    model_dim = self._model.get_sentence_embedding_dimension()
+                    if model_dim != self.embedding_dim:
+                        raise ValueError(
+                            f"Embedding model {self.model_name} produces {model_dim}-dim vectors, "
+                            f"but EMBEDDING_DIM is {self.embedding_dim}"
+                        )
+                    logging.info(f"Loaded embedding model {self.model_name}")
+        return self._model
+
+    def _encode_local(self, texts: List[str]) -> np.ndarray:
+        """Encode texts in the current process"""
+        if not SENTENCE_TRANSFORMERS_AVAILABLE:
+            return _hashing_embed(texts, self.embedding_dim)
+
+        model = self._get_model()
+        with self._model_lock:
+            return model.encode(
+                texts,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            ).astype(np.float32)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_embedding_worker,
+                initargs=(self.model_name,)
+            )
+        return self._pool
+
+    async def _encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts off the event loop, fanning large inputs out to the process pool"""
+        loop = asyncio.get_running_loop()
+
+        use_pool = (
+            SENTENCE_TRANSFORMERS_AVAILABLE
+            and self.workers > 1
+            and len(texts) >= self.process_pool_threshold
+        )
+        if not use_pool:
+            return await loop.run_in_executor(None, self._encode_local, texts)
+
+        pool = self._get_pool()
+        shard_size = max(self.batch_size, -(-len(texts) // self.workers))
+        shards = [texts[i:i + shard_size] for i in range(0, len(texts), shard_size)]
+        results = await asyncio.gather(*[
+            loop.run_in_executor(pool, _encode_in_worker, shard, self.batch_size)
+            for shard in shards
+        ])
+        return np.vstack(results)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, computing only those not already in the cache"""
+        if not texts:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+
+        keys = [self._cache_key(text) for text in texts]
+        cached = self._cache_get_many(list(set(keys)))
+
+        # Deduplicate misses so repeated chunks are encoded once
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        self.stats["cache_hits"] += len(texts) - len(missing)
+        self.stats["cache_misses"] += len(missing)
+
+        if missing:
+            missing_keys = list(missing.keys())
+            vectors = await self._encode([missing[key] for key in missing_keys])
+            computed = dict(zip(missing_keys, vectors))
+            self.stats["computed"] += len(computed)
+            self._cache_put_many(computed)
+            cached.update(computed)
+
+        return np.vstack([cached[key] for key in keys]).astype(np.float32)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get embedding cache counters"""
+        return {**self.stats, "backend": self.backend}
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+# Create global embedding service instance
+embedding_service = EmbeddingService()
@@ -0,0 +1,86 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+class KnowledgeGraphCache:
+    """Layered cache for the knowledge graph view
+
+    Graph data, layout positions and figures are cached separately and all
+    keyed by the knowledge base version, so a UI toggle only rebuilds the
+    layer it affects:
+
+    - graph data: rebuilt when the version changes
+    - layout positions: per layout algorithm
+    - figures: per layout algorithm and label setting
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[Hashable] = None
+        self._data: Any = None
+        self._has_data = False
+        self._layouts: Dict[str, Any] = {}
+        self._figures: Dict[Tuple[str, bool], Any] = {}
+        self.stats = {"hits": 0, "data_builds": 0, "layout_builds": 0, "figure_builds": 0}
+
+    def _sync_version(self, version: Hashable):
+        """Drop every layer built for an older version"""
+        if version != self._version:
+            self._version = version
+            self._data = None
+            self._has_data = False
+            self._layouts.clear()
+            self._figures.clear()
+
+    def get_data(self, version: Hashable, build: Callable[[], Any]) -> Any:
+        """Graph nodes and edges for this version"""
+        with self._lock:
+            self._sync_version(version)
+            if self._has_data:
+                self.stats["hits"] += 1
+                return self._data
+
+            self._data = build()
+            self._has_data = True
+            self.stats["data_builds"] += 1
+            return self._data
+
+    def get_layout(self, version: Hashable, algorithm: str, build: Callable[[], Any]) -> Any:
+        """Node positions for this version and layout algorithm"""
+        with self._lock:
+            self._sync_version(version)
+            if algorithm in self._layouts:
+                self.stats["hits"] += 1
+                return self._layouts[algorithm]
+
+            positions = build()
+            if positions is not None:
+                self._layouts[algorithm] = positions
+                self.stats["layout_builds"] += 1
+            return positions
+
+    def get_figure(self, version: Hashable, algorithm: str, show_labels: bool, build: Callable[[], Any]) -> Any:
+        """Rendered figure for this version, layout algorithm and label setting"""
+        key = (algorithm, show_labels)
+        with self._lock:
+            self._sync_version(version)
+            if key in self._figures:
+                self.stats["hits"] += 1
+                return self._figures[key]
+
+            figure = build()
+            if figure is not None:
+                self._figures[key] = figure
+                self.stats["figure_builds"] += 1
+            return figure
+
+    def invalidate(self):
+        """Forget all cached layers"""
+        with self._lock:
+            self._sync_version(object())
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "version": self._version, "layouts": len(self._layouts), "figures": len(self._figures)}
+
+# Create global knowledge graph cache instance
+knowledge_graph_cache = KnowledgeGraphCache()
@@ -0,0 +1,348 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Set, Tuple
+
+# Field separator LightRAG uses inside node and edge source_id values
+GRAPH_FIELD_SEP = "<SEP>"
+
+INDEX_ITEM_KINDS = ("doc", "chunk", "entity", "relation")
+
+# Store files written by LightRAG's default JSON, NanoVectorDB and NetworkX storages
+LIGHTRAG_STORE_FILES = ("kv_store_*.json", "vdb_*.json", "graph_*.graphml")
+
+# Private LightRAG members the tombstones and compaction use, with the parameters
+# their wrappers take. They are not a stable API and differ between releases
+# (and between the lightrag and lightrag-hku packages), so they are checked
+# before anything is patched.
+_STORE_METHODS = (
+    ("text_chunks", "get_by_id", ("id",)),
+    ("text_chunks", "get_by_ids", ("ids", "fields")),
+    ("chunks_vdb", "query", ("query", "top_k")),
+    ("entities_vdb", "query", ("query", "top_k")),
+    ("relationships_vdb", "query", ("query", "top_k")),
+    ("chunk_entity_relation_graph", "get_node", ("node_id",)),
+    ("chunk_entity_relation_graph", "get_edge", ("source_node_id", "target_node_id")),
+    ("chunk_entity_relation_graph", "get_node_edges", ("source_node_id",)),
+)
+_STORES = ("full_docs", "text_chunks", "chunks_vdb", "entities_vdb", "relationships_vdb", "chunk_entity_relation_graph")
+_GRAPH_METHODS = ("nodes", "edges", "has_node", "has_edge", "neighbors", "remove_node", "remove_edge")
+
+def compute_mdhash_id(content: str, prefix: str = "") -> str:
+    """Same id scheme LightRAG uses for docs, chunks, entities and relations"""
+    return prefix + hashlib.md5(content.encode()).hexdigest()
+
+def relation_key(source: str, target: str) -> str:
+    """Order-independent identifier of a graph relation"""
+    return GRAPH_FIELD_SEP.join(sorted((source, target)))
+
+def check_lightrag_internals(rag) -> List[str]:
+    """Problems that keep tombstones and compaction from working on this LightRAG; empty if none"""
+    problems = []
+    for store in _STORES:
+        if not hasattr(rag, store):
+            problems.append(f"missing rag.{store}")
+        elif not callable(getattr(getattr(rag, store), "index_done_callback", None)):
+            problems.append(f"missing {store}.index_done_callback()")
+    if problems:
+        return problems
+
+    for store in ("full_docs", "text_chunks"):
+        if not isinstance(getattr(getattr(rag, store), "_data", None), dict):
+            problems.append(f"{store}._data is not a dict")
+
+    graph = getattr(rag.chunk_entity_relation_graph, "_graph", None)
+    if graph is None or not all(hasattr(graph, name) for name in _GRAPH_METHODS):
+        problems.append("chunk_entity_relation_graph._graph is not a networkx graph")
+
+    for store in ("chunks_vdb", "entities_vdb", "relationships_vdb"):
+        if not callable(getattr(getattr(getattr(rag, store), "_client", None), "delete", None)):
+            problems.append(f"missing {store}._client.delete()")
+
+    for store, name, expected in _STORE_METHODS:
+        method = getattr(getattr(rag, store), name, None)
+        if not callable(method):
+            problems.append(f"missing {store}.{name}()")
+            continue
+        try:
+            parameters = tuple(inspect.signature(method).parameters)
+        except (TypeError, ValueError):
+            parameters = None
+        # The wrappers replace the method, so LightRAG must call it with exactly these parameters
+        if parameters != expected:
+            problems.append(f"{store}.{name}{parameters or '(?)'} does not take {expected}")
+    return problems
+
+def _source_ids(data: Dict[str, Any]) -> Set[str]:
+    return {part for part in data.get("source_id", "").split(GRAPH_FIELD_SEP) if part}
+
+def collect_index_items(rag, doc_owners: Dict[str, str]) -> Dict[str, List[Tuple[str, str]]]:
+    """Find the chunks, entities and relations LightRAG created for some documents
+
+    doc_owners maps LightRAG doc ids to the owner they should be tracked under
+    (an uploaded document's or seed's content hash). One pass over the chunk
+    store and the graph covers every document in the batch.
+    """
+    items: Dict[str, List[Tuple[str, str]]] = {owner: [] for owner in doc_owners.values()}
+    chunk_owners: Dict[str, str] = {}
+
+    for doc_id, owner in doc_owners.items():
+        if doc_id in rag.full_docs._data:
+            items[owner].append(("doc", doc_id))
+
+    for chunk_id, chunk in rag.text_chunks._data.items():
+        owner = doc_owners.get(chunk.get("full_doc_id"))
+        if owner is not None:
+            chunk_owners[chunk_id] = owner
+            items[owner].append(("chunk", chunk_id))
+
+    if not chunk_owners:
+        return {owner: owner_items for owner, owner_items in items.items() if owner_items}
+
+    graph = rag.chunk_entity_relation_graph._graph
+    for node, data in graph.nodes(data=True):
+        for owner in {chunk_owners[c] for c in _source_ids(data) if c in chunk_owners}:
+            items[owner].append(("entity", node))
+
+    for source, target, data in graph.edges(data=True):
+        for owner in {chunk_owners[c] for c in _source_ids(data) if c in chunk_owners}:
+            items[owner].append(("relation", relation_key(source, target)))
+
+    return {owner: owner_items for owner, owner_items in items.items() if owner_items}
+
+class IndexTombstones:
+    """LightRAG items hidden from retrieval until compaction removes them
+
+    install() wraps the read paths LightRAG's query code goes through (vector
+    queries, chunk lookups and graph lookups) so tombstoned items are filtered
+    out immediately, without touching the stores themselves.
+    """
+
+    def __init__(self):
+        self.items: Dict[str, Set[str]] = {kind: set() for kind in INDEX_ITEM_KINDS}
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self.items.values())
+
+    def replace(self, dead: Dict[str, Set[str]]):
+        """Swap in a fresh set of dead items"""
+        self.items = {kind: set(dead.get(kind, ())) for kind in INDEX_ITEM_KINDS}
+
+    def install(self, rag) -> bool:
+        """Filter tombstoned items out of a LightRAG instance's read paths
+
+        Returns False, patching nothing, if this LightRAG's internals are not
+        the ones the filters wrap; removed documents then stay in the index
+        until the knowledge base is rebuilt.
+        """
+        problems = check_lightrag_internals(rag)
+        if problems:
+            logging.warning(
+                f"LightRAG internals differ from what tombstones and compaction expect, "
+                f"removed documents stay in the index until the next rebuild: {'; '.join(problems)}"
+            )
+            return False
+
+        tombstones = self
+
+        def wrap(storage, name, make_wrapper):
+            original = getattr(storage, name)
+            setattr(storage, name, functools.wraps(original)(make_wrapper(original)))
+
+        def chunk_get_by_id(original):
+            async def get_by_id(id):
+                if id in tombstones.items["chunk"]:
+                    return None
+                return await original(id)
+            return get_by_id
+
+        def chunk_get_by_ids(original):
+            async def get_by_ids(ids, fields=None):
+                results = await original(ids, fields)
+                return [
+                    None if id in tombstones.items["chunk"] else result
+                    for id, result in zip(ids, results)
+                ]
+            return get_by_ids
+
+        def filtered_query(is_dead):
+            def make(original):
+                async def query(query, top_k=5):
+                    return [result for result in await original(query, top_k=top_k) if not is_dead(result)]
+                return query
+            return make
+
+        def graph_get_node(original):
+            async def get_node(node_id):
+                if node_id in tombstones.items["entity"]:
+                    return None
+                return await original(node_id)
+            return get_node
+
+        def graph_get_edge(original):
+            async def get_edge(source_node_id, target_node_id):
+                if relation_key(source_node_id, target_node_id) in tombstones.items["relation"]:
+                    return None
+                return await original(source_node_id, target_node_id)
+            return get_edge
+
+        def graph_get_node_edges(original):
+            async def get_node_edges(source_node_id):
+                edges = await original(source_node_id)
+                if not edges:
+                    return edges
+                return [edge for edge in edges if relation_key(*edge) not in tombstones.items["relation"]]
+            return get_node_edges
+
+        wrap(rag.text_chunks, "get_by_id", chunk_get_by_id)
+        wrap(rag.text_chunks, "get_by_ids", chunk_get_by_ids)
+        wrap(rag.chunks_vdb, "query", filtered_query(
+            lambda result: result.get("id") in tombstones.items["chunk"]
+        ))
+        wrap(rag.entities_vdb, "query", filtered_query(
+            lambda result: result.get("entity_name") in tombstones.items["entity"]
+        ))
+        wrap(rag.relationships_vdb, "query", filtered_query(
+            lambda result: relation_key(result.get("src_id", ""), result.get("tgt_id", "")) in tombstones.items["relation"]
+        ))
+        graph = rag.chunk_entity_relation_graph
+        wrap(graph, "get_node", graph_get_node)
+        wrap(graph, "get_edge", graph_get_edge)
+        wrap(graph, "get_node_edges", graph_get_node_edges)
+        return True
+
+class IndexLock:
+    """Shared/exclusive lock around the live LightRAG instance
+
+    Queries and inserts hold it shared and run concurrently. Compaction,
+    which rewrites the stores, and index resets, which replace the instance,
+    hold it exclusively, so nothing in flight lands in a store being thrown
+    away. A waiting exclusive holder keeps new shared holders out, so a
+    steady stream of queries can't starve it.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    @asynccontextmanager
+    async def shared(self) -> AsyncIterator[None]:
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._exclusive and not self._exclusive_waiting)
+            self._shared += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._shared -= 1
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def exclusive(self) -> AsyncIterator[None]:
+        async with self._condition:
+            self._exclusive_waiting += 1
+            try:
+                await self._condition.wait_for(lambda: not self._exclusive and not self._shared)
+            finally:
+                self._exclusive_waiting -= 1
+                # Shared waiters held back by this one may proceed if it was cancelled
+                self._condition.notify_all()
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
+async def compact_lightrag_index(rag, deleted_items: Dict[str, Set[str]], dead_items: Dict[str, Set[str]]) -> Dict[str, int]:
+    """Physically remove deleted documents' data from LightRAG's stores
+
+    deleted_items holds everything created by deleted owners; dead_items the
+    subset no live owner still uses. Dead docs, chunks, entities and
+    relations are dropped; shared entities and relations only lose the
+    deleted chunks from their source_id. All in-memory edits happen without
+    yielding to the event loop, so a concurrent insert never sees a
+    half-compacted graph; the stores are then rewritten to disk. Raises
+    RuntimeError, before changing anything, on an incompatible LightRAG.
+    """
+    problems = check_lightrag_internals(rag)
+    if problems:
+        raise RuntimeError(f"Cannot compact this LightRAG index: {'; '.join(problems)}")
+
+    dead_chunks = dead_items.get("chunk", set())
+    graph = rag.chunk_entity_relation_graph._graph
+    removed = {"docs": 0, "chunks": 0, "entities": 0, "relations": 0}
+    vdb_entity_ids: List[str] = []
+    vdb_relation_ids: List[str] = []
+
+    def drop_relation_vectors(source: str, target: str):
+        # The vector id depends on the order the relation was extracted in
+        vdb_relation_ids.append(compute_mdhash_id(source + target, prefix="rel-"))
+        vdb_relation_ids.append(compute_mdhash_id(target + source, prefix="rel-"))
+
+    for doc_id in dead_items.get("doc", ()):
+        if rag.full_docs._data.pop(doc_id, None) is not None:
+            removed["docs"] += 1
+
+    for chunk_id in dead_chunks:
+        if rag.text_chunks._data.pop(chunk_id, None) is not None:
+            removed["chunks"] += 1
+
+    for key in deleted_items.get("relation", ()):
+        source, _, target = key.partition(GRAPH_FIELD_SEP)
+        if not graph.has_edge(source, target):
+            continue
+        data = graph.edges[source, target]
+        remaining = _source_ids(data) - dead_chunks
+        if remaining and key not in dead_items.get("relation", ()):
+            data["source_id"] = GRAPH_FIELD_SEP.join(sorted(remaining))
+        else:
+            graph.remove_edge(source, target)
+            drop_relation_vectors(source, target)
+            removed["relations"] += 1
+
+    for node in deleted_items.get("entity", ()):
+        if not graph.has_node(node):
+            continue
+        data = graph.nodes[node]
+        remaining = _source_ids(data) - dead_chunks
+        if remaining and node not in dead_items.get("entity", ()):
+            data["source_id"] = GRAPH_FIELD_SEP.join(sorted(remaining))
+        else:
+            for neighbour in list(graph.neighbors(node)):
+                drop_relation_vectors(node, neighbour)
+                removed["relations"] += 1
+            graph.remove_node(node)
+            vdb_entity_ids.append(compute_mdhash_id(node, prefix="ent-"))
+            removed["entities"] += 1
+
+    if dead_chunks:
+        rag.chunks_vdb._client.delete(list(dead_chunks))
+    if vdb_entity_ids:
+        rag.entities_vdb._client.delete(vdb_entity_ids)
+    if vdb_relation_ids:
+        rag.relationships_vdb._client.delete(vdb_relation_ids)
+
+    await asyncio.gather(*[
+        storage.index_done_callback()
+        for storage in (
+            rag.full_docs,
+            rag.text_chunks,
+            rag.chunks_vdb,
+            rag.entities_vdb,
+            rag.relationships_vdb,
+            rag.chunk_entity_relation_graph
+        )
+    ])
+    logging.info(f"Compacted LightRAG index: {removed}")
+    return removed
+
+def doc_owner_map(sources: Iterable[Tuple[str, str]]) -> Dict[str, str]:
+    """Map LightRAG doc ids to owners for (owner, inserted text) pairs"""
+    return {compute_mdhash_id(text.strip(), prefix="doc-"): owner for owner, text in sources}
@@ -1,13 +1,17 @@
 import os
 import json
 import logging
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
 from pathlib import Path
 import asyncio
 from dataclasses import dataclass, asdict
 from datetime import datetime
 import hashlib
 import re
+import threading
+import time
+
+import numpy as np
 
 try:
     from lightrag import LightRAG, QueryParam
@@ -20,6 +24,16 @@ except ImportError:
     logging.warning("LightRAG not available. Knowledge base features will be disabled.")
 
 from config import Config
+from services.async_runtime import run_sync
+from services.document_catalog import DocumentCatalog
+from services.document_similarity import MinHasher, SimilarityIndex
+from services.query_cache import KnowledgeQueryCache
+from services.rate_limit import PRIORITY_BACKGROUND
+from services.index_maintenance import (
+    LIGHTRAG_STORE_FILES, IndexLock, IndexTombstones, collect_index_items, compact_lightrag_index, doc_owner_map
+)
+from services.text_extraction import extraction_service, get_file_type
+from services.telemetry import telemetry, traced
 
 @dataclass
 class UploadedDocument:
@@ -30,6 +44,7 @@ class UploadedDocument:
     file_size: int
     file_type: str
     content_preview: str  # Preview of first 100 characters
+    stored_path: str = ""  # Path of the saved content under the documents directory
     
     def to_dict(self):
         return asdict(self)
@@ -48,6 +63,11 @@ class RequirementTemplate:
     examples: List[str]
     best_practices: List[str]
 
+# Knowledge base readiness states
+KB_STATUS_INITIALIZING = "initializing"
+KB_STATUS_READY = "ready"
+KB_STATUS_DEGRADED = "degraded"
+
 class KnowledgeBaseService:
     """LightRAG-based knowledge base service"""
     
@@ -59,48 +79,223 @@ class KnowledgeBaseService:
         self.documents_dir = self.working_dir / "documents"
         self.documents_dir.mkdir(exist_ok=True)
         self.documents_metadata_file = self.working_dir / "documents_metadata.json"
+        # The SQLite catalogue is opened on first use, so importing this module
+        # creates no files
+        self._catalog: Optional[DocumentCatalog] = None
+        self._catalog_lock = threading.Lock()
+        # Written by earlier versions; the catalogue now records what is ingested
+        self.ingest_manifest_file = self.working_dir / "ingest_manifest.json"
         
         self.rag = None
+        # Held shared by queries and inserts, exclusively by compaction and index resets
+        self._index_lock = IndexLock()
         self.templates_data = {}
         self.is_initialized = False
-        self.uploaded_documents: List[UploadedDocument] = []
         
-        # Load historical documents
-        self._load_documents_metadata()
+        # Content similarity between documents, from MinHash signatures stored in the catalogue
+        self._minhasher = MinHasher(num_perm=Config.SIMILARITY_NUM_PERM)
+        self._similarity_index: Optional[SimilarityIndex] = None
+        self._similarity_lock = threading.Lock()
+        
+        # LightRAG items of removed documents stay hidden from queries until compaction deletes them
+        self.index_tombstones = IndexTombstones()
+        self._compaction_task: Optional[asyncio.Task] = None
+        # False when the installed LightRAG's internals don't support tombstones;
+        # removed documents then stay in the index until the next rebuild
+        self.incremental_index = False
+        # Documents removed while initialization is still indexing; their
+        # tombstones are applied again once it finishes, since the pending
+        # ingest and tracking backfill may have re-tracked their items as live.
+        # None once initialization is over.
+        self._pending_removals: Optional[Set[str]] = set() if LIGHTRAG_AVAILABLE else None
+        self._removal_lock = threading.Lock()
+        
+        # Retrieval results for repeated (or lightly edited) queries, keyed by data_version
+        self.query_cache = KnowledgeQueryCache(
+            max_entries=Config.KB_QUERY_CACHE_ENTRIES,
+            near_duplicate_threshold=Config.KB_QUERY_CACHE_NEAR_DUPLICATE_THRESHOLD
+        ) if Config.KB_QUERY_CACHE_ENABLED else None
+        
+        # LightRAG setup and seed ingestion run on a background thread started by
+        # start(), so importing this module never blocks the first page render
+        self.status = KB_STATUS_INITIALIZING if LIGHTRAG_AVAILABLE else KB_STATUS_DEGRADED
+        self.status_message = "Waiting to start" if LIGHTRAG_AVAILABLE else "LightRAG is not installed"
+        self._init_thread: Optional[threading.Thread] = None
+        self._init_lock = threading.Lock()
+        self._ready_event = threading.Event()
+        self._init_started_at: Optional[float] = None
+        self._init_finished_at: Optional[float] = None
+    
+    @property
+    def catalog(self) -> DocumentCatalog:
+        """The document catalogue, opened (and migrated from JSON) on first use"""
+        if self._catalog is None:
+            with self._catalog_lock:
+                if self._catalog is None:
+                    catalog = DocumentCatalog(self.working_dir / "documents.sqlite3")
+                    # Import documents and ingest records written by earlier versions
+                    self._migrate_documents_metadata(catalog)
+                    self._migrate_ingest_manifest(catalog)
+                    self._catalog = catalog
+        return self._catalog
+    
+    @property
+    def is_ready(self) -> bool:
+        """Whether the knowledge base is warm and can serve queries"""
+        return self.status == KB_STATUS_READY
+    
+    def start(self):
+        """Start background initialization (safe to call on every rerun)"""
+        if not LIGHTRAG_AVAILABLE or self._init_thread is not None:
+            return
         
-        if LIGHTRAG_AVAILABLE:
+        with self._init_lock:
+            if self._init_thread is not None:
+                return
+            self._init_started_at = time.time()
+            self.status_message = "Setting up LightRAG"
+            self._init_thread = threading.Thread(
+                target=self._background_initialize, name="kb-init", daemon=True
+            )
+            self._init_thread.start()
+    
+    def _background_initialize(self):
+        """Initialize LightRAG and ingest seed knowledge off the UI thread"""
+        try:
             self._initialize_rag()
+            if not self.is_initialized:
+                self.status = KB_STATUS_DEGRADED
+                self.status_message = "LightRAG failed to initialize"
+                return
+            
+            self.status_message = "Loading seed knowledge"
             self._load_knowledge_base()
+            
+            if self.catalog.get_meta("rebuild_started_at"):
+                # A rebuild was interrupted; its diff picks up where it stopped
+                self.status_message = "Resuming knowledge base rebuild"
+                run_sync(self.rebuild_knowledge_base())
+            else:
+                # Documents uploaded while LightRAG was starting still need indexing
+                self.status_message = "Indexing pending documents"
+                run_sync(self._aingest_pending_documents())
+                run_sync(self._abackfill_index_tracking())
+            
+            run_sync(self._aapply_pending_removals())
+            self.status = KB_STATUS_READY
+            self.status_message = "Ready"
+        except Exception as e:
+            logging.error(f"Knowledge base background initialization failed: {e}")
+            self.status = KB_STATUS_DEGRADED
+            self.status_message = str(e)
+        finally:
+            with self._removal_lock:
+                self._pending_removals = None
+            self._init_finished_at = time.time()
+            self._ready_event.set()
+    
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until initialization has finished; True if the knowledge base is ready"""
+        self.start()
+        if not LIGHTRAG_AVAILABLE:
+            return False
+        self._ready_event.wait(timeout)
+        return self.is_ready
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Get readiness state for display and polling"""
+        elapsed = None
+        if self._init_started_at is not None:
+            elapsed = round((self._init_finished_at or time.time()) - self._init_started_at, 1)
+        
+        return {
+            "status": self.status,
+            "message": self.status_message,
+            "lightrag_available": LIGHTRAG_AVAILABLE,
+            "elapsed_seconds": elapsed,
+            "tombstoned_items": len(self.index_tombstones),
+            "incremental_index": self.incremental_index,
+            "query_cache": self.query_cache.get_stats() if self.query_cache is not None else None
+        }
     
-    def _load_documents_metadata(self):
-        """Load metadata of uploaded documents"""
+    @property
+    def data_version(self) -> Tuple[int, int, bool]:
+        """Changes whenever the catalogue or the indexed content changes, for keying derived caches"""
+        return (self.catalog.version, self.catalog.index_version, self.is_initialized)
+    
+    @property
+    def uploaded_documents(self) -> List[UploadedDocument]:
+        """Uploaded documents in upload order"""
+        return [UploadedDocument.from_dict(doc) for doc in self.catalog.list_documents()]
+    
+    def get_document_by_hash(self, content_hash: str) -> Optional[UploadedDocument]:
+        doc_data = self.catalog.get_by_hash(content_hash)
+        return UploadedDocument.from_dict(doc_data) if doc_data else None
+    
+    def get_document_by_filename(self, filename: str) -> Optional[UploadedDocument]:
+        """Oldest document uploaded under this filename"""
+        doc_data = self.catalog.get_by_filename(filename)
+        return UploadedDocument.from_dict(doc_data) if doc_data else None
+    
+    def _migrate_documents_metadata(self, catalog: DocumentCatalog):
+        """One-time import of documents_metadata.json into the SQLite catalogue
+        
+        The JSON file is left in place (it is no longer written) so older
+        versions of the app can still be run against the same storage.
+        """
+        if catalog.get_meta("json_migrated") or not self.documents_metadata_file.exists():
+            return
+        
         try:
-            if self.documents_metadata_file.exists():
-                with open(self.documents_metadata_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.uploaded_documents = [
-                        UploadedDocument.from_dict(doc_data) 
-                        for doc_data in data.get('documents', [])
-                    ]
-                logging.info(f"Loaded {len(self.uploaded_documents)} documents from history")
-            else:
-                self.uploaded_documents = []
+            with open(self.documents_metadata_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            documents = [UploadedDocument.from_dict(doc_data) for doc_data in data.get('documents', [])]
+            self._resolve_legacy_stored_paths(documents)
+            
+            imported = catalog.add_many(doc.to_dict() for doc in documents)
+            catalog.set_meta("json_migrated", datetime.now().isoformat())
+            logging.info(f"Migrated {imported} documents from {self.documents_metadata_file.name}")
         except Exception as e:
-            logging.error(f"Failed to load documents metadata: {e}")
-            self.uploaded_documents = []
+            logging.error(f"Failed to migrate documents metadata: {e}")
     
-    def _save_documents_metadata(self):
-        """Save document metadata to file"""
+    def _migrate_ingest_manifest(self, catalog: DocumentCatalog):
+        """One-time import of ingest_manifest.json into the SQLite catalogue
+        
+        Like documents_metadata.json, the file is left in place but no longer written.
+        """
+        if catalog.get_meta("manifest_migrated") or not self.ingest_manifest_file.exists():
+            return
+        
         try:
-            metadata = {
-                'documents': [doc.to_dict() for doc in self.uploaded_documents],
-                'last_updated': datetime.now().isoformat()
-            }
-            with open(self.documents_metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
-            logging.info(f"Saved metadata for {len(self.uploaded_documents)} documents")
+            with open(self.ingest_manifest_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get('ingested', {})
+            catalog.record_ingested({
+                content_hash: entry.get('source', '') for content_hash, entry in entries.items()
+            })
+            catalog.set_meta("manifest_migrated", datetime.now().isoformat())
+            logging.info(f"Migrated {len(entries)} ingest records from {self.ingest_manifest_file.name}")
         except Exception as e:
-            logging.error(f"Failed to save documents metadata: {e}")
+            logging.error(f"Failed to migrate ingest manifest, content will be re-ingested: {e}")
+    
+    def _resolve_legacy_stored_paths(self, documents: List[UploadedDocument]):
+        """Fill in stored_path for metadata written before it was recorded
+        
+        Lists the documents directory once instead of globbing per document.
+        """
+        legacy = [doc for doc in documents if not doc.stored_path]
+        if not legacy:
+            return
+        
+        # Stored files are named "<YYYYmmdd_HHMMSS>_<sanitized filename>"; later uploads win
+        stored_files = {}
+        for doc_file in sorted(self.documents_dir.iterdir()):
+            if doc_file.is_file() and len(doc_file.name) > 16:
+                stored_files[doc_file.name[16:]] = doc_file
+        
+        for document in legacy:
+            doc_file = stored_files.get(self._sanitize_filename(document.filename))
+            if doc_file is not None:
+                document.stored_path = str(doc_file)
     
     def _calculate_content_hash(self, content: str) -> str:
         """Calculate content hash for deduplication"""
@@ -113,10 +308,7 @@ class KnowledgeBaseService:
             content_hash = self._calculate_content_hash(content)
             
             # Check if document with same content already exists
-            existing_doc = next(
-                (doc for doc in self.uploaded_documents if doc.content_hash == content_hash),
-                None
-            )
+            existing_doc = self.get_document_by_hash(content_hash)
             
             if existing_doc:
                 return {
@@ -125,52 +317,29 @@ class KnowledgeBaseService:
                     "duplicate": True
                 }
             
-            # Ensure document directory exists
-            self.documents_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Clean filename to avoid special character issues
-            safe_filename = self._sanitize_filename(filename)
-            doc_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe_filename}"
-            doc_path = self.documents_dir / doc_filename
+            document = self._store_document(filename, content, content_hash)
             
-            # Save document content to file
-            try:
-                with open(doc_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                logging.info(f"Document saved to: {doc_path}")
-            except Exception as e:
-                logging.error(f"Failed to save document file: {e}")
-                raise
-            
-            # Create document metadata
-            document = UploadedDocument(
-                filename=filename,  # Keep original filename
-                content_hash=content_hash,
-                upload_time=datetime.now().isoformat(),
-                file_size=len(content.encode('utf-8')),
-                file_type=filename.split('.')[-1].lower() if '.' in filename else 'unknown',
-                content_preview=content[:100] + "..." if len(content) > 100 else content
-            )
-            
-            # Add to LightRAG (if available)
-            if self.is_initialized and self.rag:
+            # Add to LightRAG (if available and not already indexed)
+            if self.is_initialized and self.rag and not self.catalog.is_ingested(content_hash):
                 try:
-                    formatted_content = f"""
-Document Name: {filename}
-Upload Time: {document.upload_time}
-File Type: {document.file_type}
-
-Content:
-{content}
-                    """
-                    await self.rag.ainsert(formatted_content)
+                    index_text = self._format_document_for_index(document, content)
+                    async with self._index_lock.shared():
+                        await self.rag.ainsert(index_text)
+                        self.catalog.record_ingested({content_hash: f"document:{filename}"})
+                        self._track_index_items([(content_hash, index_text)])
                     logging.info(f"Document added to LightRAG: {filename}")
                 except Exception as e:
+                    self.catalog.bump_index_version()
                     logging.warning(f"Failed to add document to LightRAG: {e}")
+            elif self.catalog.is_ingested(content_hash):
+                # Re-uploaded before its previous copy was compacted away
+                self._revive_index_items([content_hash])
             
             # Save metadata
-            self.uploaded_documents.append(document)
-            self._save_documents_metadata()
+            self.catalog.add(document.to_dict())
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._record_signatures, [(document, content)]
+            )
             
             return {
                 "success": True,
@@ -185,6 +354,157 @@ Content:
                 "error": str(e)
             }
     
+    def _store_document(self, filename: str, content: str, content_hash: str) -> UploadedDocument:
+        """Save document content to disk and create its metadata"""
+        # Ensure document directory exists
+        self.documents_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Clean filename to avoid special character issues
+        safe_filename = self._sanitize_filename(filename)
+        doc_filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{safe_filename}"
+        doc_path = self.documents_dir / doc_filename
+        if doc_path.exists():
+            # Same name uploaded within the same second; keep both files
+            doc_path = self.documents_dir / f"{Path(doc_filename).stem}_{content_hash[:8]}{Path(doc_filename).suffix}"
+        
+        # Save document content to file
+        try:
+            with open(doc_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            logging.info(f"Document saved to: {doc_path}")
+        except Exception as e:
+            logging.error(f"Failed to save document file: {e}")
+            raise
+        
+        # Create document metadata
+        return UploadedDocument(
+            filename=filename,  # Keep original filename
+            content_hash=content_hash,
+            upload_time=datetime.now().isoformat(),
+            file_size=len(content.encode('utf-8')),
+            file_type=get_file_type(filename),
+            content_preview=content[:100] + "..." if len(content) > 100 else content,
+            stored_path=str(doc_path)
+        )
+    
+    @traced("kb.add_documents")
+    async def add_documents(self, files: List[Tuple[str, bytes]],
+                            progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Add a batch of raw files to the knowledge base
+        
+        Text is extracted in a worker pool, duplicates are detected against the
+        catalogue and the rest of the batch, LightRAG inserts run in bounded
+        concurrent batches and metadata is committed in one transaction. progress_callback
+        receives one event per file as soon as its outcome is known.
+        """
+        loop = asyncio.get_running_loop()
+        total = len(files)
+        completed = 0
+        duplicates, failed = [], []
+        
+        def report(filename: str, status: str, error: str = None):
+            nonlocal completed
+            completed += 1
+            if progress_callback:
+                try:
+                    progress_callback({
+                        "filename": filename,
+                        "status": status,
+                        "error": error,
+                        "completed": completed,
+                        "total": total
+                    })
+                except Exception as e:
+                    logging.warning(f"Progress callback failed: {e}")
+        
+        # 1. Extract text in parallel worker processes
+        with telemetry.span("kb.extract", files=total):
+            extractions = await asyncio.gather(*[
+                extraction_service.extract(filename, data)
+                for filename, data in files
+            ], return_exceptions=True)
+        
+        # 2. Deduplicate against the catalogue and within the batch in one pass
+        batch_hashes = set()
+        pending = []
+        for (filename, _), extraction in zip(files, extractions):
+            if isinstance(extraction, Exception):
+                failed.append({"filename": filename, "error": str(extraction)})
+                report(filename, "failed", str(extraction))
+                continue
+            
+            content, error = extraction
+            if not content:
+                error = error or "Failed to extract text content"
+                failed.append({"filename": filename, "error": error})
+                report(filename, "failed", error)
+                continue
+            
+            content_hash = self._calculate_content_hash(content)
+            if content_hash in batch_hashes or self.catalog.contains(content_hash):
+                duplicates.append(filename)
+                report(filename, "duplicate")
+                continue
+            
+            batch_hashes.add(content_hash)
+            pending.append((filename, content, content_hash))
+        
+        # 3. Store files and build metadata
+        stored = []
+        with telemetry.span("kb.store", files=len(pending)):
+            for filename, content, content_hash in pending:
+                try:
+                    document = await loop.run_in_executor(None, self._store_document, filename, content, content_hash)
+                    stored.append((document, content))
+                except Exception as e:
+                    failed.append({"filename": filename, "error": str(e)})
+                    report(filename, "failed", str(e))
+        
+        # 4. Insert into LightRAG in bounded-concurrency batches
+        ingested = self.catalog.get_ingested_hashes()
+        to_index = []
+        if self.is_initialized and self.rag:
+            to_index = [(doc, content) for doc, content in stored if doc.content_hash not in ingested]
+        
+        indexing = {doc.content_hash for doc, _ in to_index}
+        self._revive_index_items([
+            doc.content_hash for doc, _ in stored
+            if doc.content_hash not in indexing and doc.content_hash in ingested
+        ])
+        for document, _ in stored:
+            if document.content_hash not in indexing:
+                report(document.filename, "added")
+        
+        if to_index:
+            filenames = {doc.content_hash: doc.filename for doc, _ in to_index}
+            
+            def batch_done(batch, error):
+                for content_hash, _, _ in batch:
+                    report(filenames[content_hash], "added")
+            
+            with telemetry.span("kb.index", files=len(to_index)):
+                await self._ainsert_sources([
+                    (doc.content_hash, self._format_document_for_index(doc, content), f"document:{doc.filename}")
+                    for doc, content in to_index
+                ], on_batch_done=batch_done)
+        
+        # 5. Write metadata for the whole batch in one transaction
+        added = [document.to_dict() for document, _ in stored]
+        with telemetry.span("kb.catalog", files=len(added)):
+            self.catalog.add_many(added)
+            await loop.run_in_executor(None, self._record_signatures, stored)
+        
+        telemetry.increment("kb_documents_total", len(added), outcome="added")
+        telemetry.increment("kb_documents_total", len(duplicates), outcome="duplicate")
+        telemetry.increment("kb_documents_total", len(failed), outcome="failed")
+        return {
+            "success": not failed,
+            "added": added,
+            "duplicates": duplicates,
+            "failed": failed,
+            "total": total
+        }
+    
     def _sanitize_filename(self, filename: str) -> str:
         """Clean filename, remove or replace characters that might cause issues"""
         # Remove or replace unsafe characters
@@ -198,35 +518,28 @@ Content:
         
         return safe_filename
     
-    def get_uploaded_documents(self) -> List[Dict[str, Any]]:
-        """Get list of uploaded documents"""
-        return [doc.to_dict() for doc in self.uploaded_documents]
+    def get_uploaded_documents(self, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get list of uploaded documents, optionally one page at a time"""
+        return self.catalog.list_documents(offset, limit)
     
     def get_documents_summary(self) -> Dict[str, Any]:
         """Get document summary information"""
-        total_docs = len(self.uploaded_documents)
-        total_size = sum(doc.file_size for doc in self.uploaded_documents)
-        
-        file_types = {}
-        for doc in self.uploaded_documents:
-            file_types[doc.file_type] = file_types.get(doc.file_type, 0) + 1
+        summary = self.catalog.get_summary()
         
         return {
-            "total_documents": total_docs,
-            "total_size_bytes": total_size,
-            "total_size_mb": round(total_size / (1024 * 1024), 2),
-            "file_types": file_types,
-            "latest_upload": self.uploaded_documents[-1].upload_time if self.uploaded_documents else None
+            "total_documents": summary["total_documents"],
+            "total_size_bytes": summary["total_size_bytes"],
+            "total_size_mb": round(summary["total_size_bytes"] / (1024 * 1024), 2),
+            "file_types": summary["file_types"],
+            "latest_upload": summary["latest_upload"]
         }
     
+    @traced("kb.remove_document")
     async def remove_document(self, filename: str) -> Dict[str, Any]:
         """Remove document from knowledge base"""
         try:
             # Find document
-            document = next(
-                (doc for doc in self.uploaded_documents if doc.filename == filename),
-                None
-            )
+            document = self.get_document_by_filename(filename)
             
             if not document:
                 return {
@@ -234,21 +547,31 @@ Content:
                     "error": f"Document '{filename}' not found"
                 }
             
-            # Remove from list
-            self.uploaded_documents.remove(document)
+            # Remove from catalogue
+            self.catalog.remove(document.content_hash)
+            if self._similarity_index is not None:
+                self._similarity_index.remove(document.content_hash)
             
             # Delete document file (if exists)
-            for doc_file in self.documents_dir.glob(f"*_{filename}"):
+            if document.stored_path:
                 try:
-                    doc_file.unlink()
+                    Path(document.stored_path).unlink(missing_ok=True)
                 except Exception as e:
-                    logging.warning(f"Failed to delete document file {doc_file}: {e}")
-            
-            # Save updated metadata
-            self._save_documents_metadata()
+                    logging.warning(f"Failed to delete document file {document.stored_path}: {e}")
             
-            # Note: LightRAG doesn't support deleting specific documents, need to rebuild knowledge base
-            # Here we only remove from metadata, actual vector data remains in LightRAG
+            # Hide its chunks, entities and relations from queries right away;
+            # compaction deletes them from the stores once enough pile up
+            with self._removal_lock:
+                if self._pending_removals is not None:
+                    self._pending_removals.add(document.content_hash)
+            if self.catalog.set_index_items_deleted(document.content_hash):
+                self._refresh_tombstones()
+                if self.is_ready:
+                    self._schedule_compaction()
+            elif self.is_initialized and not self.incremental_index:
+                logging.warning(
+                    f"Document '{filename}' stays in the LightRAG index until the knowledge base is rebuilt"
+                )
             
             return {
                 "success": True,
@@ -262,71 +585,375 @@ Content:
                 "error": str(e)
             }
     
-    async def rebuild_knowledge_base(self):
-        """Rebuild knowledge base (reload all documents)"""
+    def _record_signatures(self, documents: List[Tuple[UploadedDocument, str]]):
+        """Compute and store similarity signatures for newly added documents"""
+        signatures = {
+            document.content_hash: self._minhasher.signature(content)
+            for document, content in documents
+        }
+        try:
+            self.catalog.put_signatures({key: sig.tobytes() for key, sig in signatures.items()})
+        except Exception as e:
+            logging.warning(f"Failed to store document signatures: {e}")
+        
+        if self._similarity_index is not None:
+            for content_hash, signature in signatures.items():
+                self._similarity_index.add(content_hash, signature)
+    
+    def get_similarity_index(self) -> SimilarityIndex:
+        """LSH index over all document signatures, loaded from the catalogue on first use"""
+        with self._similarity_lock:
+            if self._similarity_index is not None:
+                return self._similarity_index
+            
+            index = SimilarityIndex(num_perm=Config.SIMILARITY_NUM_PERM, bands=Config.SIMILARITY_LSH_BANDS)
+            if abs(index.threshold - Config.SIMILARITY_MIN_SCORE) > 0.15:
+                logging.warning(
+                    f"LSH threshold {index.threshold:.2f} is far from SIMILARITY_MIN_SCORE "
+                    f"{Config.SIMILARITY_MIN_SCORE}; adjust SIMILARITY_LSH_BANDS to match"
+                )
+            stored = self.catalog.get_signatures()
+            for content_hash, blob in stored.items():
+                signature = np.frombuffer(blob, dtype=np.uint32)
+                if signature.shape[0] == index.num_perm:
+                    index.add(content_hash, signature)
+            
+            # Documents catalogued before signatures existed are signed once here
+            backfill = {}
+            for document in self.uploaded_documents:
+                if document.content_hash in index:
+                    continue
+                content = self._read_document_content(document)
+                if content is not None:
+                    signature = self._minhasher.signature(content)
+                    backfill[document.content_hash] = signature
+                    index.add(document.content_hash, signature)
+            if backfill:
+                self.catalog.put_signatures({key: sig.tobytes() for key, sig in backfill.items()})
+                logging.info(f"Computed similarity signatures for {len(backfill)} existing documents")
+            
+            self._similarity_index = index
+            return index
+    
+    def get_similar_document_edges(self, top_k: int = None, min_similarity: float = None) -> List[Tuple[str, str, float]]:
+        """Content-similarity edges (content_hash, content_hash, score) to each document's top-k neighbours"""
+        return self.get_similarity_index().top_k_edges(
+            top_k=top_k or Config.SIMILARITY_TOP_K,
+            min_similarity=Config.SIMILARITY_MIN_SCORE if min_similarity is None else min_similarity
+        )
+    
+    @traced("kb.rebuild")
+    async def rebuild_knowledge_base(self, progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Bring LightRAG in line with the seed knowledge and the document catalogue
+        
+        Works from a diff: sources that should be indexed are compared with
+        what LightRAG actually holds, stale ones are removed and only missing
+        ones are inserted, in bounded-concurrency batches. Every finished
+        batch is recorded immediately and an unfinished rebuild is resumed on
+        the next startup, so a crash only repeats the batches in flight.
+        progress_callback receives {stage, completed, total} events.
+        """
         if not self.is_initialized or not self.rag:
-            return
+            return {"success": False, "error": "Knowledge base not initialized"}
+        
+        def report(stage: str, completed: int, total: int):
+            if progress_callback:
+                try:
+                    progress_callback({"stage": stage, "completed": completed, "total": total})
+                except Exception as e:
+                    logging.warning(f"Progress callback failed: {e}")
         
         try:
-            # Reinitialize RAG system
-            self._initialize_rag()
+            self.catalog.set_meta("rebuild_started_at", datetime.now().isoformat())
             
-            # Reload predefined knowledge base
-            self._load_knowledge_base()
+            # 1. Diff what should be indexed against what is
+            await self._abackfill_index_tracking()
+            desired = self._desired_index_sources()
+            indexed = self._indexed_owners()
+            missing = [content_hash for content_hash in desired if content_hash not in indexed]
+            stale = [content_hash for content_hash in indexed if content_hash not in desired]
+            report("diff", 0, len(missing) + len(stale))
             
-            # Reload all user documents
-            for document in self.uploaded_documents:
-                # Try to read content from file
-                for doc_file in self.documents_dir.glob(f"*_{document.filename}"):
-                    try:
-                        with open(doc_file, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                        
-                        formatted_content = f"""
+            removed_sources = 0
+            if stale and not self.incremental_index:
+                # Without tombstones nothing can be removed in place: start from an empty index
+                await self._areset_index()
+                missing = list(desired)
+                removed_sources = len(stale)
+            
+            # 2. Remove stale sources through the tombstone/compaction path, along with
+            # leftovers of half-inserted missing ones (LightRAG skips chunks it already has)
+            tracked = self.catalog.get_tracked_owners()
+            to_remove = stale + [content_hash for content_hash in missing if content_hash in tracked]
+            removed = {}
+            if to_remove and self.incremental_index:
+                for content_hash in to_remove:
+                    self.catalog.set_index_items_deleted(content_hash)
+                self._refresh_tombstones()
+                compaction = await self.compact_index()
+                if compaction.get("success"):
+                    removed = compaction.get("removed", {})
+                    removed_sources = len(stale)
+                else:
+                    # Still hidden from queries; the next compaction retries the delete
+                    logging.warning(f"Stale sources were not removed from the index: {compaction.get('error')}")
+            report("removed", removed_sources, len(stale))
+            
+            # 3. Insert missing sources; manifest entries for them are stale too
+            ingested = self.catalog.get_ingested_hashes()
+            self.catalog.remove_ingested(
+                [content_hash for content_hash in missing if content_hash in ingested]
+                + [content_hash for content_hash in ingested if content_hash not in desired]
+            )
+            sources, unreadable = [], []
+            for content_hash in missing:
+                index_text = desired[content_hash][1]()
+                if index_text is None:
+                    unreadable.append(content_hash)
+                else:
+                    sources.append((content_hash, index_text, desired[content_hash][0]))
+            
+            inserted = 0
+            def batch_done(batch, error):
+                nonlocal inserted
+                inserted += len(batch)
+                report("indexing", inserted, len(sources))
+            
+            failed = await self._ainsert_sources(sources, on_batch_done=batch_done)
+            
+            self.catalog.set_meta("rebuild_started_at", "")
+            logging.info(
+                f"Knowledge base rebuilt: {len(sources) - len(failed)} inserted, {removed_sources} removed, "
+                f"{len(desired) - len(missing)} unchanged"
+            )
+            report("done", len(missing) + len(stale), len(missing) + len(stale))
+            return {
+                "success": not failed and not unreadable and removed_sources == len(stale),
+                "inserted": len(sources) - len(failed),
+                "removed_sources": removed_sources,
+                "removed_items": removed,
+                "unchanged": len(desired) - len(missing),
+                "failed": failed + unreadable
+            }
+            
+        except Exception as e:
+            logging.error(f"Failed to rebuild knowledge base: {e}")
+            return {"success": False, "error": str(e)}
+    
+    def _desired_index_sources(self) -> Dict[str, Tuple[str, Callable[[], Optional[str]]]]:
+        """Content hash -> (manifest source, loader of the text to insert) for everything that should be indexed"""
+        desired = {}
+        for category, content in self._get_requirements_knowledge().items():
+            desired[self._calculate_content_hash(content)] = (f"seed:{category}", lambda content=content: content)
+        
+        for document in self.uploaded_documents:
+            def load(document=document):
+                content = self._read_document_content(document)
+                return self._format_document_for_index(document, content) if content is not None else None
+            desired[document.content_hash] = (f"document:{document.filename}", load)
+        return desired
+    
+    async def _areset_index(self):
+        """Delete LightRAG's stores and swap in a new, empty instance
+        
+        Queries and inserts still running against the old instance finish
+        before its stores are deleted; later ones wait for the new instance,
+        which only goes live once it has been built.
+        """
+        logging.warning("Rebuilding the LightRAG index from scratch")
+        async with self._index_lock.exclusive():
+            for pattern in LIGHTRAG_STORE_FILES:
+                for store_file in self.working_dir.glob(pattern):
+                    store_file.unlink(missing_ok=True)
+            self.catalog.clear_ingested()
+            try:
+                rag = self._create_rag()
+            except Exception as e:
+                self.is_initialized = False
+                raise RuntimeError(f"LightRAG failed to initialize: {e}") from e
+            self._install_rag(rag)
+    
+    def _indexed_owners(self) -> Set[str]:
+        """Sources whose LightRAG document is actually present in the store"""
+        if not self.incremental_index:
+            # Items aren't tracked without tombstone support; trust the manifest
+            return self.catalog.get_ingested_hashes()
+        full_docs = self.rag.full_docs._data
+        return {
+            owner for owner, doc_id in self.catalog.get_index_items("doc")
+            if doc_id in full_docs
+        }
+    
+    async def _ainsert_sources(self, sources: List[Tuple[str, str, str]],
+                               on_batch_done: Optional[Callable[[List[Tuple[str, str, str]], Optional[str]], None]] = None) -> List[str]:
+        """Insert (content hash, index text, manifest source) triples into LightRAG
+        
+        Runs INGEST_INSERT_BATCH_SIZE sources per ainsert call with at most
+        INGEST_MAX_CONCURRENCY calls in flight. Each batch is recorded in the
+        manifest and tracked as soon as it lands. Returns the hashes that failed.
+        """
+        batch_size = max(1, Config.INGEST_INSERT_BATCH_SIZE)
+        batches = [sources[i:i + batch_size] for i in range(0, len(sources), batch_size)]
+        semaphore = asyncio.Semaphore(max(1, Config.INGEST_MAX_CONCURRENCY))
+        failed = []
+        
+        async def insert_batch(batch):
+            async with semaphore:
+                error = None
+                try:
+                    async with self._index_lock.shared():
+                        await self.rag.ainsert([index_text for _, index_text, _ in batch])
+                        self.catalog.record_ingested({content_hash: source for content_hash, _, source in batch})
+                        self._track_index_items([(content_hash, index_text) for content_hash, index_text, _ in batch])
+                except Exception as e:
+                    # A failed insert may still have written part of the batch
+                    self.catalog.bump_index_version()
+                    error = str(e)
+                    failed.extend(content_hash for content_hash, _, _ in batch)
+                    logging.warning(f"Failed to add batch of {len(batch)} sources to LightRAG: {e}")
+                if on_batch_done:
+                    on_batch_done(batch, error)
+        
+        await asyncio.gather(*[insert_batch(batch) for batch in batches])
+        return failed
+    
+    def _format_document_for_index(self, document: UploadedDocument, content: str) -> str:
+        """Format an uploaded document for insertion into LightRAG"""
+        return f"""
 Document Name: {document.filename}
 Upload Time: {document.upload_time}
 File Type: {document.file_type}
 
 Content:
 {content}
-                        """
-                        await self.rag.ainsert(formatted_content)
-                        break
-                    except Exception as e:
-                        logging.warning(f"Failed to reload document {document.filename}: {e}")
-            
-            logging.info("Knowledge base rebuilt successfully")
+                    """
+    
+    def _read_document_content(self, document: UploadedDocument) -> Optional[str]:
+        """Read a stored document's content from disk"""
+        if not document.stored_path:
+            logging.warning(f"No stored file recorded for document {document.filename}")
+            return None
+        try:
+            with open(document.stored_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except Exception as e:
+            logging.warning(f"Failed to read document {document.filename}: {e}")
+            return None
+    
+    async def _aingest_pending_documents(self):
+        """Insert uploaded documents that are not in LightRAG yet"""
+        ingested = self.catalog.get_ingested_hashes()
+        sources = []
+        for document in self.uploaded_documents:
+            if document.content_hash in ingested:
+                continue
             
+            content = self._read_document_content(document)
+            if content is None:
+                continue
+            sources.append((
+                document.content_hash,
+                self._format_document_for_index(document, content),
+                f"document:{document.filename}"
+            ))
+        
+        if sources:
+            await self._ainsert_sources(sources)
+    
+    def _track_index_items(self, sources: List[Tuple[str, str]]):
+        """Record the LightRAG items created for (owner content hash, inserted text) pairs"""
+        if not self.incremental_index:
+            return
+        try:
+            self.catalog.track_index_items(collect_index_items(self.rag, doc_owner_map(sources)))
+            self._refresh_tombstones()
         except Exception as e:
-            logging.error(f"Failed to rebuild knowledge base: {e}")
+            logging.warning(f"Failed to track LightRAG items: {e}")
+    
+    def _revive_index_items(self, content_hashes: List[str]):
+        """Un-hide items of content that was removed and then added again before compaction"""
+        revived = sum(self.catalog.set_index_items_deleted(content_hash, deleted=False) for content_hash in content_hashes)
+        if revived:
+            self._refresh_tombstones()
+    
+    async def _aapply_pending_removals(self):
+        """Tombstone again the documents removed while initialization was indexing"""
+        with self._removal_lock:
+            pending, self._pending_removals = self._pending_removals, None
+        if not pending:
+            return
+        for content_hash in pending:
+            self.catalog.set_index_items_deleted(content_hash)
+        self._refresh_tombstones()
+        self._schedule_compaction()
+        logging.info(f"Applied {len(pending)} document removals made during initialization")
+    
+    def _refresh_tombstones(self):
+        self.index_tombstones.replace(self.catalog.get_dead_index_items())
+    
+    async def _abackfill_index_tracking(self):
+        """Track LightRAG items of content ingested before item tracking existed"""
+        if not self.incremental_index:
+            return
+        tracked = self.catalog.get_tracked_owners()
+        untracked = [content_hash for content_hash in self.catalog.get_ingested_hashes() if content_hash not in tracked]
+        if not untracked:
+            return
+        
+        seeds = {self._calculate_content_hash(content): content for content in self._get_requirements_knowledge().values()}
+        sources = []
+        for content_hash in untracked:
+            if content_hash in seeds:
+                sources.append((content_hash, seeds[content_hash]))
+                continue
+            document = self.get_document_by_hash(content_hash)
+            content = self._read_document_content(document) if document else None
+            if content is not None:
+                sources.append((content_hash, self._format_document_for_index(document, content)))
+        
+        if sources:
+            self._track_index_items(sources)
+            logging.info(f"Tracked LightRAG items for {len(sources)} previously ingested sources")
+    
+    def _schedule_compaction(self):
+        """Start a background compaction once enough tombstones have accumulated"""
+        if len(self.index_tombstones) < Config.KB_COMPACTION_THRESHOLD:
+            return
+        if self._compaction_task is not None and not self._compaction_task.done():
+            return
+        self._compaction_task = asyncio.get_running_loop().create_task(self.compact_index())
+    
+    @traced("kb.compact")
+    async def compact_index(self) -> Dict[str, Any]:
+        """Delete removed documents' data from LightRAG's stores without re-ingesting anything"""
+        if not self.is_initialized or not self.rag:
+            return {"success": False, "error": "Knowledge base not initialized"}
+        if not self.incremental_index:
+            # Removed documents can only be dropped by rebuilding the index
+            return await self.rebuild_knowledge_base()
+        
+        try:
+            async with self._index_lock.exclusive():
+                owners, deleted_items = self.catalog.get_deleted_index_items()
+                if not owners:
+                    return {"success": True, "removed": {}}
+                
+                removed = await compact_lightrag_index(self.rag, deleted_items, self.catalog.get_dead_index_items())
+                
+                # Removed content is re-inserted from scratch if it is ever uploaded again
+                self.catalog.purge_index_items(owners)
+                self.catalog.remove_ingested(owners)
+                self.catalog.bump_index_version()
+                self._refresh_tombstones()
+            return {"success": True, "removed": removed}
+        except Exception as e:
+            logging.error(f"Failed to compact knowledge base index: {e}")
+            return {"success": False, "error": str(e)}
     
     def _initialize_rag(self):
         """Initialize LightRAG system"""
         try:
-            # Simplified LLM model function
-            async def llm_model_func(prompt, system_prompt=None, history_messages=[], **kwargs) -> str:
-                # Use our existing LLM service here
-                from services.llm_service import llm_service
-                full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
-                return await llm_service.generate_completion(full_prompt, "demo")
-            
-            # Simplified embedding function
-            async def embedding_func(texts: list[str]):
-                # Return simulated embedding vectors
-                import numpy as np
-                return np.random.rand(len(texts), 768).astype(np.float32)
-            
-            # Initialize LightRAG
-            self.rag = LightRAG(
-                working_dir=str(self.working_dir),
-                llm_model_func=llm_model_func,
-                embedding_func=EmbeddingFunc(
-                    embedding_dim=768,
-                    max_token_size=8192,
-                    func=embedding_func
-                ),
-            )
-            
+            self._install_rag(self._create_rag())
             self.is_initialized = True
             logging.info("LightRAG initialized successfully")
             
@@ -334,28 +961,79 @@ Content:
             logging.error(f"Failed to initialize LightRAG: {e}")
             self.is_initialized = False
     
+    def _create_rag(self) -> "LightRAG":
+        """Build a LightRAG instance over the working directory"""
+        # Simplified LLM model function
+        async def llm_model_func(prompt, system_prompt=None, history_messages=[], **kwargs) -> str:
+            # Use our existing LLM service here
+            from services.llm_service import llm_service
+            full_prompt = f"{system_prompt}\n\n{prompt}" if system_prompt else prompt
+            # Entity extraction during inserts yields to interactive requests
+            return await llm_service.generate_completion(
+                full_prompt, Config.KB_LLM_MODEL, priority=PRIORITY_BACKGROUND
+            )
+        
+        # Local embeddings, cached by content hash across restarts
+        from services.embedding_service import embedding_service
+        
+        return LightRAG(
+            working_dir=str(self.working_dir),
+            llm_model_func=llm_model_func,
+            embedding_func=EmbeddingFunc(
+                embedding_dim=embedding_service.embedding_dim,
+                max_token_size=8192,
+                func=embedding_service.embed
+            ),
+            # Hand large inserts to the embedding service in big batches so
+            # they can be sharded across its process pool
+            embedding_batch_num=max(Config.EMBEDDING_BATCH_SIZE, Config.EMBEDDING_PROCESS_POOL_THRESHOLD),
+        )
+    
+    def _install_rag(self, rag: "LightRAG"):
+        """Make a built instance the live one, with tombstone filters if its internals allow"""
+        # Patch before publishing, so no query ever sees unfiltered stores
+        self.incremental_index = self.index_tombstones.install(rag)
+        self.rag = rag
+        self._refresh_tombstones()
+    
     def _load_knowledge_base(self):
         """Load requirements analysis knowledge base"""
         if not self.is_initialized:
             return
+        
+        try:
+            # Run on the shared event loop so LightRAG's async state stays warm
+            run_sync(self._aload_knowledge_base())
+        except Exception as e:
+            logging.error(f"Failed to load knowledge base: {e}")
+    
+    async def _aload_knowledge_base(self):
+        """Insert the predefined requirements knowledge into LightRAG"""
+        if not self.is_initialized:
+            return
             
         # Predefined requirements analysis knowledge base data
         knowledge_data = self._get_requirements_knowledge()
         
         try:
-            # Insert knowledge base data into LightRAG
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
+            ingested = self.catalog.get_ingested_hashes()
+            skipped = 0
+            sources = []
             for category, content in knowledge_data.items():
-                loop.run_until_complete(self.rag.ainsert(content))
+                # Seed knowledge already in the index is skipped, so a cold
+                # start is a manifest lookup rather than LLM extraction
+                content_hash = self._calculate_content_hash(content)
+                if content_hash in ingested:
+                    skipped += 1
+                    continue
+                sources.append((content_hash, content, f"seed:{category}"))
             
-            logging.info("Knowledge base loaded successfully")
+            await self._ainsert_sources(sources)
+            
+            logging.info(f"Knowledge base loaded successfully ({skipped} already indexed categories skipped)")
             
         except Exception as e:
             logging.error(f"Failed to load knowledge base: {e}")
-        finally:
-            loop.close()
     
     def _get_requirements_knowledge(self) -> Dict[str, str]:
         """Get requirements analysis knowledge base data"""
@@ -491,39 +1169,61 @@ Content:
             """
         }
     
+    @traced("kb.query")
     async def query_knowledge_base(self, requirement_text: str, query_mode: str = "hybrid") -> Dict[str, Any]:
         """Query knowledge base for relevant suggestions"""
-        if not self.is_initialized or not self.rag:
+        self.start()
+        
+        # Callers fall back to working without knowledge base context until it is warm
+        if not self.is_ready or not self.rag:
+            telemetry.increment("kb_queries_total", outcome="not_ready")
             return {
                 "success": False,
-                "error": "Knowledge base not initialized",
+                "error": f"Knowledge base {self.status}: {self.status_message}",
                 "suggestions": [],
                 "questions": []
             }
         
         try:
-            # Build query
-            query = f"Analyze the following requirements and provide improvement suggestions: {requirement_text}"
+            # Reuse retrieval for the same (or a lightly edited) query against unchanged data
+            version = self.data_version
+            cache_match = None
+            response = None
+            if self.query_cache is not None:
+                response, cache_match = self.query_cache.get(version, query_mode, requirement_text)
+                telemetry.increment("kb_query_cache_requests_total", result=cache_match or "miss")
             
-            # Query knowledge base
-            response = await self.rag.aquery(
-                query, 
-                param=QueryParam(mode=query_mode)
-            )
+            if response is None:
+                # Build query
+                query = f"Analyze the following requirements and provide improvement suggestions: {requirement_text}"
+                
+                # Query knowledge base
+                with telemetry.span("kb.lightrag_query", mode=query_mode):
+                    async with self._index_lock.shared():
+                        response = await self.rag.aquery(
+                            query, 
+                            param=QueryParam(mode=query_mode)
+                        )
+                if self.query_cache is not None and response:
+                    self.query_cache.set(version, query_mode, requirement_text, response)
             
             # Parse response and generate suggestions
-            suggestions = self._parse_suggestions(response)
-            questions = self._generate_clarification_questions(requirement_text, response)
+            with telemetry.span("kb.parse_response"):
+                suggestions = self._parse_suggestions(response)
+                questions = self._generate_clarification_questions(requirement_text, response)
             
+            telemetry.increment("kb_queries_total", outcome="success")
             return {
                 "success": True,
                 "suggestions": suggestions,
                 "questions": questions,
-                "raw_response": response
+                "raw_response": response,
+                "cached": cache_match
             }
             
         except Exception as e:
             logging.error(f"Knowledge base query failed: {e}")
+            telemetry.increment("kb_queries_total", outcome="error")
             return {
                 "success": False,
                 "error": str(e),
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+class LLMResponseCache:
+    """Content-addressed LLM response cache with an in-memory LRU tier and a SQLite disk tier"""
+
+    def __init__(self, db_path: str, memory_entries: int = 256, ttl_seconds: float = 7 * 24 * 3600,
+                 max_disk_bytes: int = 256 * 1024 * 1024):
+        self.db_path = Path(db_path)
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_bytes = 0
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "expired": 0,
+            "evictions": 0
+        }
+
+        self._open_disk_tier()
+
+    def _open_disk_tier(self):
+        """Open the SQLite tier; the cache degrades to memory-only on failure"""
+        try:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_access ON llm_responses(last_access)")
+            self._purge_expired()
+            row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()
+            self._disk_bytes = row[0]
+        except Exception as e:
+            logging.warning(f"LLM response cache disk tier unavailable, using memory only: {e}")
+            self._conn = None
+
+    @staticmethod
+    def make_key(provider: str, model_name: str, system_prompt: str, prompt: str, **sampling: Any) -> str:
+        """Hash everything that determines a completion into a cache key"""
+        payload = json.dumps({
+            "provider": provider,
+            "model": model_name,
+            "system_prompt": system_prompt or "",
+            "prompt": prompt,
+            "sampling": sampling
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        """Look up a cached response, promoting disk hits into memory"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, created_at = entry
+                if not self._is_expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        response, created_at = row
+                        if not self._is_expired(created_at, now):
+                            self._conn.execute(
+                                "UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key)
+                            )
+                            self._remember(key, response, created_at)
+                            self.stats["disk_hits"] += 1
+                            return response
+                        self._delete_disk_entry(key)
+                        self.stats["expired"] += 1
+                except Exception as e:
+                    logging.warning(f"LLM response cache read failed: {e}")
+
+            self.stats["misses"] += 1
+            return None
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get() for event loop callers; SQLite runs in a worker thread so the loop never blocks on disk"""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, response: str):
+        """set() for event loop callers, off the loop like aget()"""
+        await asyncio.to_thread(self.set, key, response)
+
+    def set(self, key: str, response: str):
+        """Store a response in both tiers"""
+        if not response:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            self.stats["writes"] += 1
+
+            if self._conn is None:
+                return
+
+            try:
+                size = len(response.encode('utf-8'))
+                previous = self._conn.execute(
+                    "SELECT size FROM llm_responses WHERE key = ?", (key,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_responses (key, response, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, response, size, now, now)
+                )
+                self._disk_bytes += size - (previous[0] if previous else 0)
+
+                if self._disk_bytes > self.max_disk_bytes:
+                    self._purge_expired()
+                    self._evict_to_size()
+            except Exception as e:
+                logging.warning(f"LLM response cache write failed: {e}")
+
+    def _remember(self, key: str, response: str, created_at: float):
+        """Insert into the memory LRU, evicting the least recently used entry"""
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _delete_disk_entry(self, key: str):
+        row = self._conn.execute("SELECT size FROM llm_responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+            self._disk_bytes -= row[0]
+
+    def _purge_expired(self):
+        """Drop disk entries past their TTL"""
+        if self.ttl_seconds <= 0:
+            return
+        cutoff = time.time() - self.ttl_seconds
+        row = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses WHERE created_at < ?", (cutoff,)
+        ).fetchone()
+        if row[0]:
+            self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (cutoff,))
+            self._disk_bytes -= row[1]
+            self.stats["expired"] += row[0]
+
+    def _evict_to_size(self):
+        """Evict least recently accessed disk entries until under the size budget"""
+        # Leave some headroom so we don't evict on every subsequent write
+        target = int(self.max_disk_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, size FROM llm_responses ORDER BY last_access ASC"
+        )
+        evicted = []
+        for key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+
+        if evicted:
+            self._conn.executemany("DELETE FROM llm_responses WHERE key = ?", evicted)
+            self.stats["evictions"] += len(evicted)
+
+    def clear(self):
+        """Remove all cached responses"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM llm_responses")
+                self._disk_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and tier sizes"""
+        with self._lock:
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "hits": hits,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+                "disk_enabled": self._conn is not None
+            }
@@ -1,78 +1,729 @@
 import openai
 import anthropic
-from config import Config
+import httpx
+import asyncio
+import logging
+import re
 import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from config import Config
+from services.llm_cache import LLMResponseCache
+from services.async_runtime import async_runtime
+from services.rate_limit import LimiterPermit, ProviderLimiter, RateLimitTimeout, current_llm_priority, estimate_tokens
+from services.resilience import CircuitBreaker, LatencyTracker, backoff_delay
+from services.telemetry import current_span, telemetry, traced
+
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 2000
+
+# Provider each one fails over to when it is degraded
+FAILOVER_PEERS = {"openai": "anthropic", "anthropic": "openai"}
+
+class LLMServiceError(Exception):
+    """An LLM call failed; the message keeps the "LLM service error: ..." form"""
+    
+    def __init__(self, message: str, provider: Optional[str] = None):
+        super().__init__(f"LLM service error: {message}")
+        self.provider = provider
+
+class RateLimitError(LLMServiceError):
+    """The provider returned 429, or local rate limits left no capacity in time"""
+    
+    def __init__(self, message: str, provider: Optional[str] = None, retry_after: Optional[float] = None):
+        super().__init__(message, provider)
+        self.retry_after = retry_after
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a provider error's Retry-After header, if it has one"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _is_rate_limit(error: Exception) -> bool:
+    return isinstance(error, (openai.RateLimitError, anthropic.RateLimitError)) or \
+        getattr(error, "status_code", None) == 429
+
+def _is_transient(error: Exception) -> bool:
+    """Timeouts, connection failures, 429s and 5xx responses are worth retrying"""
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError,
+                          openai.APIConnectionError, anthropic.APIConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and (status == 429 or status >= 500)
 
 class LLMService:
     def __init__(self):
+        # Async clients share one pooled HTTP transport. They are created lazily
+        # because httpx connection pools are bound to the event loop that opened them.
+        self.http_client = None
         self.openai_client = None
         self.anthropic_client = None
+        self._client_loop = None
+        # Optional httpx transport for the clients, e.g. an in-process ASGI
+        # provider for benchmarks; None uses the network
+        self.http_transport = None
+        
+        self.response_cache = None
+        if Config.LLM_CACHE_ENABLED:
+            self.response_cache = LLMResponseCache(
+                Config.LLM_CACHE_PATH,
+                memory_entries=Config.LLM_CACHE_MEMORY_ENTRIES,
+                ttl_seconds=Config.LLM_CACHE_TTL_SECONDS,
+                max_disk_bytes=int(Config.LLM_CACHE_MAX_DISK_MB * 1024 * 1024)
+            )
+        
+        # Per-provider request/token budgets and adaptive concurrency
+        self.limiters: Dict[str, ProviderLimiter] = {
+            "openai": ProviderLimiter(
+                "openai",
+                requests_per_minute=Config.OPENAI_REQUESTS_PER_MINUTE,
+                tokens_per_minute=Config.OPENAI_TOKENS_PER_MINUTE,
+                initial_concurrency=Config.LLM_INITIAL_CONCURRENCY,
+                min_concurrency=Config.LLM_MIN_CONCURRENCY,
+                max_concurrency=Config.LLM_MAX_CONCURRENCY
+            ),
+            "anthropic": ProviderLimiter(
+                "anthropic",
+                requests_per_minute=Config.ANTHROPIC_REQUESTS_PER_MINUTE,
+                tokens_per_minute=Config.ANTHROPIC_TOKENS_PER_MINUTE,
+                initial_concurrency=Config.LLM_INITIAL_CONCURRENCY,
+                min_concurrency=Config.LLM_MIN_CONCURRENCY,
+                max_concurrency=Config.LLM_MAX_CONCURRENCY
+            )
+        }
+        
+        # Provider health for failover, and recent latencies for hedging delays
+        self.breakers = {
+            provider: CircuitBreaker(Config.LLM_CIRCUIT_FAILURE_THRESHOLD, Config.LLM_CIRCUIT_RESET_SECONDS)
+            for provider in self.limiters
+        }
+        self.latency = {provider: LatencyTracker() for provider in self.limiters}
+        self.resilience_stats = {"retries": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+        
+        async_runtime.add_shutdown_hook(self.close)
+    
+    def _ensure_clients(self):
+        """Create the async provider clients for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client_loop is loop:
+            return
+        
+        self._discard_clients()
+        self.http_client = httpx.AsyncClient(
+            transport=self.http_transport,
+            limits=httpx.Limits(
+                max_connections=Config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.LLM_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(Config.LLM_REQUEST_TIMEOUT, connect=10.0)
+        )
         
         # Initialize OpenAI client
+        self.openai_client = None
         if Config.OPENAI_API_KEY:
-            self.openai_client = openai.OpenAI(api_key=Config.OPENAI_API_KEY)
+            self.openai_client = openai.AsyncOpenAI(
+                api_key=Config.OPENAI_API_KEY,
+                base_url=Config.OPENAI_BASE_URL,
+                http_client=self.http_client,
+                # Retries happen in _complete_resilient, where they respect rate limits and deadlines
+                max_retries=0
+            )
         
         # Initialize Anthropic client
+        self.anthropic_client = None
         if Config.ANTHROPIC_API_KEY:
-            self.anthropic_client = anthropic.Anthropic(api_key=Config.ANTHROPIC_API_KEY)
+            self.anthropic_client = anthropic.AsyncAnthropic(
+                api_key=Config.ANTHROPIC_API_KEY,
+                base_url=Config.ANTHROPIC_BASE_URL,
+                http_client=self.http_client,
+                # Retries happen in _complete_resilient, where they respect rate limits and deadlines
+                max_retries=0
+            )
+        
+        self._client_loop = loop
     
-    async def generate_completion(self, prompt: str, model: str = None, system_prompt: str = ""):
-        """Generate AI response"""
+    def _discard_clients(self):
+        """Let go of the clients of a previous event loop, closing them on that loop if it still runs"""
+        client, loop = self.http_client, self._client_loop
+        self.http_client = None
+        self.openai_client = None
+        self.anthropic_client = None
+        self._client_loop = None
+        if client is None:
+            return
+        
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            def log_failure(future):
+                if not future.cancelled() and future.exception() is not None:
+                    logging.warning(f"Failed to close LLM HTTP client of a previous event loop: {future.exception()}")
+            # The SDK clients share this transport, so closing it closes them too
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).add_done_callback(log_failure)
+        else:
+            logging.info("Dropped the LLM HTTP client of a stopped event loop; its connections went with the loop")
+    
+    def close(self, timeout: float = 5.0):
+        """Close the shared HTTP transport from synchronous code, on the loop it belongs to"""
+        loop = self._client_loop
+        if self.http_client is None or loop is None or not loop.is_running() or loop.is_closed():
+            self._discard_clients()
+            return
+        
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            loop.create_task(self.aclose())
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.aclose(), loop).result(timeout)
+        except Exception as e:
+            logging.warning(f"Failed to close LLM HTTP client: {e}")
+    
+    async def aclose(self):
+        """Close the shared HTTP transport"""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+        self.http_client = None
+        self.openai_client = None
+        self.anthropic_client = None
+        self._client_loop = None
+    
+    @traced("llm.completion", stamp=False)
+    async def generate_completion(self, prompt: str, model: str = None, system_prompt: str = "",
+                                  on_token: Optional[Callable[[str], None]] = None,
+                                  temperature: float = DEFAULT_TEMPERATURE,
+                                  max_tokens: int = DEFAULT_MAX_TOKENS,
+                                  use_cache: Optional[bool] = None,
+                                  priority: Optional[int] = None):
+        """Generate AI response
+        
+        When on_token is given the response is streamed and each text chunk is
+        passed to the callback as it arrives; the full text is still returned.
+        Responses are cached only at temperature 0, since a sampled answer the
+        user retries should come back different; use_cache=True opts a sampled
+        call in (reviews, which have an explicit re-run) and use_cache=False
+        always asks the provider for a fresh response.
+        priority (see services.rate_limit) defaults to the caller's llm_priority().
+        Transient failures are retried, then failed over to the other provider.
+        """
+        current_span().set(model=model or Config.DEFAULT_MODEL, streamed=on_token is not None)
+        if on_token is not None:
+            chunks = []
+            async for chunk in self.stream_completion(prompt, model, system_prompt,
+                                                      temperature, max_tokens, use_cache, priority):
+                chunks.append(chunk)
+                on_token(chunk)
+            return "".join(chunks)
+        
+        selected_model = model or Config.DEFAULT_MODEL
+        
+        try:
+            cache_key = self._cache_key(selected_model, prompt, system_prompt, temperature, max_tokens, use_cache)
+            if cache_key:
+                cached = await self.response_cache.aget(cache_key)
+                telemetry.increment("llm_cache_requests_total", result="miss" if cached is None else "hit")
+                if cached is not None:
+                    return cached
+            
+            self._ensure_clients()
+            
+            if selected_model == "demo":
+                response, provider = await self._demo_completion(prompt, system_prompt), "demo"
+            else:
+                response, provider = await self._complete_resilient(
+                    selected_model, prompt, system_prompt, temperature, max_tokens, priority
+                )
+            
+            # A failover answer came from a different model than the key describes
+            if cache_key and provider == selected_model:
+                await self.response_cache.aset(cache_key, response)
+            return response
+        except LLMServiceError:
+            raise
+        except Exception as e:
+            raise self._wrap_error(selected_model, e) from e
+    
+    async def stream_completion(self, prompt: str, model: str = None, system_prompt: str = "",
+                                temperature: float = DEFAULT_TEMPERATURE,
+                                max_tokens: int = DEFAULT_MAX_TOKENS,
+                                use_cache: Optional[bool] = None,
+                                priority: Optional[int] = None) -> AsyncIterator[str]:
+        """Stream AI response as text chunks
+        
+        A cached response is yielded as a single chunk. The provider's rate
+        limit slot is held until the stream finishes. Retries and failover
+        only happen before the first chunk has been yielded.
+        """
         selected_model = model or Config.DEFAULT_MODEL
         
         try:
-            if selected_model == "openai" and self.openai_client:
-                return await self._openai_completion(prompt, system_prompt)
-            elif selected_model == "anthropic" and self.anthropic_client:
-                return await self._anthropic_completion(prompt, system_prompt)
-            elif selected_model == "demo":
-                return self._demo_completion(prompt, system_prompt)
+            cache_key = self._cache_key(selected_model, prompt, system_prompt, temperature, max_tokens, use_cache)
+            if cache_key:
+                cached = await self.response_cache.aget(cache_key)
+                telemetry.increment("llm_cache_requests_total", result="miss" if cached is None else "hit")
+                if cached is not None:
+                    yield cached
+                    return
+            
+            self._ensure_clients()
+            
+            route = {"provider": selected_model}
+            if selected_model == "demo":
+                stream = self._demo_stream(prompt, system_prompt)
             else:
-                raise Exception(f"Model {selected_model} is not available or API key not configured")
+                stream = self._stream_resilient(
+                    selected_model, prompt, system_prompt, temperature, max_tokens, priority, route
+                )
+            
+            chunks = []
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+            
+            # Only complete streams are cached
+            if cache_key and route["provider"] == selected_model:
+                await self.response_cache.aset(cache_key, "".join(chunks))
+        except LLMServiceError:
+            raise
         except Exception as e:
-            raise Exception(f"LLM service error: {str(e)}")
+            raise self._wrap_error(selected_model, e) from e
+    
+    def _provider_available(self, provider: str) -> bool:
+        return (provider == "openai" and self.openai_client is not None) or \
+            (provider == "anthropic" and self.anthropic_client is not None)
     
-    async def _openai_completion(self, prompt: str, system_prompt: str):
-        """OpenAI GPT-4 completion"""
+    def _provider_plan(self, selected_model: str) -> List[str]:
+        """Providers to try in order: the selected one, then its failover peer"""
+        if not self._provider_available(selected_model):
+            raise Exception(f"Model {selected_model} is not available or API key not configured")
+        
+        plan = [selected_model]
+        peer = FAILOVER_PEERS.get(selected_model)
+        if Config.LLM_FAILOVER_ENABLED and peer and self._provider_available(peer):
+            plan.append(peer)
+        return plan
+    
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        """Jittered backoff, never shorter than the provider's Retry-After"""
+        return max(
+            backoff_delay(attempt, Config.LLM_RETRY_BASE_DELAY, Config.LLM_RETRY_MAX_DELAY),
+            _retry_after(error) or 0.0
+        )
+    
+    async def _complete_resilient(self, selected_model: str, prompt: str, system_prompt: str,
+                                  temperature: float, max_tokens: int,
+                                  priority: Optional[int]) -> Tuple[str, str]:
+        """Completion with retries, hedging and failover; returns (text, provider that answered)
+        
+        Transient errors (timeouts, connection failures, 429s, 5xx) are retried
+        with jittered exponential backoff. Once a provider's retries are spent
+        or its circuit is open, the failover peer gets the remaining attempts.
+        The whole call, including backoff, is bounded by one deadline.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.LLM_CALL_DEADLINE_SECONDS
+        plan = self._provider_plan(selected_model)
+        last_error: Optional[Exception] = None
+        
+        for index, provider in enumerate(plan):
+            if index > 0:
+                self._count("failovers", provider=provider)
+            breaker = self.breakers[provider]
+            
+            for attempt in range(Config.LLM_MAX_RETRIES + 1):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise self._deadline_error(selected_model, last_error) from last_error
+                if not breaker.allow():
+                    last_error = last_error or LLMServiceError(f"{provider} is degraded (circuit open)", provider)
+                    break
+                
+                try:
+                    response = await asyncio.wait_for(
+                        self._hedged_completion(provider, prompt, system_prompt, temperature, max_tokens, priority),
+                        remaining
+                    )
+                    breaker.record_success()
+                    return response, provider
+                except RateLimitError as e:
+                    # Local rate limits left no capacity; the peer may have some
+                    last_error = e
+                    break
+                except Exception as e:
+                    if not _is_transient(e):
+                        raise
+                    breaker.record_failure()
+                    last_error = e
+                
+                if attempt == Config.LLM_MAX_RETRIES:
+                    break
+                delay = self._retry_delay(attempt, last_error)
+                if loop.time() + delay >= deadline:
+                    break
+                self._count("retries", provider=provider)
+                await asyncio.sleep(delay)
+        
+        if loop.time() >= deadline:
+            raise self._deadline_error(selected_model, last_error) from last_error
+        raise last_error
+    
+    def _deadline_error(self, selected_model: str, last_error: Optional[Exception]) -> LLMServiceError:
+        """The error for a call that ran out of time, counted in the resilience stats"""
+        self._count("deadline_exceeded", provider=selected_model)
+        return LLMServiceError(
+            f"no response within the {Config.LLM_CALL_DEADLINE_SECONDS:g}s deadline ({last_error})", selected_model
+        )
+    
+    def _hedge_delay(self, provider: str) -> Optional[float]:
+        """When to fire a hedge request: the provider's recent p95 latency"""
+        if not Config.LLM_HEDGE_ENABLED:
+            return None
+        tracker = self.latency[provider]
+        if len(tracker) < Config.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return tracker.percentile(Config.LLM_HEDGE_PERCENTILE)
+    
+    async def _hedged_completion(self, provider: str, prompt: str, system_prompt: str,
+                                 temperature: float, max_tokens: int, priority: Optional[int]) -> str:
+        """One attempt, plus a second identical request if the first is slower than usual
+        
+        Whichever request succeeds first wins and the other is cancelled. The
+        hedge only starts if the provider has capacity right away.
+        """
+        primary = asyncio.ensure_future(
+            self._provider_completion(provider, prompt, system_prompt, temperature, max_tokens, priority)
+        )
+        delay = self._hedge_delay(provider)
+        if delay is None:
+            return await primary
+        
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except BaseException:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+        
+        self._count("hedges", provider=provider)
+        hedge = asyncio.ensure_future(
+            self._provider_completion(provider, prompt, system_prompt, temperature, max_tokens, priority, hedge=True)
+        )
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count("hedge_wins", provider=provider)
+                        return task.result()
+            raise primary.exception()
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+                # Keep a loser's late failure from being logged as unretrieved
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    
+    async def _provider_completion(self, provider: str, prompt: str, system_prompt: str,
+                                   temperature: float, max_tokens: int, priority: Optional[int],
+                                   hedge: bool = False) -> str:
+        """A single rate-limited request to one provider"""
+        completion = self._openai_completion if provider == "openai" else self._anthropic_completion
+        with telemetry.span("llm.request", provider=provider, hedge=hedge):
+            permit = await self._admit(provider, prompt, system_prompt, max_tokens, priority, max_wait=0 if hedge else None)
+            started = time.monotonic()
+            try:
+                response, used_tokens = await completion(prompt, system_prompt, temperature, max_tokens)
+            except BaseException as e:
+                self._release_failed(permit, e)
+                self._record_request(provider, e, started, prompt, system_prompt)
+                raise
+            permit.release(used_tokens=used_tokens)
+            self.latency[provider].record(time.monotonic() - started)
+            self._record_request(provider, None, started, prompt, system_prompt, response)
+            return response
+    
+    async def _stream_resilient(self, selected_model: str, prompt: str, system_prompt: str,
+                                temperature: float, max_tokens: int, priority: Optional[int],
+                                route: Dict[str, str]) -> AsyncIterator[str]:
+        """Stream from the first provider that produces output
+        
+        Retries and failover cover everything up to the first chunk; after
+        that the caller has seen partial output and errors propagate. Each
+        attempt is bounded by the HTTP timeout and the whole call by the
+        deadline, checked between attempts. route["provider"] records which
+        provider answered.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.LLM_CALL_DEADLINE_SECONDS
+        last_error: Optional[Exception] = None
+        
+        for index, provider in enumerate(self._provider_plan(selected_model)):
+            if index > 0:
+                self._count("failovers", provider=provider)
+            breaker = self.breakers[provider]
+            open_stream = self._openai_stream if provider == "openai" else self._anthropic_stream
+            
+            for attempt in range(Config.LLM_MAX_RETRIES + 1):
+                if loop.time() >= deadline:
+                    raise self._deadline_error(selected_model, last_error) from last_error
+                if not breaker.allow():
+                    last_error = last_error or LLMServiceError(f"{provider} is degraded (circuit open)", provider)
+                    break
+                
+                try:
+                    permit = await self._admit(provider, prompt, system_prompt, max_tokens, priority)
+                except RateLimitError as e:
+                    last_error = e
+                    break
+                
+                stream = open_stream(prompt, system_prompt, temperature, max_tokens)
+                started = time.monotonic()
+                chunks = []
+                try:
+                    try:
+                        chunks.append(await stream.__anext__())
+                    except StopAsyncIteration:
+                        pass
+                except BaseException as e:
+                    self._release_failed(permit, e)
+                    self._record_request(provider, e, started, prompt, system_prompt)
+                    await stream.aclose()
+                    if not isinstance(e, Exception) or not _is_transient(e):
+                        raise
+                    breaker.record_failure()
+                    last_error = e
+                    
+                    if attempt == Config.LLM_MAX_RETRIES:
+                        break
+                    delay = self._retry_delay(attempt, e)
+                    if loop.time() + delay >= deadline:
+                        break
+                    self._count("retries", provider=provider)
+                    await asyncio.sleep(delay)
+                    continue
+                
+                # Committed to this provider from the first chunk on
+                breaker.record_success()
+                route["provider"] = provider
+                try:
+                    for chunk in chunks:
+                        yield chunk
+                    async for chunk in stream:
+                        chunks.append(chunk)
+                        yield chunk
+                except BaseException as e:
+                    self._release_failed(permit, e)
+                    self._record_request(provider, e, started, prompt, system_prompt, "".join(chunks))
+                    raise
+                finally:
+                    await stream.aclose()
+                permit.release(
+                    used_tokens=estimate_tokens(system_prompt) + estimate_tokens(prompt) + estimate_tokens("".join(chunks))
+                )
+                self._record_request(provider, None, started, prompt, system_prompt, "".join(chunks))
+                return
+        
+        if loop.time() >= deadline:
+            raise self._deadline_error(selected_model, last_error) from last_error
+        raise last_error
+    
+    def stream_completion_sync(self, prompt: str, model: str = None, system_prompt: str = "",
+                               temperature: float = DEFAULT_TEMPERATURE,
+                               max_tokens: int = DEFAULT_MAX_TOKENS,
+                               use_cache: Optional[bool] = None,
+                               priority: Optional[int] = None) -> Iterator[str]:
+        """Synchronous generator over stream_completion for non-async callers"""
+        return async_runtime.iterate_sync(
+            self.stream_completion(prompt, model, system_prompt, temperature, max_tokens, use_cache, priority)
+        )
+    
+    def _cache_key(self, selected_model: str, prompt: str, system_prompt: str,
+                   temperature: float, max_tokens: int, use_cache: Optional[bool]) -> Optional[str]:
+        """Build the response cache key, or None when caching is off for this call"""
+        if self.response_cache is None or use_cache is False:
+            return None
+        if use_cache is None and temperature > 0:
+            # Sampled output is only frozen where the caller asked for it
+            return None
+        
+        # The endpoint is part of the model identity, so responses from a mock
+        # or proxy endpoint are never served for the real provider
+        model_names = {
+            "openai": f"{Config.OPENAI_MODEL}@{Config.OPENAI_BASE_URL}" if Config.OPENAI_BASE_URL else Config.OPENAI_MODEL,
+            "anthropic": f"{Config.ANTHROPIC_MODEL}@{Config.ANTHROPIC_BASE_URL}" if Config.ANTHROPIC_BASE_URL else Config.ANTHROPIC_MODEL
+        }
+        return LLMResponseCache.make_key(
+            selected_model,
+            model_names.get(selected_model, selected_model),
+            system_prompt,
+            prompt,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    
+    async def _admit(self, provider: str, prompt: str, system_prompt: str, max_tokens: int,
+                     priority: Optional[int], max_wait: Optional[float] = None) -> LimiterPermit:
+        """Wait for the provider's rate limits and concurrency limit to admit a call
+        
+        The token reservation counts max_tokens in full, as providers do, and
+        is trued up from actual usage when the call completes.
+        """
+        tokens = estimate_tokens(system_prompt) + estimate_tokens(prompt) + max_tokens
+        try:
+            return await self.limiters[provider].acquire(
+                tokens,
+                priority if priority is not None else current_llm_priority(),
+                max_wait=max_wait if max_wait is not None else (Config.LLM_RATE_LIMIT_MAX_WAIT_SECONDS or None)
+            )
+        except RateLimitTimeout as e:
+            raise RateLimitError(str(e), provider) from e
+    
+    def _release_failed(self, permit: LimiterPermit, error: BaseException):
+        """Report a failed call to its limiter; 429s shrink the concurrency limit"""
+        if isinstance(error, Exception) and _is_rate_limit(error):
+            permit.release(succeeded=False, rate_limited=True, retry_after=_retry_after(error))
+        else:
+            permit.release(succeeded=False)
+    
+    def _wrap_error(self, provider: str, error: Exception) -> LLMServiceError:
+        if _is_rate_limit(error):
+            return RateLimitError(f"{provider} rate limit exceeded: {error}", provider, _retry_after(error))
+        return LLMServiceError(str(error), provider)
+    
+    def _count(self, stat: str, **labels):
+        """Bump a resilience counter and its exported metric"""
+        self.resilience_stats[stat] += 1
+        telemetry.increment(f"llm_{stat}_total", **labels)
+    
+    def _record_request(self, provider: str, error: Optional[BaseException], started: float,
+                        prompt: str, system_prompt: str, response: str = ""):
+        """Export one provider request's outcome, duration and (estimated) token counts"""
+        if error is None:
+            outcome = "success"
+        elif not isinstance(error, Exception):
+            outcome = "cancelled"
+        else:
+            outcome = "rate_limited" if _is_rate_limit(error) else "error"
+        telemetry.increment("llm_requests_total", provider=provider, outcome=outcome)
+        telemetry.observe("llm_request_duration_seconds", time.monotonic() - started, provider=provider)
+        telemetry.increment("llm_tokens_total", estimate_tokens(system_prompt) + estimate_tokens(prompt),
+                            provider=provider, direction="in")
+        if response:
+            telemetry.increment("llm_tokens_total", estimate_tokens(response), provider=provider, direction="out")
+    
+    def get_resilience_stats(self) -> Dict[str, Any]:
+        """Retry, hedge and failover counters with per-provider health and latency"""
+        return {
+            **self.resilience_stats,
+            "providers": {
+                provider: {
+                    "circuit": self.breakers[provider].get_stats(),
+                    "p50_seconds": self.latency[provider].percentile(50),
+                    "p95_seconds": self.latency[provider].percentile(95)
+                }
+                for provider in self.breakers
+            }
+        }
+    
+    def get_rate_limit_stats(self) -> Dict[str, Any]:
+        """Per-provider admission counters and current concurrency limits"""
+        return {provider: limiter.get_stats() for provider, limiter in self.limiters.items()}
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get response cache hit/miss counters"""
+        if self.response_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.response_cache.get_stats()}
+    
+    def _openai_messages(self, prompt: str, system_prompt: str) -> List[Dict[str, str]]:
+        """Build OpenAI chat messages"""
         messages = []
         
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         
         messages.append({"role": "user", "content": prompt})
-        
-        response = self.openai_client.chat.completions.create(
+        return messages
+    
+    def _anthropic_messages(self, prompt: str, system_prompt: str) -> List[Dict[str, str]]:
+        """Build Anthropic messages"""
+        if system_prompt:
+            return [{"role": "user", "content": f"{system_prompt}\n\n{prompt}"}]
+        return [{"role": "user", "content": prompt}]
+    
+    async def _openai_completion(self, prompt: str, system_prompt: str, temperature: float,
+                                 max_tokens: int) -> Tuple[str, Optional[int]]:
+        """OpenAI GPT-4 completion, with the tokens it used"""
+        response = await self.openai_client.chat.completions.create(
             model=Config.OPENAI_MODEL,
-            messages=messages,
-            temperature=0.7,
-            max_tokens=2000
+            messages=self._openai_messages(prompt, system_prompt),
+            temperature=temperature,
+            max_tokens=max_tokens
         )
         
-        return response.choices[0].message.content
+        usage = response.usage.total_tokens if response.usage else None
+        return response.choices[0].message.content, usage
     
-    async def _anthropic_completion(self, prompt: str, system_prompt: str):
-        """Anthropic Claude completion"""
-        messages = []
-        
-        if system_prompt:
-            messages.append({"role": "user", "content": f"{system_prompt}\n\n{prompt}"})
-        else:
-            messages.append({"role": "user", "content": prompt})
+    async def _openai_stream(self, prompt: str, system_prompt: str, temperature: float, max_tokens: int):
+        """OpenAI GPT-4 streaming completion"""
+        stream = await self.openai_client.chat.completions.create(
+            model=Config.OPENAI_MODEL,
+            messages=self._openai_messages(prompt, system_prompt),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
         
-        response = self.anthropic_client.messages.create(
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    async def _anthropic_completion(self, prompt: str, system_prompt: str, temperature: float,
+                                    max_tokens: int) -> Tuple[str, Optional[int]]:
+        """Anthropic Claude completion, with the tokens it used"""
+        response = await self.anthropic_client.messages.create(
             model=Config.ANTHROPIC_MODEL,
-            max_tokens=2000,
-            temperature=0.7,
-            messages=messages
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=self._anthropic_messages(prompt, system_prompt)
         )
         
-        return response.content[0].text
+        usage = response.usage.input_tokens + response.usage.output_tokens if response.usage else None
+        return response.content[0].text, usage
+    
+    async def _anthropic_stream(self, prompt: str, system_prompt: str, temperature: float, max_tokens: int):
+        """Anthropic Claude streaming completion"""
+        async with self.anthropic_client.messages.stream(
+            model=Config.ANTHROPIC_MODEL,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            messages=self._anthropic_messages(prompt, system_prompt)
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
     
-    def _demo_completion(self, prompt: str, system_prompt: str):
+    async def _demo_completion(self, prompt: str, system_prompt: str):
         """Demo mode response"""
-        # Simulate AI thinking time
-        time.sleep(1)
-        
+        # Simulate AI thinking time without blocking the event loop
+        await asyncio.sleep(1)
+        return self._demo_response(prompt, system_prompt)
+    
+    async def _demo_stream(self, prompt: str, system_prompt: str):
+        """Demo mode streaming response, emitted word by word"""
+        await asyncio.sleep(0.2)
+        for chunk in re.findall(r"\S+\s*|\s+", self._demo_response(prompt, system_prompt)):
+            yield chunk
+            await asyncio.sleep(0.005)
+    
+    def _demo_response(self, prompt: str, system_prompt: str) -> str:
+        """Canned demo mode response text"""
         if "requirement" in prompt.lower() and "enhance" in system_prompt.lower():
             return """## Enhanced Requirements Document
 
@@ -0,0 +1,336 @@
+"""
+Token-budgeted prompt assembly for requirement clarification
+
+A clarification used to resend the whole requirement document, which grows
+with every turn. ClarificationPromptBuilder fits the prompt into an input
+token budget instead: earlier turns are carried as a rolling summary, and
+when the document does not fit only the sections most relevant to the
+question are sent. The model then returns just the sections it changes,
+which merge_sections() writes back into the full document.
+"""
+
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import anthropic
+
+from config import Config
+from services.rate_limit import estimate_tokens
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "the and for are but not you all any can had has have her was one our out this that with from they "
+    "will would there their what when which who how why should shall must may also into than then them "
+    "these those such only other more some each about please does need want".split()
+)
+
+class TokenCounter:
+    """Counts tokens with each provider's tokenizer where one is available
+
+    OpenAI text is counted with tiktoken when it is installed; Anthropic text
+    with the tokenizer bundled in the anthropic SDK (exact for older models,
+    close for current ones). Other models, or a missing tokenizer, fall back
+    to the four-characters-per-token estimate.
+    """
+
+    def __init__(self):
+        self._encoders: Dict[str, Optional[Callable[[str], int]]] = {}
+        self._lock = threading.Lock()
+
+    def _encoder(self, provider: str) -> Optional[Callable[[str], int]]:
+        with self._lock:
+            if provider in self._encoders:
+                return self._encoders[provider]
+
+            encoder = None
+            try:
+                if provider == "openai" and TIKTOKEN_AVAILABLE:
+                    try:
+                        encoding = tiktoken.encoding_for_model(Config.OPENAI_MODEL)
+                    except KeyError:
+                        encoding = tiktoken.get_encoding("cl100k_base")
+                    encoder = lambda text: len(encoding.encode(text, disallowed_special=()))
+                elif provider == "anthropic":
+                    # Loading the tokenizer makes no API call
+                    tokenizer = anthropic.Anthropic(api_key=Config.ANTHROPIC_API_KEY or "unused").get_tokenizer()
+                    encoder = lambda text: len(tokenizer.encode(text).ids)
+            except Exception as e:
+                logging.warning(f"No {provider} tokenizer, estimating token counts: {e}")
+
+            self._encoders[provider] = encoder
+            return encoder
+
+    def count(self, text: str, provider: str = None) -> int:
+        if not text:
+            return 0
+        encoder = self._encoder(provider or Config.DEFAULT_MODEL)
+        return encoder(text) if encoder else estimate_tokens(text)
+
+    def truncate(self, text: str, max_tokens: int, provider: str = None) -> str:
+        """Cut text to roughly max_tokens, at a word boundary"""
+        tokens = self.count(text, provider)
+        if tokens <= max_tokens:
+            return text
+        if max_tokens <= 0:
+            return ""
+        cut = text[:int(len(text) * max_tokens / tokens)]
+        return cut[:cut.rfind(" ")] + " ..." if " " in cut else cut
+
+@dataclass
+class Section:
+    """A Markdown section; the preamble before the first heading has no heading"""
+    heading: str
+    text: str
+
+    @property
+    def key(self) -> str:
+        return _heading_key(self.heading)
+
+def _heading_key(heading: str) -> str:
+    """Heading identity for merging: no #s, numbering, emphasis or case"""
+    match = _HEADING.match(heading.strip())
+    title = match.group(2) if match else heading
+    title = re.sub(r"^[\d.)\s]+", "", title.replace("*", "").replace("_", ""))
+    return " ".join(title.lower().split())
+
+def split_sections(document: str) -> List[Section]:
+    """Split Markdown into sections at each heading, keeping the text verbatim"""
+    sections: List[Section] = []
+    heading, lines = "", []
+    in_code = False
+    for line in document.splitlines(keepends=True):
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        if not in_code and _HEADING.match(line.strip()):
+            if heading or "".join(lines).strip():
+                sections.append(Section(heading, "".join(lines)))
+            heading, lines = line.strip(), [line]
+        else:
+            lines.append(line)
+    if heading or "".join(lines).strip():
+        sections.append(Section(heading, "".join(lines)))
+    return sections
+
+def _terms(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if len(word) > 2 and word not in _STOPWORDS]
+
+def rank_sections(sections: List[Section], query: str) -> List[int]:
+    """Section indexes ordered by relevance to the query (TF-IDF overlap, headings weighted double)"""
+    query_terms = set(_terms(query))
+    section_terms = [Counter(_terms(section.text)) + Counter(_terms(section.heading)) for section in sections]
+    document_frequency = Counter(term for terms in section_terms for term in terms)
+
+    def score(index: int) -> float:
+        terms = section_terms[index]
+        return sum(
+            (1 + math.log(terms[term])) * math.log(1 + len(sections) / document_frequency[term])
+            for term in query_terms if terms[term]
+        )
+
+    return sorted(range(len(sections)), key=lambda index: (-score(index), index))
+
+def merge_sections(document: str, updates: str, question: str = "", append_to: Set[str] = frozenset()) -> str:
+    """Write updated sections back into a document
+
+    Sections whose heading matches an existing one replace it, except those
+    keyed in append_to (sent truncated), whose new text is added to the end.
+    Others are appended. A reply without any headings is appended as a
+    clarification section, so nothing the model wrote is lost.
+    """
+    sections = split_sections(document)
+    updated = [section for section in split_sections(updates) if section.heading]
+    if not updated:
+        if not updates.strip():
+            return document
+        title = question.strip().splitlines()[0][:80] if question.strip() else "Additional information"
+        updated = [Section(f"## Clarification: {title}", f"## Clarification: {title}\n\n{updates.strip()}\n")]
+
+    positions = {section.key: index for index, section in enumerate(sections) if section.heading}
+    for section in updated:
+        text = section.text if section.text.endswith("\n") else section.text + "\n"
+        if section.key in positions and section.key in append_to:
+            existing = sections[positions[section.key]]
+            addition = text.split("\n", 1)[1] if "\n" in text else ""
+            sections[positions[section.key]] = Section(existing.heading, existing.text.rstrip("\n") + "\n\n" + addition)
+        elif section.key in positions:
+            sections[positions[section.key]] = Section(section.heading, text)
+        else:
+            positions[section.key] = len(sections)
+            sections.append(Section(section.heading, text))
+
+    merged = ""
+    for section in sections:
+        # Keep a blank line between sections whatever the model's spacing
+        if merged and not merged.endswith("\n\n"):
+            merged += "\n" if merged.endswith("\n") else "\n\n"
+        merged += section.text
+    return merged
+
+def changed_headings(updates: str) -> List[str]:
+    """Titles of the sections in a partial reply"""
+    return [_HEADING.match(section.heading).group(2) for section in split_sections(updates) if section.heading]
+
+@dataclass
+class ConversationSummary:
+    """Rolling digest of earlier clarification turns
+
+    Each turn adds one line (the question and the sections it changed), so
+    it grows slowly and needs no extra LLM call; when rendered over budget,
+    the oldest lines are folded into a count.
+    """
+    turns: List[str] = field(default_factory=list)
+    max_turns: int = 50
+
+    def add_turn(self, question: str, changed: List[str]):
+        question = " ".join(question.split())
+        if len(question) > 200:
+            question = question[:200] + "..."
+        outcome = f"updated {', '.join(changed)}" if changed else "updated the document"
+        self.turns.append(f"{question} → {outcome}")
+        del self.turns[:-self.max_turns]
+
+    def render(self, max_tokens: int, counter: TokenCounter, provider: str = None) -> str:
+        """Most recent turns that fit in max_tokens, oldest first"""
+        kept: List[str] = []
+        used = 0
+        for turn in reversed(self.turns):
+            cost = counter.count(turn, provider) + 2
+            if used + cost > max_tokens:
+                break
+            kept.append(f"- {turn}")
+            used += cost
+        folded = len(self.turns) - len(kept)
+        if folded:
+            kept.append(f"- ({folded} earlier clarifications not shown)")
+        return "\n".join(reversed(kept))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"turns": list(self.turns)}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "ConversationSummary":
+        return cls(turns=list((data or {}).get("turns", [])))
+
+@dataclass
+class ClarificationPrompt:
+    prompt: str
+    # Only some sections were sent; the reply holds changed sections to merge
+    partial: bool
+    sections_sent: int
+    sections_total: int
+    tokens: int
+    # Keys of sections sent cut short; replies to them are added, not replaced
+    truncated: Set[str] = field(default_factory=set)
+
+class ClarificationPromptBuilder:
+    """Assembles clarification prompts within an input token budget
+
+    The question and instructions always go in. The conversation summary and
+    knowledge base insights get capped shares, and the requirement document
+    the rest: whole when it fits, otherwise its most relevant sections.
+    """
+
+    def __init__(self, counter: TokenCounter = None, input_budget: int = None,
+                 summary_budget: int = None, kb_budget: int = None):
+        self.counter = counter or TokenCounter()
+        self.input_budget = input_budget or Config.CLARIFY_INPUT_TOKEN_BUDGET
+        self.summary_budget = summary_budget if summary_budget is not None else Config.CLARIFY_SUMMARY_TOKEN_BUDGET
+        self.kb_budget = kb_budget if kb_budget is not None else Config.CLARIFY_KB_TOKEN_BUDGET
+
+    def context_query(self, requirement: str, question: str, max_tokens: int = 500, provider: str = None) -> str:
+        """Knowledge base query text: the question plus the section it is most about"""
+        sections = split_sections(requirement)
+        if not sections:
+            return question
+        best = sections[rank_sections(sections, question)[0]]
+        return f"{question}\n\n{self.counter.truncate(best.text, max_tokens, provider)}"
+
+    def build(self, requirement: str, question: str, suggestions: List[str],
+              conversation: Optional[ConversationSummary], provider: str = None,
+              system_prompt: str = "") -> ClarificationPrompt:
+        count = lambda text: self.counter.count(text, provider)
+
+        summary = conversation.render(self.summary_budget, self.counter, provider) if conversation else ""
+        insights = []
+        insights_used = 0
+        for suggestion in suggestions:
+            cost = count(suggestion) + 2
+            if insights_used + cost > self.kb_budget:
+                break
+            insights.append(f"- {suggestion}")
+            insights_used += cost
+
+        def assemble(document: str, partial: bool, shown: int, total: int) -> str:
+            if partial:
+                prompt = f"""Current requirement document (excerpt: the {shown} of {total} sections most relevant to the question; the other sections are unchanged and not shown):
+"{document}"
+
+"""
+            else:
+                prompt = f"""Current requirement document:
+"{document}"
+
+"""
+            if summary:
+                prompt += f"""Earlier clarifications in this conversation:
+{summary}
+
+"""
+            prompt += f"""User question or additional information:
+"{question}"
+
+"""
+            if insights:
+                prompt += f"""Relevant knowledge base insights:
+{chr(10).join(insights)}
+
+"""
+            if partial:
+                prompt += """Please update the requirement document based on the user's input and knowledge base insights. Return only the sections you change or add, each starting with its Markdown heading exactly as shown (use a new heading for a new section). Do not repeat unchanged sections. For a section marked [truncated], return only the text to add to it, under its heading."""
+            else:
+                prompt += """Please update and refine the requirement document based on the user's input and knowledge base insights. Ensure the new requirement is clearer, more complete, and follows best practices."""
+            return prompt
+
+        overhead = count(system_prompt) + count(assemble("", True, 0, 0))
+        available = self.input_budget - overhead
+
+        sections = split_sections(requirement)
+        full_prompt = assemble(requirement, False, len(sections), len(sections))
+        full_tokens = count(system_prompt) + count(full_prompt)
+        if full_tokens <= self.input_budget:
+            return ClarificationPrompt(full_prompt, False, len(sections), len(sections), full_tokens)
+
+        # Most relevant sections first, always including at least the best one
+        chosen, used = [], 0
+        for index in rank_sections(sections, question):
+            cost = count(sections[index].text)
+            if used + cost > available:
+                if not chosen:
+                    chosen.append(index)
+                    used = available
+                continue
+            chosen.append(index)
+            used += cost
+
+        parts, truncated = [], set()
+        for index in sorted(chosen):
+            section = sections[index]
+            text = section.text
+            if count(text) > available:
+                text = self.counter.truncate(text, max(available - 10, 0), provider) + "\n[truncated]"
+                truncated.add(section.key)
+            parts.append(text.rstrip("\n"))
+        prompt = assemble("\n\n".join(parts), True, len(chosen), len(sections))
+        return ClarificationPrompt(prompt, True, len(chosen), len(sections), count(system_prompt) + count(prompt), truncated)
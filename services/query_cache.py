@@ -0,0 +1,105 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from services.document_similarity import MinHasher, SimilarityIndex
+
+def normalize_query(text: str) -> str:
+    """Case- and whitespace-insensitive form of a query"""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+class KnowledgeQueryCache:
+    """LRU cache of knowledge base retrieval results
+
+    Entries are keyed on normalized query text plus query mode and are all
+    dropped when the knowledge base version changes. With near-duplicate
+    lookup enabled, a query that misses exactly can still reuse the entry of
+    a lightly edited earlier query whose MinHash similarity clears the
+    threshold.
+    """
+
+    def __init__(self, max_entries: int = 256, near_duplicate_threshold: Optional[float] = 0.85):
+        self.max_entries = max_entries
+        self.near_duplicate_threshold = near_duplicate_threshold
+
+        self._lock = threading.Lock()
+        self._version: Optional[Hashable] = None
+        self._entries: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        # Short texts need short shingles for similarity to mean anything
+        self._minhasher = MinHasher(num_perm=64, shingle_size=2)
+        self._near_indexes: Dict[str, SimilarityIndex] = {}
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def near_duplicates_enabled(self) -> bool:
+        return bool(self.near_duplicate_threshold) and self.near_duplicate_threshold < 1.0
+
+    def _sync_version(self, version: Hashable):
+        if version != self._version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._version = version
+            self._entries.clear()
+            self._near_indexes.clear()
+
+    def get(self, version: Hashable, query_mode: str, text: str) -> Tuple[Optional[Any], Optional[str]]:
+        """Look up a result; returns (value, "exact" | "near") or (None, None)"""
+        normalized = normalize_query(text)
+        key = (query_mode, normalized)
+        with self._lock:
+            self._sync_version(version)
+
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key], "exact"
+
+            index = self._near_indexes.get(query_mode)
+            if self.near_duplicates_enabled and index is not None and len(index):
+                matches = index.query(
+                    self._minhasher.signature(normalized), top_k=1, min_similarity=self.near_duplicate_threshold
+                )
+                if matches:
+                    near_key = (query_mode, matches[0][0])
+                    if near_key in self._entries:
+                        self._entries.move_to_end(near_key)
+                        self.stats["near_hits"] += 1
+                        return self._entries[near_key], "near"
+
+            self.stats["misses"] += 1
+            return None, None
+
+    def set(self, version: Hashable, query_mode: str, text: str, value: Any):
+        """Store a result for the current version"""
+        normalized = normalize_query(text)
+        key = (query_mode, normalized)
+        with self._lock:
+            self._sync_version(version)
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+
+            if self.near_duplicates_enabled:
+                index = self._near_indexes.setdefault(query_mode, SimilarityIndex(num_perm=64, bands=16))
+                index.add(normalized, self._minhasher.signature(normalized))
+
+            while len(self._entries) > self.max_entries:
+                (evicted_mode, evicted_text), _ = self._entries.popitem(last=False)
+                evicted_index = self._near_indexes.get(evicted_mode)
+                if evicted_index is not None:
+                    evicted_index.remove(evicted_text)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._near_indexes.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["near_hits"] + self.stats["misses"]
+            hits = self.stats["hits"] + self.stats["near_hits"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0
+            }
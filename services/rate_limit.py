@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# Priority classes for LLM calls; lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_BACKGROUND = 2
+
+_llm_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+@contextmanager
+def llm_priority(priority: int):
+    """Run the LLM calls made inside the block (and the tasks it starts) at a priority"""
+    token = _llm_priority.set(priority)
+    try:
+        yield
+    finally:
+        _llm_priority.reset(token)
+
+def current_llm_priority() -> int:
+    return _llm_priority.get()
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for budgeting"""
+    return len(text) // 4 + 1
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate
+
+    Not a waiter itself: ProviderLimiter polls wait_time() so it can decide
+    who goes first. A rate of 0 or less means unlimited.
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.per_minute = per_minute
+        self.capacity = burst if burst is not None else max(per_minute, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.per_minute <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount tokens are available (0 if they are now)"""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        # A request larger than the bucket could never fit; let it through on a full bucket
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self._tokens) * 60.0 / self.per_minute)
+
+    def take(self, amount: float):
+        """Consume tokens; callers check wait_time() first"""
+        if not self.unlimited:
+            self._tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        """Return tokens reserved for work that turned out smaller"""
+        if not self.unlimited and amount > 0:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+class RateLimitTimeout(Exception):
+    """No capacity became available within the caller's wait budget"""
+
+class ProviderLimiter:
+    """Admission control for one LLM provider
+
+    Combines requests-per-minute and tokens-per-minute buckets with an
+    adaptive concurrency limit. Waiters are admitted in priority order
+    (interactive before batch before background), FIFO within a class.
+
+    Concurrency follows AIMD: every window of successful calls as large as
+    the current limit raises it by one, and a 429 from the provider halves it
+    and pauses admissions for the provider's retry-after.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 initial_concurrency: int = 8, min_concurrency: int = 1, max_concurrency: int = 32):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = max(min_concurrency, min(initial_concurrency, max_concurrency))
+
+        self.in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._changed: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {"admitted": 0, "rate_limited": 0, "timeouts": 0, "throttled_seconds": 0.0}
+
+    def _changed_event(self) -> asyncio.Event:
+        # Events bind to the loop that waits on them, like the pooled HTTP clients
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._changed = asyncio.Event()
+            self._waiters = []
+        return self._changed
+
+    def _notify(self):
+        """Wake every waiter so the next one in line can re-check admission"""
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    def _admission_delay(self, tokens: int) -> float:
+        """Seconds until a request of this size may start, ignoring concurrency"""
+        return max(
+            self._paused_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(tokens)
+        )
+
+    async def acquire(self, tokens: int, priority: int = PRIORITY_INTERACTIVE,
+                      max_wait: Optional[float] = None) -> "LimiterPermit":
+        """Wait for admission; raises RateLimitTimeout after max_wait seconds"""
+        self._changed_event()
+        entry = (priority, next(self._sequence))
+        started = time.monotonic()
+        deadline = started + max_wait if max_wait is not None else None
+
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                timeout = None
+                if self._waiters[0] == entry and self.in_flight < self.concurrency_limit:
+                    delay = self._admission_delay(tokens)
+                    if delay <= 0:
+                        break
+                    timeout = delay
+
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise RateLimitTimeout(f"{self.name} capacity not available within {max_wait:g}s")
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+
+                # Nothing changes between the checks above and this wait, since
+                # the loop is single-threaded, so no wake-up can be missed
+                try:
+                    await asyncio.wait_for(self._changed_event().wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            self._notify()
+
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+        self.stats["throttled_seconds"] = round(self.stats["throttled_seconds"] + time.monotonic() - started, 3)
+        return LimiterPermit(self, tokens)
+
+    def _release(self, succeeded: bool, rate_limited: bool, retry_after: Optional[float],
+                 reserved_tokens: int, used_tokens: Optional[int]):
+        self.in_flight -= 1
+        if used_tokens is not None:
+            self.tokens.give_back(reserved_tokens - used_tokens)
+
+        if rate_limited:
+            # Multiplicative decrease, and no new admissions until the provider allows it
+            self.stats["rate_limited"] += 1
+            self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit // 2)
+            self._successes = 0
+            self._paused_until = max(self._paused_until, time.monotonic() + (retry_after or 1.0))
+        elif succeeded:
+            # Additive increase: one more slot per window of successes
+            self._successes += 1
+            if self._successes >= self.concurrency_limit:
+                self._successes = 0
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1)
+
+        self._notify()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "concurrency_limit": self.concurrency_limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "requests_per_minute": self.requests.per_minute,
+            "tokens_per_minute": self.tokens.per_minute
+        }
+
+class LimiterPermit:
+    """One admitted call; report its outcome exactly once with release()"""
+
+    def __init__(self, limiter: ProviderLimiter, reserved_tokens: int):
+        self.limiter = limiter
+        self.reserved_tokens = reserved_tokens
+        self._released = False
+
+    def release(self, succeeded: bool = True, rate_limited: bool = False,
+                retry_after: Optional[float] = None, used_tokens: Optional[int] = None):
+        if self._released:
+            return
+        self._released = True
+        self.limiter._release(succeeded, rate_limited, retry_after, self.reserved_tokens, used_tokens)
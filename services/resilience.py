@@ -0,0 +1,89 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter for retry number attempt (0-based)
+
+    Spreading retries uniformly over [0, base * 2^attempt] keeps clients that
+    failed together from retrying in lockstep.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class LatencyTracker:
+    """Recent call latencies, for percentile-based hedging delays"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """The q-th percentile (0-100) of the window, or None without samples"""
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+class CircuitBreaker:
+    """Marks a provider degraded after consecutive transient failures
+
+    Open circuits reject calls (so callers fail over) until reset_seconds
+    have passed; then a single trial call is let through and its outcome
+    closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CIRCUIT_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        """Whether a call may go to this provider now"""
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return True
+            # A trial whose outcome never arrived (e.g. it was cancelled) is
+            # replaced by a new one after another reset period
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = CIRCUIT_HALF_OPEN
+                self._opened_at = time.monotonic()
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = CIRCUIT_CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == CIRCUIT_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != CIRCUIT_OPEN:
+                    self.stats["opened"] += 1
+                self.state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "state": self.state, "consecutive_failures": self._failures}
@@ -0,0 +1,321 @@
+"""
+In-process instrumentation: nested timing spans, counters and histograms
+
+    with telemetry.span("kb.lightrag_query", mode=query_mode):
+        response = await self.rag.aquery(...)
+    telemetry.increment("llm_tokens_total", tokens, provider="openai", direction="out")
+
+Spans nest through a context variable, so a span opened inside another (in
+the same task, a task it started, or a run_sync call it made) becomes its
+child. Every finished span feeds the span_duration_seconds histogram; recent
+root spans are kept with their children for the diagnostics panel. All
+metrics can be exported in the Prometheus text format.
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import Config
+from services.resilience import LatencyTracker
+
+METRIC_PREFIX = "ba_copilot_"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Children kept per span; the rest are only counted, so a large batch cannot grow a trace without bound
+MAX_SPAN_CHILDREN = 100
+
+# Help text for the exported metrics; unknown names are exported without it
+METRIC_HELP = {
+    "span_duration_seconds": "Duration of instrumented spans",
+    "operations_total": "Traced operations by name and outcome",
+    "llm_requests_total": "LLM provider requests by provider and outcome",
+    "llm_request_duration_seconds": "Duration of single LLM provider requests",
+    "llm_tokens_total": "LLM tokens by provider and direction (estimated at four characters per token)",
+    "llm_cache_requests_total": "LLM response cache lookups by result",
+    "llm_retries_total": "LLM request retries",
+    "llm_failovers_total": "LLM calls moved to the failover provider",
+    "llm_hedges_total": "Hedge requests sent for slow LLM calls",
+    "llm_hedge_wins_total": "Hedge requests that answered first",
+    "llm_deadline_exceeded_total": "LLM calls that ran out of time",
+    "kb_queries_total": "Knowledge base queries by outcome",
+    "kb_query_cache_requests_total": "Knowledge base query cache lookups by result",
+    "kb_documents_total": "Documents submitted for ingestion by outcome",
+}
+
+def timestamp() -> str:
+    """Current local time in the format result dicts use"""
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+class Span:
+    """One timed operation; children are spans opened while it was current"""
+
+    __slots__ = ("name", "attributes", "parent", "children", "dropped_children",
+                 "started_at", "_started", "duration", "error")
+
+    def __init__(self, name: str, attributes: Dict[str, Any], parent: Optional["Span"]):
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.children: List["Span"] = []
+        self.dropped_children = 0
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        """Duration so far for an open span, final duration for a finished one"""
+        elapsed = self.duration if self.duration is not None else time.perf_counter() - self._started
+        return round(elapsed * 1000, 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "duration_ms": self.duration_ms,
+            "attributes": dict(self.attributes),
+            "error": self.error,
+            "children": [child.to_dict() for child in list(self.children)],
+            "dropped_children": self.dropped_children
+        }
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("telemetry_span", default=None)
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+class Telemetry:
+    """Process-wide metrics registry and span recorder"""
+
+    def __init__(self, enabled: bool = True, recent_traces: int = 50):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+        self._span_latency: Dict[str, LatencyTracker] = {}
+        self._recent = deque(maxlen=recent_traces)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        if not self.enabled or not value:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Time a block as a child of the current span
+
+        The span is always timed, so callers can report its duration even
+        when telemetry is disabled; it is only recorded when enabled.
+        """
+        span = Span(name, attributes, _current_span.get())
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - span._started
+            self._record(span)
+
+    def _record(self, span: Span):
+        if not self.enabled:
+            return
+        self.observe("span_duration_seconds", span.duration, span=span.name)
+        with self._lock:
+            tracker = self._span_latency.get(span.name)
+            if tracker is None:
+                tracker = self._span_latency[span.name] = LatencyTracker()
+            parent = span.parent
+            if parent is None:
+                self._recent.append(span)
+            elif len(parent.children) < MAX_SPAN_CHILDREN:
+                parent.children.append(span)
+            else:
+                parent.dropped_children += 1
+        tracker.record(span.duration)
+
+    def get_span_summary(self) -> List[Dict[str, Any]]:
+        """Per span name: total count and recent p50/p95 in milliseconds"""
+        with self._lock:
+            counts = {
+                dict(labels).get("span"): histogram.count
+                for (name, labels), histogram in self._histograms.items()
+                if name == "span_duration_seconds"
+            }
+            trackers = dict(self._span_latency)
+        return [
+            {
+                "span": name,
+                "count": counts.get(name, 0),
+                "p50_ms": round(tracker.percentile(50) * 1000, 1),
+                "p95_ms": round(tracker.percentile(95) * 1000, 1)
+            }
+            for name, tracker in sorted(trackers.items())
+            if len(tracker)
+        ]
+
+    def get_counters(self) -> Dict[str, Dict[str, float]]:
+        """Counter values by name, then by label set rendered as k=v,..."""
+        with self._lock:
+            items = list(self._counters.items())
+        counters: Dict[str, Dict[str, float]] = {}
+        for (name, labels), value in sorted(items):
+            counters.setdefault(name, {})[",".join(f"{k}={v}" for k, v in labels)] = value
+        return counters
+
+    def counter_total(self, name: str, **labels) -> float:
+        """Sum of a counter over every label set matching the given labels"""
+        wanted = {key: str(value) for key, value in labels.items()}
+        with self._lock:
+            return sum(
+                value for (counter, key), value in self._counters.items()
+                if counter == name and all(dict(key).get(k) == v for k, v in wanted.items())
+            )
+
+    def get_recent_traces(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Most recent finished root spans with their children, newest first"""
+        with self._lock:
+            recent = list(self._recent)[-limit:]
+        return [span.to_dict() for span in reversed(recent)]
+
+    def render_prometheus(self) -> str:
+        """All counters and histograms in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.counts), h.sum, h.count, h.buckets)) for key, h in self._histograms.items()
+            )
+
+        lines = []
+        described = set()
+
+        def describe(name: str, kind: str):
+            if name in described:
+                return
+            described.add(name)
+            if name in METRIC_HELP:
+                lines.append(f"# HELP {METRIC_PREFIX}{name} {METRIC_HELP[name]}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {value:g}")
+
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            describe(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(labels, (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._span_latency.clear()
+            self._recent.clear()
+
+# Create global telemetry instance
+telemetry = Telemetry(enabled=Config.TELEMETRY_ENABLED, recent_traces=Config.TELEMETRY_RECENT_TRACES)
+
+def _outcome(result: Any) -> str:
+    if isinstance(result, dict) and "success" in result and not result["success"]:
+        return "rate_limited" if result.get("rate_limited") else "failure"
+    return "success"
+
+def _stamp(result: Any, span: Span) -> Any:
+    """Add the completion time and duration to a result dict"""
+    if isinstance(result, dict):
+        result["timestamp"] = timestamp()
+        result["duration_ms"] = span.duration_ms
+    return result
+
+def traced(name: str, stamp: bool = True) -> Callable:
+    """Run a function (sync or async) in a span and count its outcome
+
+    With stamp, dict results get "timestamp" and "duration_ms" fields.
+    """
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    with telemetry.span(name) as span:
+                        result = await func(*args, **kwargs)
+                except Exception:
+                    telemetry.increment("operations_total", operation=name, outcome="error")
+                    raise
+                telemetry.increment("operations_total", operation=name, outcome=_outcome(result))
+                return _stamp(result, span) if stamp else result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                with telemetry.span(name) as span:
+                    result = func(*args, **kwargs)
+            except Exception:
+                telemetry.increment("operations_total", operation=name, outcome="error")
+                raise
+            telemetry.increment("operations_total", operation=name, outcome=_outcome(result))
+            return _stamp(result, span) if stamp else result
+        return wrapper
+    return decorator
@@ -0,0 +1,301 @@
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from config import Config
+
+SUPPORTED_FILE_TYPES = ['txt', 'pdf', 'docx', 'doc']
+
+# WordprocessingML tags that carry text or layout
+_W_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_W_TEXT = _W_NAMESPACE + "t"
+_W_TAB = _W_NAMESPACE + "tab"
+_W_BREAKS = (_W_NAMESPACE + "br", _W_NAMESPACE + "cr")
+_W_PARAGRAPH = _W_NAMESPACE + "p"
+
+def get_file_type(filename: str) -> str:
+    """Lower-case file extension used to pick an extractor"""
+    return filename.split('.')[-1].lower() if '.' in filename else 'unknown'
+
+class TextWriter:
+    """Collects text parts and joins them once, stopping at a character budget"""
+
+    def __init__(self, max_chars: Optional[int] = None):
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.length = 0
+        self.truncated = False
+
+    def write(self, text: str) -> bool:
+        """Append a part; returns False once the budget is exhausted"""
+        if self.truncated:
+            return False
+        if self.max_chars is not None and self.length + len(text) > self.max_chars:
+            text = text[:self.max_chars - self.length]
+            self.truncated = True
+        self.parts.append(text)
+        self.length += len(text)
+        return not self.truncated
+
+    def getvalue(self, separator: str = "\n") -> str:
+        return separator.join(self.parts)
+
+def iter_docx_paragraphs(source) -> Iterator[str]:
+    """Stream paragraph text out of a .docx without loading the whole XML tree"""
+    with zipfile.ZipFile(source) as archive:
+        with archive.open("word/document.xml") as document_xml:
+            parts = []
+            for _, element in ElementTree.iterparse(document_xml, events=("end",)):
+                if element.tag == _W_TEXT:
+                    parts.append(element.text or "")
+                elif element.tag == _W_TAB:
+                    parts.append("\t")
+                elif element.tag in _W_BREAKS:
+                    parts.append("\n")
+                elif element.tag == _W_PARAGRAPH:
+                    yield "".join(parts)
+                    parts = []
+                    element.clear()
+
+def _pdf_page_count(path: str) -> int:
+    import pypdf
+    return len(pypdf.PdfReader(path).pages)
+
+def _extract_pdf_pages(path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) inside a worker process"""
+    import pypdf
+    reader = pypdf.PdfReader(path)
+    return [reader.pages[index].extract_text() or "" for index in range(start, stop)]
+
+def extract_text(filename: str, data: bytes, max_chars: Optional[int] = None) -> Tuple[Optional[str], Optional[str]]:
+    """Extract text content from raw file bytes
+
+    Returns (text, None) on success and (None, error message) on failure. Kept
+    free of Streamlit and picklable so it can run in a worker process.
+    """
+    file_extension = get_file_type(filename)
+
+    try:
+        if file_extension == 'txt':
+            # Text file
+            for encoding in ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1']:
+                try:
+                    text_content = data.decode(encoding)
+                    return text_content[:max_chars] if max_chars is not None else text_content, None
+                except UnicodeDecodeError:
+                    continue
+            return None, f"Could not decode text file {filename}"
+
+        elif file_extension == 'pdf':
+            # PDF file
+            try:
+                import pypdf
+            except ImportError:
+                return None, "PDF processing requires pypdf. Install with: `pip install pypdf`"
+
+            try:
+                writer = TextWriter(max_chars)
+                for page in pypdf.PdfReader(BytesIO(data)).pages:
+                    if not writer.write(page.extract_text() or ""):
+                        break
+                text_content = writer.getvalue()
+
+                if text_content.strip():
+                    return text_content.strip(), None
+                return None, f"No text content found in PDF {filename}"
+            except Exception as e:
+                return None, f"Error processing PDF {filename}: {str(e)}"
+
+        elif file_extension == 'docx' and zipfile.is_zipfile(BytesIO(data)):
+            # Word document, streamed paragraph by paragraph
+            try:
+                writer = TextWriter(max_chars)
+                for paragraph in iter_docx_paragraphs(BytesIO(data)):
+                    if not writer.write(paragraph):
+                        break
+                text_content = writer.getvalue()
+
+                if text_content.strip():
+                    return text_content.strip(), None
+                return None, f"No text content found in Word document {filename}"
+            except Exception as e:
+                return None, f"Error processing Word document {filename}: {str(e)}"
+
+        elif file_extension in ['docx', 'doc']:
+            # Legacy Word document
+            try:
+                import docx2txt
+            except ImportError:
+                return None, "Word document processing requires docx2txt. Install with: `pip install docx2txt`"
+
+            try:
+                text_content = docx2txt.process(BytesIO(data))
+                if text_content and text_content.strip():
+                    return text_content.strip()[:max_chars], None
+                return None, f"No text content found in Word document {filename}"
+            except Exception as e:
+                return None, f"Error processing Word document {filename}: {str(e)}"
+
+        else:
+            return None, f"Unsupported file type: {file_extension}"
+
+    except Exception as e:
+        return None, f"Error extracting text from {filename}: {str(e)}"
+
+class ExtractionService:
+    """Off-thread text extraction with page-parallel PDFs and per-file budgets
+
+    Large PDFs are split into page ranges that worker processes extract in
+    parallel; pages are yielded back in order as each range finishes. Every
+    file is bounded by a size limit, a character limit and a time limit; a
+    file that runs out of time takes its stuck workers down with it.
+    """
+
+    def __init__(self, workers: int = None, pages_per_shard: int = None, max_file_bytes: int = None,
+                 max_chars: int = None, timeout_seconds: float = None):
+        self.workers = workers or Config.INGEST_EXTRACTION_WORKERS
+        self.pages_per_shard = pages_per_shard or Config.EXTRACTION_PDF_PAGES_PER_SHARD
+        self.max_file_bytes = max_file_bytes or Config.EXTRACTION_MAX_FILE_MB * 1024 * 1024
+        self.max_chars = max_chars or Config.EXTRACTION_MAX_CHARS
+        self.timeout_seconds = timeout_seconds or Config.EXTRACTION_TIMEOUT_SECONDS
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Worker pool for CPU-bound text extraction"""
+        if self._pool is None:
+            # Forking a process that already runs the event loop and HTTP client
+            # threads can deadlock the child; spawned workers start clean
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def _kill_pool(self, pool: ProcessPoolExecutor):
+        """Terminate a pool whose workers are stuck; the next call starts a fresh one
+
+        Cancelling the awaiting future leaves the worker running, holding its
+        slot until the file is done, so a few pathological files would starve
+        the pool. Other files in flight on it fail with BrokenProcessPool and
+        are retried once by extract().
+        """
+        if self._pool is pool:
+            self._pool = None
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def _pool_lost(self, pool: ProcessPoolExecutor, error: Exception) -> bool:
+        """Whether an error came from the pool dying rather than from the file"""
+        return isinstance(error, BrokenProcessPool) or self._pool is not pool
+
+    async def iter_pdf_pages(self, path: str, pool: ProcessPoolExecutor = None) -> AsyncIterator[str]:
+        """Yield page text in order while later page ranges are still being extracted"""
+        loop = asyncio.get_running_loop()
+        pool = pool or self._get_pool()
+
+        page_count = await loop.run_in_executor(pool, _pdf_page_count, path)
+        shards = [
+            loop.run_in_executor(pool, _extract_pdf_pages, path, start, min(start + self.pages_per_shard, page_count))
+            for start in range(0, page_count, self.pages_per_shard)
+        ]
+        try:
+            for shard in shards:
+                for page_text in await shard:
+                    yield page_text
+        finally:
+            # Drop ranges that haven't started if the consumer stops early
+            for shard in shards:
+                shard.cancel()
+
+    async def _extract_pdf(self, filename: str, data: bytes,
+                           pool: ProcessPoolExecutor) -> Tuple[Optional[str], Optional[str]]:
+        if importlib.util.find_spec("pypdf") is None:
+            return None, "PDF processing requires pypdf. Install with: `pip install pypdf`"
+
+        # Workers open the PDF from disk rather than each receiving a pickled copy
+        fd, path = tempfile.mkstemp(suffix=".pdf")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+
+            writer = TextWriter(self.max_chars)
+            pages = self.iter_pdf_pages(path, pool)
+            try:
+                async for page_text in pages:
+                    if not writer.write(page_text):
+                        break
+            finally:
+                await pages.aclose()
+
+            if writer.truncated:
+                logging.warning(f"Text of {filename} truncated at {self.max_chars} characters")
+
+            text_content = writer.getvalue()
+            if text_content.strip():
+                return text_content.strip(), None
+            return None, f"No text content found in PDF {filename}"
+        except Exception as e:
+            if self._pool_lost(pool, e):
+                raise
+            return None, f"Error processing PDF {filename}: {str(e)}"
+        finally:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    async def _extract(self, filename: str, data: bytes,
+                       pool: ProcessPoolExecutor) -> Tuple[Optional[str], Optional[str]]:
+        if get_file_type(filename) == 'pdf':
+            return await self._extract_pdf(filename, data, pool)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, extract_text, filename, data, self.max_chars)
+
+    async def extract(self, filename: str, data: bytes) -> Tuple[Optional[str], Optional[str]]:
+        """Extract text from one file within its size and time budgets
+
+        Returns (text, None) on success and (None, error message) on failure.
+        """
+        if len(data) > self.max_file_bytes:
+            return None, (
+                f"{filename} is {len(data) / (1024 * 1024):.1f} MB, larger than the "
+                f"{self.max_file_bytes // (1024 * 1024)} MB extraction limit"
+            )
+
+        if get_file_type(filename) == 'txt':
+            # Decoding is cheaper than pickling the bytes over to a worker
+            return extract_text(filename, data, self.max_chars)
+
+        # A pool killed for another file's timeout is replaced, and this file retried once
+        for attempt in range(2):
+            pool = self._get_pool()
+            try:
+                return await asyncio.wait_for(self._extract(filename, data, pool), self.timeout_seconds)
+            except asyncio.TimeoutError:
+                self._kill_pool(pool)
+                return None, f"Extracting text from {filename} took longer than {self.timeout_seconds}s"
+            except Exception as e:
+                if attempt or not self._pool_lost(pool, e):
+                    raise
+                if self._pool is pool:
+                    self._pool = None
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+# Create global extraction service instance
+extraction_service = ExtractionService()
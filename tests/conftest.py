@@ -0,0 +1,5 @@
+import os
+
+# Importing the services builds their module-level singletons; keep the
+# shared LLM response cache off so the suite writes nothing into the tree
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
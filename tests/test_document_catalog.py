@@ -0,0 +1,105 @@
+import pytest
+
+from services.document_catalog import DocumentCatalog
+
+def document(content_hash: str, **overrides):
+    doc = {
+        "filename": f"{content_hash}.md",
+        "content_hash": content_hash,
+        "upload_time": "2024-01-01T00:00:00",
+        "file_size": 10,
+        "file_type": ".md",
+        "content_preview": "preview",
+        "stored_path": ""
+    }
+    doc.update(overrides)
+    return doc
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = DocumentCatalog(str(tmp_path / "documents.sqlite3"))
+    yield catalog
+    catalog.close()
+
+def test_add_many_skips_known_hashes(catalog):
+    assert catalog.add_many([document("a"), document("b")]) == 2
+    assert catalog.add_many([document("a"), document("c")]) == 1
+    assert catalog.count() == 3
+    assert catalog.version == 2
+
+    assert not catalog.add(document("a"))
+    assert catalog.version == 2
+
+def test_failed_add_many_rolls_back_every_row(catalog):
+    catalog.add(document("a"))
+
+    # The bad row comes last, after good rows of the same batch were inserted
+    with pytest.raises(Exception):
+        catalog.add_many([document("b"), document("c"), document("d", file_size={"not": "bindable"})])
+
+    assert catalog.count() == 1
+    assert not catalog.contains("b") and not catalog.contains("c")
+    assert catalog.version == 1
+    # The connection is usable again after the rollback
+    assert catalog.add(document("b"))
+
+def test_remove_drops_document_and_signature(catalog):
+    catalog.add(document("a"))
+    catalog.put_signatures({"a": b"sig"})
+
+    assert catalog.remove("a")
+    assert not catalog.remove("a")
+    assert catalog.get_signatures() == {}
+    assert catalog.version == 2
+
+def test_versions_persist_across_reopen(tmp_path):
+    path = str(tmp_path / "documents.sqlite3")
+    catalog = DocumentCatalog(path)
+    catalog.add(document("a"))
+    catalog.bump_index_version()
+    catalog.close()
+
+    reopened = DocumentCatalog(path)
+    assert (reopened.version, reopened.index_version) == (1, 1)
+    reopened.close()
+
+def test_index_version_changes_only_with_index_items(catalog):
+    catalog.track_index_items({"a": [("chunk", "c1")]})
+    assert catalog.index_version == 1
+
+    assert catalog.set_index_items_deleted("missing") == 0
+    assert catalog.index_version == 1
+
+    assert catalog.set_index_items_deleted("a") == 1
+    assert catalog.index_version == 2
+
+def test_shared_items_die_with_their_last_owner(catalog):
+    catalog.track_index_items({
+        "a": [("entity", "shared"), ("chunk", "a1")],
+        "b": [("entity", "shared"), ("chunk", "b1")]
+    })
+
+    catalog.set_index_items_deleted("a")
+    assert catalog.get_dead_index_items() == {"chunk": {"a1"}}
+    assert catalog.get_index_items("entity") == [("b", "shared")]
+
+    catalog.set_index_items_deleted("b")
+    assert catalog.get_dead_index_items() == {"chunk": {"a1", "b1"}, "entity": {"shared"}}
+
+    catalog.purge_index_items(["a", "b"])
+    assert catalog.get_tracked_owners() == set()
+
+def test_ingest_records_bump_the_index_version_only_when_they_change(catalog):
+    catalog.record_ingested({"a": "document:a.md", "seed": "seed:security"})
+    assert catalog.is_ingested("a") and not catalog.is_ingested("b")
+    assert catalog.get_ingested_hashes() == {"a", "seed"}
+    assert catalog.index_version == 1
+
+    assert catalog.remove_ingested(["b"]) == 0
+    assert catalog.index_version == 1
+    assert catalog.remove_ingested(["a", "b"]) == 1
+    assert catalog.index_version == 2
+
+    catalog.clear_ingested()
+    assert catalog.get_ingested_hashes() == set()
+    assert catalog.index_version == 3
@@ -0,0 +1,95 @@
+import random
+
+import numpy as np
+import pytest
+
+from services.document_similarity import MinHasher, SimilarityIndex
+
+WORDS = [f"word{i}" for i in range(2000)]
+
+def random_text(rng: random.Random, length: int = 400) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+def edited(rng: random.Random, text: str, fraction: float) -> str:
+    """Replace a fraction of the words of text"""
+    words = text.split()
+    for index in rng.sample(range(len(words)), int(len(words) * fraction)):
+        words[index] = rng.choice(WORDS)
+    return " ".join(words)
+
+def shingle_jaccard(a: str, b: str, size: int = 3) -> float:
+    def shingles(text):
+        tokens = text.split()
+        return {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+    sa, sb = shingles(a), shingles(b)
+    return len(sa & sb) / len(sa | sb)
+
+def test_signatures_are_deterministic():
+    hasher = MinHasher(num_perm=64)
+    assert np.array_equal(hasher.signature("the quick brown fox"), MinHasher(num_perm=64).signature("the quick brown fox"))
+    assert hasher.signature("the quick brown fox").shape == (64,)
+
+def test_signature_agreement_estimates_jaccard():
+    rng = random.Random(7)
+    hasher = MinHasher(num_perm=256)
+    original = random_text(rng)
+    for fraction in (0.05, 0.2, 0.5):
+        other = edited(rng, original, fraction)
+        estimate = float((hasher.signature(original) == hasher.signature(other)).mean())
+        assert estimate == pytest.approx(shingle_jaccard(original, other), abs=0.1)
+
+def test_huge_documents_are_signed_in_blocks():
+    rng = random.Random(3)
+    text = random_text(rng, 30_000)
+    hasher = MinHasher(num_perm=32)
+    assert np.array_equal(hasher.signature(text), hasher.signature(text))
+
+def test_bands_must_divide_permutations():
+    with pytest.raises(ValueError):
+        SimilarityIndex(num_perm=128, bands=30)
+
+def test_threshold_follows_banding():
+    assert SimilarityIndex(num_perm=128, bands=32).threshold == pytest.approx(0.42, abs=0.01)
+    assert SimilarityIndex(num_perm=128, bands=64).threshold == pytest.approx(0.125, abs=0.01)
+
+def test_neighbours_find_near_duplicates_and_skip_unrelated():
+    rng = random.Random(11)
+    hasher = MinHasher(num_perm=128)
+    index = SimilarityIndex(num_perm=128, bands=32)
+    base = random_text(rng)
+    index.add("base", hasher.signature(base))
+    index.add("copy", hasher.signature(edited(rng, base, 0.02)))
+    for i in range(20):
+        index.add(f"other{i}", hasher.signature(random_text(rng)))
+
+    neighbours = index.neighbours("base", top_k=3, min_similarity=0.4)
+    assert [doc_id for doc_id, _ in neighbours] == ["copy"]
+    assert neighbours[0][1] > 0.8
+
+def test_unrelated_documents_rarely_become_candidates():
+    rng = random.Random(5)
+    hasher = MinHasher(num_perm=128)
+    index = SimilarityIndex(num_perm=128, bands=32)
+    for i in range(60):
+        index.add(f"doc{i}", hasher.signature(random_text(rng)))
+    assert index.top_k_edges(top_k=5, min_similarity=0.0) == []
+
+def test_removed_documents_leave_their_buckets():
+    hasher = MinHasher(num_perm=64)
+    index = SimilarityIndex(num_perm=64, bands=16)
+    signature = hasher.signature("alpha beta gamma delta epsilon")
+    index.add("a", signature)
+    index.add("b", signature)
+    index.remove("b")
+
+    assert "b" not in index and len(index) == 1
+    assert index.neighbours("a") == []
+    assert all(not bucket or bucket == {"a"} for buckets in index._buckets for bucket in buckets.values())
+
+def test_top_k_edges_are_undirected():
+    hasher = MinHasher(num_perm=64)
+    index = SimilarityIndex(num_perm=64, bands=16)
+    text = "requirements for the order management system with audit logging"
+    index.add("a", hasher.signature(text))
+    index.add("b", hasher.signature(text))
+    assert index.top_k_edges() == [("a", "b", 1.0)]
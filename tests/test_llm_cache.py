@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from services import llm_cache
+from services.llm_cache import LLMResponseCache
+from services.llm_service import LLMService
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+def make_cache(tmp_path, **kwargs) -> LLMResponseCache:
+    return LLMResponseCache(str(tmp_path / "cache.sqlite3"), **kwargs)
+
+def test_key_covers_every_input():
+    base = dict(provider="openai", model_name="gpt", system_prompt="s", prompt="p", temperature=0.7)
+    key = LLMResponseCache.make_key(**base)
+    assert key == LLMResponseCache.make_key(**base)
+    for change in ({"prompt": "q"}, {"system_prompt": "t"}, {"model_name": "other"}, {"temperature": 0.2}):
+        assert LLMResponseCache.make_key(**{**base, **change}) != key
+
+def test_memory_hit_then_disk_hit_after_restart(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.set("k", "response")
+    assert cache.get("k") == "response"
+    assert cache.stats["memory_hits"] == 1
+
+    reopened = make_cache(tmp_path)
+    assert reopened.get("k") == "response"
+    assert reopened.stats["disk_hits"] == 1
+    # The disk hit was promoted into memory
+    assert reopened.get("k") == "response"
+    assert reopened.stats["memory_hits"] == 1
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    cache.set("k", "response")
+    clock.now += 59
+    assert cache.get("k") == "response"
+
+    clock.now += 2
+    assert cache.get("k") is None
+    assert cache.stats["expired"] >= 1
+    assert make_cache(tmp_path, ttl_seconds=60).get("k") is None
+
+def test_memory_tier_evicts_least_recently_used(tmp_path, clock):
+    cache = make_cache(tmp_path, memory_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert list(cache._memory) == ["a", "c"]
+    # Evicted from memory only; the disk tier still has it
+    assert cache.get("b") == "2"
+    assert cache.stats["disk_hits"] == 1
+
+def test_disk_tier_evicts_least_recently_accessed_over_size_budget(tmp_path, clock):
+    cache = make_cache(tmp_path, memory_entries=1, max_disk_bytes=250)
+    for key in ("a", "b", "c"):
+        cache.set(key, "x" * 100)
+        clock.now += 1
+
+    assert cache.stats["evictions"] >= 1
+    assert cache.get_stats()["disk_bytes"] <= 250
+    assert make_cache(tmp_path).get("a") is None
+    assert make_cache(tmp_path).get("c") == "x" * 100
+
+def test_empty_responses_are_not_cached(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    cache.set("k", "")
+    assert cache.get("k") is None
+    assert cache.stats["writes"] == 0
+
+def test_async_accessors_share_both_tiers(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    asyncio.run(cache.aset("k", "response"))
+    assert asyncio.run(cache.aget("k")) == "response"
+    assert cache.get("k") == "response"
+
+def test_only_greedy_calls_are_cached_unless_the_caller_opts_in(tmp_path):
+    service = LLMService()
+    service.response_cache = make_cache(tmp_path)
+    key = lambda temperature, use_cache: service._cache_key("openai", "p", "s", temperature, 100, use_cache)
+
+    assert key(0.0, None) is not None
+    assert key(0.7, None) is None
+    assert key(0.7, True) is not None
+    assert key(0.0, False) is None
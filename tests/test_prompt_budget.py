@@ -0,0 +1,109 @@
+from services.prompt_budget import (
+    ClarificationPromptBuilder,
+    ConversationSummary,
+    TokenCounter,
+    changed_headings,
+    merge_sections,
+    split_sections
+)
+
+DOCUMENT = """# Order Service
+
+Intro text.
+
+## Authentication
+
+Users log in with email and password.
+
+## Notifications
+
+Emails are sent on shipment.
+"""
+
+def long_document(sections: int = 40) -> str:
+    body = "\n\n".join(
+        f"## Section {i}\n\n" + " ".join(f"filler{i} text about component {i}" for _ in range(20))
+        for i in range(sections)
+    )
+    return "# Big Requirement\n\n" + body + "\n\n## Payment Refunds\n\nRefunds are issued to the original card.\n"
+
+def test_split_sections_keeps_text_verbatim():
+    sections = split_sections(DOCUMENT)
+    assert [section.heading for section in sections] == ["# Order Service", "## Authentication", "## Notifications"]
+    assert "".join(section.text for section in sections) == DOCUMENT
+
+def test_headings_inside_code_blocks_are_not_sections():
+    document = "## Setup\n\n```\n# not a heading\n```\n"
+    assert len(split_sections(document)) == 1
+
+def test_merge_replaces_matching_sections_and_appends_new_ones():
+    updates = "## 2. **Authentication**\n\nUsers log in with SSO.\n\n## Audit\n\nAll logins are recorded.\n"
+    merged = merge_sections(DOCUMENT, updates)
+
+    assert "Users log in with SSO." in merged
+    assert "email and password" not in merged
+    assert "Emails are sent on shipment." in merged
+    assert merged.rstrip().endswith("All logins are recorded.")
+    assert changed_headings(updates) == ["2. **Authentication**", "Audit"]
+
+def test_merge_adds_to_truncated_sections():
+    merged = merge_sections(DOCUMENT, "## Authentication\n\nTwo-factor is required.\n", append_to={"authentication"})
+    assert "email and password" in merged
+    assert merged.index("email and password") < merged.index("Two-factor is required.") < merged.index("## Notifications")
+
+def test_merge_keeps_replies_without_headings():
+    merged = merge_sections(DOCUMENT, "Refunds take five days.", question="How long do refunds take?")
+    assert "## Clarification: How long do refunds take?" in merged
+    assert merged.startswith(DOCUMENT.rstrip("\n"))
+    assert merge_sections(DOCUMENT, "   ") == DOCUMENT
+
+def test_conversation_summary_folds_oldest_turns():
+    counter = TokenCounter()
+    summary = ConversationSummary()
+    for i in range(10):
+        summary.add_turn(f"question number {i}", [f"Section {i}"])
+
+    rendered = summary.render(40, counter)
+    assert counter.count(rendered) <= 60
+    assert "question number 9" in rendered
+    assert "question number 0" not in rendered
+    assert "earlier clarifications not shown" in rendered
+
+    assert ConversationSummary.from_dict(summary.to_dict()).turns == summary.turns
+    assert ConversationSummary.from_dict(None).turns == []
+
+def test_small_documents_are_sent_whole():
+    builder = ClarificationPromptBuilder(input_budget=2000, summary_budget=200, kb_budget=200)
+    prompt = builder.build(DOCUMENT, "Add SSO", ["Use SAML"], ConversationSummary())
+    assert not prompt.partial
+    assert DOCUMENT in prompt.prompt
+    assert prompt.sections_sent == prompt.sections_total == 3
+
+def test_large_documents_send_relevant_sections_within_budget():
+    document = long_document()
+    conversation = ConversationSummary()
+    for i in range(30):
+        conversation.add_turn(f"earlier question {i} about component {i}", [f"Section {i}"])
+    builder = ClarificationPromptBuilder(input_budget=1500, summary_budget=150, kb_budget=150)
+
+    prompt = builder.build(
+        document, "How should payment refunds work?", [f"insight {i} " * 10 for i in range(20)],
+        conversation, system_prompt="You are a requirements analyst."
+    )
+
+    assert prompt.partial
+    assert prompt.tokens <= 1500
+    assert 0 < prompt.sections_sent < prompt.sections_total
+    assert "Refunds are issued to the original card." in prompt.prompt
+    assert not prompt.truncated
+
+def test_oversized_section_is_truncated_to_fit():
+    document = "## Overview\n\nShort.\n\n## Payment Refunds\n\n" + "refund rules and exceptions " * 600
+    builder = ClarificationPromptBuilder(input_budget=800, summary_budget=100, kb_budget=100)
+
+    prompt = builder.build(document, "Clarify payment refunds", [], None)
+
+    assert prompt.partial
+    assert prompt.tokens <= 800
+    assert prompt.truncated == {"payment refunds"}
+    assert "[truncated]" in prompt.prompt
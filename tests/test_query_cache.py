@@ -0,0 +1,42 @@
+from services.query_cache import KnowledgeQueryCache, normalize_query
+
+QUERY = "The system shall let customers track their orders and receive delivery notifications by email"
+
+def test_normalization_ignores_case_and_whitespace():
+    assert normalize_query("  Track   ORDERS\n now ") == "track orders now"
+
+def test_exact_hits_are_per_mode_and_version():
+    cache = KnowledgeQueryCache(near_duplicate_threshold=None)
+    cache.set(1, "hybrid", QUERY, "result")
+
+    assert cache.get(1, "hybrid", QUERY.upper()) == ("result", "exact")
+    assert cache.get(1, "local", QUERY) == (None, None)
+
+def test_version_change_drops_every_entry():
+    cache = KnowledgeQueryCache()
+    cache.set(1, "hybrid", QUERY, "result")
+    assert cache.get(2, "hybrid", QUERY) == (None, None)
+    assert cache.stats["invalidations"] == 1
+    assert cache.get(1, "hybrid", QUERY) == (None, None)
+
+def test_lightly_edited_query_is_a_near_hit():
+    cache = KnowledgeQueryCache(near_duplicate_threshold=0.7)
+    cache.set(1, "hybrid", QUERY, "result")
+    assert cache.get(1, "hybrid", QUERY + " promptly") == ("result", "near")
+    assert cache.get(1, "hybrid", "Admins can export audit reports as CSV files") == (None, None)
+
+def test_near_lookup_can_be_disabled():
+    cache = KnowledgeQueryCache(near_duplicate_threshold=1.0)
+    cache.set(1, "hybrid", QUERY, "result")
+    assert cache.get(1, "hybrid", QUERY + " promptly") == (None, None)
+
+def test_lru_eviction_also_forgets_near_duplicates():
+    cache = KnowledgeQueryCache(max_entries=2, near_duplicate_threshold=0.7)
+    cache.set(1, "hybrid", QUERY, "first")
+    cache.set(1, "hybrid", "Admins can export audit reports as CSV files", "second")
+    cache.get(1, "hybrid", "Admins can export audit reports as CSV files")
+    cache.set(1, "hybrid", "Passwords must be rotated every ninety days", "third")
+
+    assert cache.get(1, "hybrid", QUERY) == (None, None)
+    assert cache.get(1, "hybrid", QUERY + " promptly") == (None, None)
+    assert cache.get_stats()["entries"] == 2
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from services.rate_limit import (
+    PRIORITY_BACKGROUND, PRIORITY_BATCH, PRIORITY_INTERACTIVE, ProviderLimiter, RateLimitTimeout, TokenBucket
+)
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=60, burst=1)
+    assert bucket.wait_time(1) == 0
+    bucket.take(1)
+    assert 0.9 < bucket.wait_time(1) <= 1.0
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(per_minute=0)
+    bucket.take(10_000)
+    assert bucket.wait_time(10_000) == 0
+
+def test_waiters_are_admitted_by_priority_then_arrival():
+    async def scenario():
+        limiter = ProviderLimiter("test", initial_concurrency=1, min_concurrency=1, max_concurrency=1)
+        holder = await limiter.acquire(10)
+        order = []
+
+        async def call(name, priority):
+            permit = await limiter.acquire(10, priority=priority)
+            order.append(name)
+            permit.release()
+
+        tasks = []
+        for name, priority in (("background", PRIORITY_BACKGROUND), ("batch-1", PRIORITY_BATCH),
+                               ("interactive", PRIORITY_INTERACTIVE), ("batch-2", PRIORITY_BATCH)):
+            tasks.append(asyncio.ensure_future(call(name, priority)))
+            await asyncio.sleep(0)
+
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive", "batch-1", "batch-2", "background"]
+
+def test_concurrency_grows_additively_and_halves_on_rate_limit():
+    async def scenario():
+        limiter = ProviderLimiter("test", initial_concurrency=4, min_concurrency=1, max_concurrency=8)
+        for _ in range(4):
+            (await limiter.acquire(1)).release(succeeded=True)
+        grown = limiter.concurrency_limit
+
+        (await limiter.acquire(1)).release(succeeded=False, rate_limited=True, retry_after=0.01)
+        return grown, limiter.concurrency_limit, limiter.stats["rate_limited"]
+
+    assert asyncio.run(scenario()) == (5, 2, 1)
+
+def test_rate_limit_pauses_admissions_for_retry_after():
+    async def scenario():
+        limiter = ProviderLimiter("test", initial_concurrency=2)
+        (await limiter.acquire(1)).release(succeeded=False, rate_limited=True, retry_after=0.2)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        (await limiter.acquire(1)).release()
+        return loop.time() - started
+
+    assert asyncio.run(scenario()) >= 0.15
+
+def test_acquire_gives_up_after_max_wait():
+    async def scenario():
+        limiter = ProviderLimiter("test", initial_concurrency=1, min_concurrency=1, max_concurrency=1)
+        holder = await limiter.acquire(1)
+        with pytest.raises(RateLimitTimeout):
+            await limiter.acquire(1, max_wait=0.05)
+        # The timed-out waiter must not block the queue
+        holder.release()
+        (await limiter.acquire(1, max_wait=0.05)).release()
+        return limiter.stats["timeouts"], limiter.get_stats()["waiting"]
+
+    assert asyncio.run(scenario()) == (1, 0)
+
+def test_token_budget_holds_back_large_requests():
+    async def scenario():
+        limiter = ProviderLimiter("test", tokens_per_minute=600)
+        (await limiter.acquire(600)).release(used_tokens=600)
+        with pytest.raises(RateLimitTimeout):
+            await limiter.acquire(300, max_wait=0.05)
+
+    asyncio.run(scenario())
+
+def test_permit_release_is_idempotent():
+    async def scenario():
+        limiter = ProviderLimiter("test")
+        permit = await limiter.acquire(1)
+        permit.release()
+        permit.release()
+        return limiter.in_flight
+
+    assert asyncio.run(scenario()) == 0
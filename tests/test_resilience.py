@@ -0,0 +1,165 @@
+import asyncio
+
+import httpx
+import pytest
+
+from config import Config
+from services import resilience
+from services.llm_service import LLMService, LLMServiceError, RateLimitError
+from services.resilience import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, CircuitBreaker, backoff_delay
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_backoff_delay_is_capped_and_jittered():
+    delays = [backoff_delay(10, base=0.5, cap=4.0) for _ in range(200)]
+    assert all(0 <= delay <= 4.0 for delay in delays)
+    assert len(set(delays)) > 1
+
+def test_circuit_opens_after_threshold_and_half_opens_after_reset(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30)
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CIRCUIT_CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    assert not breaker.allow()
+    assert breaker.stats["rejected"] == 1
+
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    # Only the one trial call goes through
+    assert not breaker.allow()
+
+def test_failed_trial_reopens_and_success_closes(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    assert breaker.stats["opened"] == 2
+
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED
+    assert breaker.get_stats()["consecutive_failures"] == 0
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(Config, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(Config, "LLM_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(Config, "LLM_RETRY_MAX_DELAY", 0.001)
+    monkeypatch.setattr(Config, "LLM_CALL_DEADLINE_SECONDS", 5.0)
+    monkeypatch.setattr(Config, "LLM_HEDGE_ENABLED", False)
+    monkeypatch.setattr(Config, "LLM_FAILOVER_ENABLED", True)
+    service = LLMService()
+    # Any non-None client marks the provider as configured
+    service.openai_client = object()
+    service.anthropic_client = object()
+    return service
+
+def scripted(service, outcomes):
+    """Replace provider calls with per-provider scripts of results and exceptions"""
+    calls = []
+
+    async def provider_completion(provider, prompt, system_prompt, temperature, max_tokens, priority, hedge=False):
+        calls.append(provider)
+        outcome = outcomes[provider].pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    service._provider_completion = provider_completion
+    return calls
+
+def complete(service, model="openai"):
+    return asyncio.run(service._complete_resilient(model, "prompt", "system", 0.7, 100, None))
+
+def test_transient_errors_are_retried_on_the_same_provider(service):
+    calls = scripted(service, {"openai": [httpx.ConnectError("down"), httpx.ReadTimeout("slow"), "answer"]})
+    assert complete(service) == ("answer", "openai")
+    assert calls == ["openai"] * 3
+    assert service.resilience_stats["retries"] == 2
+    assert service.breakers["openai"].state == CIRCUIT_CLOSED
+
+def test_exhausted_retries_fail_over_to_the_peer(service):
+    calls = scripted(service, {
+        "openai": [httpx.ConnectError("down")] * 3,
+        "anthropic": ["peer answer"]
+    })
+    assert complete(service) == ("peer answer", "anthropic")
+    assert calls == ["openai"] * 3 + ["anthropic"]
+    assert service.resilience_stats["failovers"] == 1
+
+def test_local_rate_limit_fails_over_without_retrying(service):
+    calls = scripted(service, {
+        "openai": [RateLimitError("no capacity", "openai")],
+        "anthropic": ["peer answer"]
+    })
+    assert complete(service) == ("peer answer", "anthropic")
+    assert calls == ["openai", "anthropic"]
+
+def test_open_circuit_skips_straight_to_the_peer(service):
+    for _ in range(Config.LLM_CIRCUIT_FAILURE_THRESHOLD):
+        service.breakers["openai"].record_failure()
+    calls = scripted(service, {"openai": [], "anthropic": ["peer answer"]})
+    assert complete(service) == ("peer answer", "anthropic")
+    assert calls == ["anthropic"]
+
+def test_non_transient_errors_are_not_retried(service):
+    calls = scripted(service, {"openai": [ValueError("bad request")], "anthropic": ["unused"]})
+    with pytest.raises(ValueError):
+        complete(service)
+    assert calls == ["openai"]
+
+def test_last_error_surfaces_when_every_provider_fails(service, monkeypatch):
+    monkeypatch.setattr(Config, "LLM_FAILOVER_ENABLED", False)
+    scripted(service, {"openai": [httpx.ConnectError("down")] * 3})
+    with pytest.raises(httpx.ConnectError):
+        complete(service)
+
+def test_deadline_bounds_the_whole_call(service, monkeypatch):
+    monkeypatch.setattr(Config, "LLM_CALL_DEADLINE_SECONDS", 0.05)
+    monkeypatch.setattr(Config, "LLM_FAILOVER_ENABLED", False)
+
+    async def hang(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    service._provider_completion = hang
+    with pytest.raises(LLMServiceError, match="deadline"):
+        complete(service)
+    assert service.resilience_stats["deadline_exceeded"] == 1
+
+def test_stream_deadline_is_reported_as_a_deadline_not_an_open_circuit(service, monkeypatch):
+    monkeypatch.setattr(Config, "LLM_CALL_DEADLINE_SECONDS", 0.05)
+
+    async def slow_failure(*args, **kwargs):
+        await asyncio.sleep(0.1)
+        raise httpx.ReadTimeout("slow")
+        yield
+
+    service._openai_stream = slow_failure
+    service._anthropic_stream = slow_failure
+
+    async def consume():
+        return [chunk async for chunk in service._stream_resilient("openai", "prompt", "system", 0.7, 100, None, {})]
+
+    with pytest.raises(LLMServiceError, match="deadline"):
+        asyncio.run(consume())
+    assert service.resilience_stats["deadline_exceeded"] == 1
+    assert service.breakers["anthropic"].state == CIRCUIT_CLOSED
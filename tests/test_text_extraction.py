@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from services.text_extraction import ExtractionService, extract_text
+
+def sleep_then_echo(seconds: float, text: str):
+    time.sleep(seconds)
+    return text, None
+
+class SleepyExtraction(ExtractionService):
+    """Non-text files "extract" by sleeping in a worker for the seconds in their data"""
+
+    async def _extract(self, filename, data, pool):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, sleep_then_echo, float(data), filename)
+
+def test_text_files_are_decoded_without_the_pool():
+    service = ExtractionService(workers=1)
+    assert asyncio.run(service.extract("notes.txt", "café".encode("latin-1"))) == ("café", None)
+    assert service._pool is None
+
+def test_text_is_cut_at_the_character_budget():
+    assert extract_text("notes.txt", b"abcdef", max_chars=3) == ("abc", None)
+
+def test_timeout_kills_the_stuck_worker_and_the_pool_recovers():
+    service = SleepyExtraction(workers=1, timeout_seconds=3.0)
+
+    async def run():
+        # Warm the spawned worker so the timeout below only covers the stuck file
+        assert await service.extract("warm.bin", b"0") == ("warm.bin", None)
+        pool = service._pool
+        processes = list(pool._processes.values())
+        service.timeout_seconds = 0.5
+        text, error = await service.extract("stuck.bin", b"30")
+        assert text is None and "took longer than" in error
+        assert service._pool is None
+        for process in processes:
+            process.join(5)
+            assert not process.is_alive()
+        service.timeout_seconds = 10.0
+        return await service.extract("next.bin", b"0")
+
+    try:
+        assert asyncio.run(run()) == ("next.bin", None)
+    finally:
+        service.shutdown()
+
+def test_files_caught_in_a_killed_pool_are_retried():
+    service = SleepyExtraction(workers=2, timeout_seconds=10.0)
+
+    async def run():
+        await asyncio.gather(service.extract("a.bin", b"0"), service.extract("b.bin", b"0"))
+        service.timeout_seconds = 1.0
+        stuck = asyncio.create_task(service.extract("stuck.bin", b"30"))
+        await asyncio.sleep(0.5)
+        bystander = asyncio.create_task(service.extract("bystander.bin", b"0.8"))
+        return await stuck, await bystander
+
+    try:
+        (_, stuck_error), bystander = asyncio.run(run())
+    finally:
+        service.shutdown()
+    assert "took longer than" in stuck_error
+    assert bystander == ("bystander.bin", None)